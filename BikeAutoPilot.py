@@ -4,69 +4,143 @@
 
 import osmnx as ox
 import matplotlib.pyplot as plt
-from matplotlib.animation import FuncAnimation
 import numpy as np
 
+from RoadNetworkCache import RoadNetworkCache
+from OfflineRoadNetwork import build_offline_road_network
+from MapMatcher import map_matcher
+from RoutePlanner import route_planner
+from Maneuvers import LEFT, RIGHT
+from PathAnimation import path_animator
 #import SlippyMap
 
-def build_road_network(mapCenter: tuple, radius: int = 3200, colsolidated: bool = False):
+# Created on first use so importing this file does not touch the cache folder
+roadNetworkCache = None
+
+def build_road_network(mapCenter: tuple, radius: int = 3200, colsolidated: bool = False, networkType: str = "bike", useCache: bool = True, offline: bool = False):
+    """
+    Builds a road network using OpenStreetMap data, reusing a cached graph when one covers the area.
+
+    Args:
+        mapCenter (tuple): The center point of the map in (latitude, longitude) format
+        radius (int): The sqare radius of the map in meters
+        colsolidated (bool): Merge nearby intersection nodes, slow so the result is cached too
+        networkType (str): osmnx network type. Defaults to "bike".
+        useCache (bool): Use RoadNetworkCache instead of always downloading. Defaults to True.
+        offline (bool): Build the bike network from the Overpass files in cache/ without the network. Defaults to False.
+
+    Returns:
+        osmnx.graph.Graph: The road network graph.
+    """
+    global roadNetworkCache
+
+    if offline:
+        graph = build_offline_road_network(mapCenter, radius)
+        return consolidate_road_network(graph) if colsolidated else graph
+
+    if not useCache:
+        return download_road_network(mapCenter, radius, colsolidated, networkType)
+
+    if roadNetworkCache is None:
+        roadNetworkCache = RoadNetworkCache()
+
+    return roadNetworkCache.get_graph(mapCenter, radius, networkType, colsolidated,
+                                      lambda center, dist: download_road_network(center, dist, colsolidated, networkType))
+
+def download_road_network(mapCenter: tuple, radius: int, colsolidated: bool, networkType: str = "bike"):
     """
-    Builds a road network using OpenStreetMap data.
+    Downloads a road network with osmnx and optionally consolidates its intersections.
 
     Args:
         mapCenter (tuple): The center point of the map in (latitude, longitude) format
         radius (int): The sqare radius of the map in meters
+        colsolidated (bool): Merge nearby intersection nodes
+        networkType (str): osmnx network type. Defaults to "bike".
 
     Returns:
         osmnx.graph.Graph: The road network graph.
     """
-    graph = ox.graph_from_point(mapCenter, dist=radius, network_type="bike")
+    graph = ox.graph_from_point(mapCenter, dist=radius, network_type=networkType)
 
     if colsolidated:
-        G_proj = ox.projection.project_graph(graph)
-        colsolidatedGraph = ox.simplification.consolidate_intersections(
-            G_proj,
-            rebuild_graph=True,
-            tolerance=10,
-            dead_ends=False)
-        return colsolidatedGraph
+        return consolidate_road_network(graph)
     else:
         return graph
 
     #osmnx.bearing.add_edge_bearings(osmxGraph)
 
-def visualize_road_network(osmxGraph):
-    fig, ax = ox.plot_graph(osmxGraph)
+def consolidate_road_network(graph):
+    """
+    Merges intersection nodes closer than 10 meters.
 
-def animate_dot(osmxGraph, path_latlng):
-    # 1. Plot the graph (get fig, ax)
-    fig, ax = ox.plot_graph(osmxGraph, show=False, close=False)
+    Args:
+        graph (osmnx.graph.Graph): Unprojected road network graph
 
-    # 2. Extract lat/lon arrays for animation
-    lat = np.array([p[0] for p in path_latlng])
-    lon = np.array([p[1] for p in path_latlng])
+    Returns:
+        osmnx.graph.Graph: The projected graph with consolidated intersections.
+    """
+    G_proj = ox.projection.project_graph(graph)
+    colsolidatedGraph = ox.simplification.consolidate_intersections(
+        G_proj,
+        rebuild_graph=True,
+        tolerance=10,
+        dead_ends=False)
+    return colsolidatedGraph
+
+def nearest_node(osmxGraph, point: tuple):
+    """
+    Finds the graph node at the closer end of the road nearest to a GPS point.
 
-    # 3. Convert lat/lon to same coordinate system as OSMnx plot
-    #    (OSMnx plots projected graphs unless specified)
-    try:
-        gproj = ox.projection.project_graph(osmxGraph)
-        x, y = ox.projection.project_geometry(lon, lat)
-    except:
-        # If graph is not projected, fallback to lon/lat directly
-        x, y = lon, lat
+    Args:
+        osmxGraph (osmnx.graph.Graph): Unprojected road network graph
+        point (tuple): (latitude, longitude) of the point
 
-    # 4. Create the red dot
-    dot, = ax.plot([], [], 'ro', markersize=8)
+    Returns:
+        The graph node.
+    """
+    (u, v, key), offset, _ = map_matcher(osmxGraph).nearest_edge(*point)
+    return u if offset <= osmxGraph.edges[u, v, key].get("length", 0) / 2 else v
 
-    # 5. Animation update function
-    def update(frame):
-        dot.set_data([x[frame]], [y[frame]])
-        return dot,
+def plan_route(osmxGraph, origin: tuple, destination: tuple):
+    """
+    Plans the shortest bike route between two GPS points with RoutePlanner.
 
-    # 6. Run animation
-    ani = FuncAnimation(fig, update, frames=len(x), interval=150, blit=True)
+    Args:
+        osmxGraph (osmnx.graph.Graph): Unprojected road network graph
+        origin (tuple): (latitude, longitude) to start from
+        destination (tuple): (latitude, longitude) to ride to
+
+    Returns:
+        tuple: (list of graph nodes, length in meters)
+    """
+    return route_planner(osmxGraph).route(nearest_node(osmxGraph, origin), nearest_node(osmxGraph, destination))
+
+def visualize_road_network(osmxGraph):
+    fig, ax = ox.plot_graph(osmxGraph)
+
+def animate_dot(osmxGraph, path_latlng, interval: float = 0.15):
+    """
+    Animates a red dot moving over the road network.
+
+    Args:
+        osmxGraph (osmnx.graph.Graph): The road network graph, the drawn map is cached per graph
+        path_latlng (list or iterator): (lat, lon) points, a generator streams live positions
+        interval (float): Seconds between frames
+
+    Returns:
+        int: Number of frames drawn.
+    """
+    animator = path_animator(osmxGraph)
+    plt.show(block=False)
+
+    # A list is decimated to the screen resolution up front, an iterator is drawn as positions arrive
+    if isinstance(path_latlng, (list, tuple, np.ndarray)):
+        frames = animator.play(path_latlng, interval)
+    else:
+        frames = animator.stream(path_latlng, interval)
 
     plt.show()
+    return frames
 
 def main():
     mapCenter = (36.144635, -115.326555)
@@ -91,6 +165,24 @@ def turn_right(degree: int) -> bool:
 
     return True
 
+def follow_maneuver(maneuver: tuple) -> bool:
+    """
+    Steers for the next maneuver from Maneuvers.ManeuverTracker.advance().
+
+    Args:
+        maneuver (tuple): (direction, degree, meters to the maneuver)
+
+    Returns:
+        bool: True if the turn was made, False for riding straight on or arriving.
+    """
+    direction, degree, _ = maneuver
+    if direction == LEFT:
+        return turn_left(degree)
+    elif direction == RIGHT:
+        return turn_right(degree)
+
+    return False
+
 def unit_test():
     assert True
     fakeData = Faker()
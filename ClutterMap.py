@@ -0,0 +1,116 @@
+#!/usr/bin/env python
+
+# Clutter-map background subtraction for Radar.py time slices
+# https://en.wikipedia.org/wiki/Clutter_(radar)
+# https://en.wikipedia.org/wiki/Exponential_smoothing
+#
+# Sensor artifacts and ground returns near the bike stay in the same (r, theta) bins from frame to
+# frame, while real objects move through the bike-relative bins as the bike rides. Every bin keeps an
+# exponentially decayed occupancy estimate, and an occupied bin whose estimate was already above the
+# threshold before this frame is clutter and is removed before find_stationary_points() and
+# group_points() see it. The estimate is only learned while the bike moves, otherwise every object
+# would become clutter while waiting at a traffic light.
+
+# 3rd party libraries
+import numpy as np                  # pip install numpy
+
+# Weight of the newest frame, about 1 / (frames remembered)
+DEFAULT_ALPHA = 0.05
+
+# A bin occupied in every frame passes 0.5 after 14 frames (7 seconds at 2 Hz), one occupied every other frame never does
+DEFAULT_THRESHOLD = 0.5
+
+
+class ClutterMap:
+
+    def __init__(self, maxRadius: int = 300, alpha: float = DEFAULT_ALPHA, threshold: float = DEFAULT_THRESHOLD):
+        """ Start with an empty clutter estimate for every (radius, theta) bin.
+
+        Args:
+            maxRadius (int, optional): Maximum range of the RADAR in meters, like Radar.maxRadius. Defaults to 300.
+            alpha (float, optional): Weight of the newest frame in the estimate. Defaults to 0.05.
+            threshold (float, optional): Estimate above which an occupied bin is clutter. Defaults to 0.5.
+        """
+        if not 0 < alpha <= 1:
+            raise ValueError(f"Alpha {alpha} must be in (0, 1]")
+
+        self.alpha = alpha
+        self.threshold = threshold
+        self.estimate = np.zeros((maxRadius, 360), dtype=np.float32)
+
+        # Reused every frame so apply() does not allocate
+        self.clutter = np.zeros((maxRadius, 360), dtype=bool)
+
+        self.stats = {"frames": 0, "occupiedPoints": 0, "suppressedPoints": 0, "suppressedFraction": 0.0}
+
+
+    def __str__(self):
+        return f"ClutterMap(alpha={self.alpha}, threshold={self.threshold}, clutterBins={int((self.estimate > self.threshold).sum())}, stats={self.stats})"
+
+
+    def apply(self, dataTimeSlice: np.ndarray, learn: bool = True) -> np.ndarray:
+        """ Remove clutter from a time slice and update the estimate with it
+
+        Args:
+            dataTimeSlice (np.ndarray): Boolean (maxRadius, 360) array like Radar.dataTimeSliceCurrent
+            learn (bool, optional): Update the estimate, False while the bike stands still. Defaults to True.
+
+        Returns:
+            np.ndarray: A new boolean array with the clutter bins set to False.
+        """
+        np.greater(self.estimate, self.threshold, out=self.clutter)
+        self.clutter &= dataTimeSlice
+        filtered = dataTimeSlice & ~self.clutter
+
+        if learn:
+            self.estimate *= 1 - self.alpha
+            self.estimate[dataTimeSlice] += self.alpha
+
+        occupied = int(np.count_nonzero(dataTimeSlice))
+        suppressed = int(np.count_nonzero(self.clutter))
+        self.stats["frames"] += 1
+        self.stats["occupiedPoints"] += occupied
+        self.stats["suppressedPoints"] += suppressed
+        self.stats["suppressedFraction"] = suppressed / occupied if occupied > 0 else 0.0
+
+        return filtered
+
+
+    def reset(self):
+        """ Forget the estimate, for example after the radar was remounted
+        """
+        self.estimate[:] = 0
+
+
+def unit_test():
+    clutterMap = ClutterMap(300)
+    rng = np.random.default_rng(1)
+
+    # An artifact at 2 meters straight ahead stays put, a car drives through the bins, random noise comes and goes
+    for frame in range(40):
+        dataTimeSlice = rng.random((300, 360)) < 0.001
+        dataTimeSlice[2, 268:273] = True
+        dataTimeSlice[200 - 4 * frame, 90] = True
+        filtered = clutterMap.apply(dataTimeSlice)
+
+        assert filtered[200 - 4 * frame, 90]
+        assert filtered[2, 270] == (frame < 14)
+    assert 0 < clutterMap.stats["suppressedFraction"] < 0.1
+    assert clutterMap.stats["suppressedPoints"] == 5 * (40 - 14)
+
+    # Standing still does not teach the map, so a waiting car is not suppressed
+    for frame in range(40):
+        dataTimeSlice = np.zeros((300, 360), dtype=bool)
+        dataTimeSlice[30, 0] = True
+        assert clutterMap.apply(dataTimeSlice, learn=False)[30, 0]
+    assert clutterMap.stats["suppressedFraction"] == 0.0
+
+    clutterMap.reset()
+    dataTimeSlice[2, 270] = True
+    assert clutterMap.apply(dataTimeSlice)[2, 270]
+    print(clutterMap)
+    print("All tests passed!")
+
+
+if __name__ == "__main__":
+    unit_test()
@@ -0,0 +1,261 @@
+#!/usr/bin/env python
+
+# Delta encoding of radar time slices for streaming to remote viewers
+# https://en.wikipedia.org/wiki/Run-length_encoding
+# https://en.wikipedia.org/wiki/Key_frame#Video_compression
+# https://nicegui.io/documentation/section_configuration_deployment#nicegui_on_air
+#
+# Sending a full Plotly figure per scan repeats every detection to every On Air viewer even when the
+# scene hardly changes. Here each frame is compared with the previous one and only the bins that turned
+# on and off are sent, as runs over the flat (radius * 360 + theta) bin index. A run is stored as the
+# gap from the end of the previous run and its length, so the small numbers stay short in the JSON the
+# NiceGUI websocket carries. Every KEYFRAME_INTERVAL frames, and whenever a viewer asks after missing a
+# message, a keyframe with all occupied bins is sent instead so viewers can resynchronize. A keyframe is
+# also sent when it is smaller than the changes, which is the case while riding past many objects. The encoder
+# counts the bytes it sends over a sliding window for the bandwidth metrics. RadarCanvas.py is the
+# NiceGUI element that renders the messages in the browser, FrameDeltaDecoder is the same logic in Python.
+
+# Standard library imports not needing pip installs
+from collections import deque
+import json
+import time
+
+# 3rd party libraries
+import numpy as np                  # pip install numpy
+
+# Frames between keyframes, 10 seconds at the 5 Hz cruising scan rate
+KEYFRAME_INTERVAL = 50
+
+# Seconds of sent messages the bytes per second are averaged over
+BANDWIDTH_WINDOW_SECONDS = 5.0
+
+
+def encode_runs(flatIndices: np.ndarray) -> list:
+    """ Run-length encode sorted flat bin indices
+
+    Args:
+        flatIndices (np.ndarray): Sorted, unique flat indices of the bins.
+
+    Returns:
+        list: [gap, length, gap, length, ...] where each gap counts the bins since the end of the previous run.
+    """
+    if len(flatIndices) == 0:
+        return []
+
+    breaks = np.flatnonzero(np.diff(flatIndices) != 1) + 1
+    starts = flatIndices[np.concatenate(([0], breaks))]
+    ends = flatIndices[np.concatenate((breaks - 1, [len(flatIndices) - 1]))] + 1
+    gaps = starts - np.concatenate(([0], ends[:-1]))
+    runs = np.empty(2 * len(starts), dtype=np.int64)
+    runs[0::2] = gaps
+    runs[1::2] = ends - starts
+
+    return runs.tolist()
+
+
+def decode_runs(runs: list) -> np.ndarray:
+    """ Flat bin indices of runs, the inverse of encode_runs()
+
+    Args:
+        runs (list): [gap, length, ...] as encode_runs() returns.
+
+    Returns:
+        np.ndarray: Sorted int64 flat indices.
+    """
+    if len(runs) == 0:
+        return np.zeros(0, dtype=np.int64)
+
+    runs = np.asarray(runs, dtype=np.int64)
+    gaps, lengths = runs[0::2], runs[1::2]
+    ends = np.cumsum(gaps + lengths)
+    starts = ends - lengths
+
+    # Every index counts up from its run's start
+    offsets = np.arange(lengths.sum()) - np.repeat(np.cumsum(lengths) - lengths, lengths)
+    return np.repeat(starts, lengths) + offsets
+
+
+class FrameDeltaEncoder:
+
+    def __init__(self, maxRadius: int, keyframeInterval: int = KEYFRAME_INTERVAL, clock=time.monotonic):
+        """ Initialize the encoder, the first frame encoded is a keyframe.
+
+        Args:
+            maxRadius (int): Number of radius bins of the time slices.
+            keyframeInterval (int, optional): Frames between keyframes. Defaults to 50.
+            clock (callable, optional): Seconds counter for the bandwidth window, replaceable for tests. Defaults to time.monotonic.
+        """
+        if keyframeInterval < 1:
+            raise ValueError(f"Keyframe interval must be at least 1, not {keyframeInterval}")
+
+        self.maxRadius = maxRadius
+        self.keyframeInterval = keyframeInterval
+        self.clock = clock
+
+        self.previous = None
+        self.sequence = -1
+        self.keyframeRequested = True
+
+        # (send time, bytes) of the messages in the bandwidth window
+        self.sent = deque()
+
+        self.stats = {"frames": 0, "keyframes": 0, "bytes": 0, "keyframeBytes": 0, "lastMessageBytes": 0, "sentBins": 0, "bytesPerSecond": 0.0}
+
+
+    def __str__(self):
+        return f"FrameDeltaEncoder(maxRadius={self.maxRadius}, keyframeInterval={self.keyframeInterval}, stats={self.stats})"
+
+
+    def request_keyframe(self):
+        """ Send the next frame as a keyframe, for a viewer that joined or missed a message
+        """
+        self.keyframeRequested = True
+
+
+    def encode(self, dataTimeSlice: np.ndarray) -> dict:
+        """ Message with the bins changed since the previous frame, or all occupied bins for a keyframe
+
+        Args:
+            dataTimeSlice (np.ndarray): Boolean (maxRadius, 360) time slice.
+
+        Returns:
+            dict: {"seq", "key", "added", "removed"} with added and removed as encode_runs() runs.
+        """
+        current = np.ascontiguousarray(dataTimeSlice, dtype=bool).ravel()
+        self.sequence += 1
+        keyframe = self.keyframeRequested or self.previous is None or self.sequence % self.keyframeInterval == 0
+
+        occupied = np.flatnonzero(current)
+        added, removed = occupied, np.zeros(0, dtype=np.int64)
+        if not keyframe:
+            changed = current ^ self.previous
+            changedAdded, changedRemoved = np.flatnonzero(changed & current), np.flatnonzero(changed & self.previous)
+
+            # While riding most detections move every frame, then all occupied bins are cheaper than the changes
+            if len(changedAdded) + len(changedRemoved) < len(occupied):
+                added, removed = changedAdded, changedRemoved
+            else:
+                keyframe = True
+        message = {"seq": self.sequence, "key": bool(keyframe), "added": encode_runs(added), "removed": encode_runs(removed)}
+
+        self.previous = current.copy()
+        self.keyframeRequested = False
+        self.count(message, len(added) + len(removed))
+
+        return message
+
+
+    def count(self, message: dict, sentBins: int):
+        """ Add a message to the bandwidth stats
+        """
+        messageBytes = len(json.dumps(message, separators=(",", ":")))
+        now = self.clock()
+        self.sent.append((now, messageBytes))
+        while self.sent[0][0] < now - BANDWIDTH_WINDOW_SECONDS:
+            self.sent.popleft()
+
+        self.stats["frames"] += 1
+        self.stats["bytes"] += messageBytes
+        self.stats["lastMessageBytes"] = messageBytes
+        self.stats["sentBins"] += sentBins
+        if message["key"]:
+            self.stats["keyframes"] += 1
+            self.stats["keyframeBytes"] += messageBytes
+        elapsed = now - self.sent[0][0]
+        self.stats["bytesPerSecond"] = round(sum(size for _, size in self.sent) / elapsed, 1) if elapsed > 0 else 0.0
+
+
+class FrameDeltaDecoder:
+
+    def __init__(self, maxRadius: int):
+        """ Initialize the decoder, it waits for a keyframe before producing frames.
+
+        Args:
+            maxRadius (int): Number of radius bins of the time slices.
+        """
+        self.maxRadius = maxRadius
+        self.frame = np.zeros(maxRadius * 360, dtype=bool)
+        self.sequence = None
+
+
+    def __str__(self):
+        return f"FrameDeltaDecoder(maxRadius={self.maxRadius}, sequence={self.sequence})"
+
+
+    def apply(self, message: dict) -> np.ndarray:
+        """ Apply a message from FrameDeltaEncoder.encode()
+
+        Args:
+            message (dict): The message.
+
+        Returns:
+            np.ndarray: Boolean (maxRadius, 360) time slice, None while out of sync and waiting for a keyframe.
+        """
+        if message["key"]:
+            self.frame[:] = False
+        elif self.sequence is None or message["seq"] != self.sequence + 1:
+            self.sequence = None
+            return None
+
+        self.frame[decode_runs(message["removed"])] = False
+        self.frame[decode_runs(message["added"])] = True
+        self.sequence = message["seq"]
+
+        return self.frame.reshape(self.maxRadius, 360).copy()
+
+
+def unit_test():
+    flatIndices = np.array([0, 1, 2, 7, 9, 10])
+    assert encode_runs(flatIndices) == [0, 3, 4, 1, 1, 2]
+    assert decode_runs(encode_runs(flatIndices)).tolist() == flatIndices.tolist() and encode_runs(np.array([], dtype=np.int64)) == []
+
+    # A ride from the simulator: deltas rebuild every frame exactly, a keyframe resynchronizes a late viewer
+    from RadarSimulator import RadarSimulator
+    simulator = RadarSimulator({"seed": 5, "maxRadius": 300, "frameRateInHz": 5, "noise": {"falseAlarmRate": 0.0002, "detectionProbability": 0.95},
+                                "random": {"poles": 80, "parkedCars": 20, "vehicles": 5, "lengthInMeters": 400}})
+    now = [0.0]
+    encoder = FrameDeltaEncoder(300, keyframeInterval=10, clock=lambda: now[0])
+    decoder = FrameDeltaDecoder(300)
+    lateViewer = FrameDeltaDecoder(300)
+    resynchronized = None
+    for index in range(25):
+        dataTimeSlice = simulator.frame(index)[0]
+        message = encoder.encode(dataTimeSlice)
+        assert (decoder.apply(message) == dataTimeSlice).all()
+        if index >= 4:
+            frame = lateViewer.apply(message)
+            assert frame is None or (frame == dataTimeSlice).all()
+            if frame is not None and resynchronized is None:
+                resynchronized = index
+        now[0] += 1 / simulator.frameRateInHz
+    assert resynchronized is not None and resynchronized <= 10
+
+    # A dropped message stops the decoder until the keyframe the viewer asks for
+    encoder.encode(simulator.frame(25)[0])
+    encoder.request_keyframe()
+    assert decoder.apply(encoder.encode(simulator.frame(26)[0])) is not None
+
+    # Bandwidth against shipping the detections as a Plotly figure every frame, like Radar.GUI()
+    import plotly.graph_objects as go
+    radius, theta = np.nonzero(dataTimeSlice)
+    figureBytes = len(go.Figure(go.Scatterpolar(r=radius.tolist(), theta=theta.tolist(), mode="markers")).to_json())
+    messageBytes = encoder.stats["bytes"] / encoder.stats["frames"]
+    print(f"Riding: Plotly figure {figureBytes} bytes per frame, stream {messageBytes:.0f} bytes per frame, {encoder.stats['bytesPerSecond']} bytes per second")
+    assert messageBytes < figureBytes / 4
+
+    # Stopped at a light with a car passing: only the car's bins are sent between keyframes
+    stopped = RadarSimulator({**simulator.scenario, "bike": {"speedInMetersPerSecond": 0.0}, "noise": {"falseAlarmRate": 0.0, "detectionProbability": 1.0},
+                              "objects": [{"type": "vehicle", "x": 3, "y": -60, "vx": 0, "vy": 10}]})
+    stoppedEncoder = FrameDeltaEncoder(300, clock=lambda: now[0])
+    for index in range(10):
+        message = stoppedEncoder.encode(stopped.frame(index)[0])
+        now[0] += 1 / simulator.frameRateInHz
+    fullBytes = len(json.dumps(encode_runs(np.flatnonzero(stopped.frame(9)[0]))))
+    print(f"Stopped: all occupied bins {fullBytes} bytes, delta {stoppedEncoder.stats['lastMessageBytes']} bytes, {stoppedEncoder.stats['bytesPerSecond']} bytes per second")
+    assert not message["key"] and stoppedEncoder.stats["lastMessageBytes"] < fullBytes / 4
+    print(encoder)
+    print("All tests passed!")
+
+
+if __name__ == "__main__":
+    unit_test()
@@ -0,0 +1,149 @@
+#!/usr/bin/env python
+
+# Great circle math on GPS points shared by the map, prefetch and routing code
+# https://www.movable-type.co.uk/scripts/latlong.html
+
+# Standard library imports not needing pip installs
+import math
+
+# 3rd party libraries
+import numpy as np                  # pip install numpy
+
+EARTH_RADIUS_IN_METERS = 6371008.8
+
+
+def haversine_distance(lat1: float, lon1: float, lat2: float, lon2: float) -> float:
+    """ Great circle distance between two points in meters
+
+    Args:
+        lat1 (float): Latitude of the first point in degrees
+        lon1 (float): Longitude of the first point in degrees
+        lat2 (float): Latitude of the second point in degrees
+        lon2 (float): Longitude of the second point in degrees
+
+    Returns:
+        float: The distance in meters.
+    """
+    phi1 = math.radians(lat1)
+    phi2 = math.radians(lat2)
+    a = math.sin((phi2 - phi1) / 2) ** 2 + math.cos(phi1) * math.cos(phi2) * math.sin(math.radians(lon2 - lon1) / 2) ** 2
+
+    return 2 * EARTH_RADIUS_IN_METERS * math.asin(math.sqrt(a))
+
+
+def haversine_distance_array(lat1, lon1, lat2, lon2) -> np.ndarray:
+    """ Vectorized haversine_distance() for arrays of point pairs
+
+    Args:
+        lat1 (array_like): Latitudes of the first points in degrees
+        lon1 (array_like): Longitudes of the first points in degrees
+        lat2 (array_like): Latitudes of the second points in degrees
+        lon2 (array_like): Longitudes of the second points in degrees
+
+    Returns:
+        np.ndarray: The distances in meters.
+    """
+    phi1 = np.radians(lat1)
+    phi2 = np.radians(lat2)
+    a = np.sin((phi2 - phi1) / 2) ** 2 + np.cos(phi1) * np.cos(phi2) * np.sin(np.radians(np.subtract(lon2, lon1)) / 2) ** 2
+
+    return 2 * EARTH_RADIUS_IN_METERS * np.arcsin(np.sqrt(a))
+
+
+def initial_bearing(lat1: float, lon1: float, lat2: float, lon2: float) -> float:
+    """ Direction to travel from the first point to the second one, in degrees clockwise from north
+
+    Args:
+        lat1 (float): Latitude of the first point in degrees
+        lon1 (float): Longitude of the first point in degrees
+        lat2 (float): Latitude of the second point in degrees
+        lon2 (float): Longitude of the second point in degrees
+
+    Returns:
+        float: The bearing between 0 and 360 degrees.
+    """
+    phi1 = math.radians(lat1)
+    phi2 = math.radians(lat2)
+    deltaLambda = math.radians(lon2 - lon1)
+    y = math.sin(deltaLambda) * math.cos(phi2)
+    x = math.cos(phi1) * math.sin(phi2) - math.sin(phi1) * math.cos(phi2) * math.cos(deltaLambda)
+
+    return math.degrees(math.atan2(y, x)) % 360
+
+
+def initial_bearing_array(lat1, lon1, lat2, lon2) -> np.ndarray:
+    """ Vectorized initial_bearing() for arrays of point pairs
+
+    Args:
+        lat1 (array_like): Latitudes of the first points in degrees
+        lon1 (array_like): Longitudes of the first points in degrees
+        lat2 (array_like): Latitudes of the second points in degrees
+        lon2 (array_like): Longitudes of the second points in degrees
+
+    Returns:
+        np.ndarray: Bearings between 0 and 360 degrees clockwise from north.
+    """
+    phi1 = np.radians(lat1)
+    phi2 = np.radians(lat2)
+    deltaLambda = np.radians(np.subtract(lon2, lon1))
+    y = np.sin(deltaLambda) * np.cos(phi2)
+    x = np.cos(phi1) * np.sin(phi2) - np.sin(phi1) * np.cos(phi2) * np.cos(deltaLambda)
+
+    return np.degrees(np.arctan2(y, x)) % 360
+
+
+def destination_point(lat: float, lon: float, bearingDegrees: float, distanceInMeters: float) -> tuple:
+    """ Point reached by travelling a distance along a great circle from a start point
+
+    Args:
+        lat (float): The start latitude in degrees
+        lon (float): The start longitude in degrees
+        bearingDegrees (float): Direction of travel, clockwise from north.
+        distanceInMeters (float): Distance to travel.
+
+    Returns:
+        tuple: The latitude and longitude of the destination.
+    """
+    delta = distanceInMeters / EARTH_RADIUS_IN_METERS
+    theta = math.radians(bearingDegrees)
+    phi1 = math.radians(lat)
+    phi2 = math.asin(math.sin(phi1) * math.cos(delta) + math.cos(phi1) * math.sin(delta) * math.cos(theta))
+    lambda2 = math.radians(lon) + math.atan2(math.sin(theta) * math.sin(delta) * math.cos(phi1), math.cos(delta) - math.sin(phi1) * math.sin(phi2))
+
+    return (math.degrees(phi2), (math.degrees(lambda2) + 540) % 360 - 180)
+
+
+def bbox_from_point(lat: float, lon: float, distanceInMeters: float) -> tuple:
+    """ Box reaching a distance north, south, east and west of a point, like osmnx.utils_geo.bbox_from_point()
+
+    Args:
+        lat (float): The latitude in degrees
+        lon (float): The longitude in degrees
+        distanceInMeters (float): Distance from the point to each side of the box.
+
+    Returns:
+        tuple: (north, south, east, west) in degrees.
+    """
+    deltaLat = math.degrees(distanceInMeters / EARTH_RADIUS_IN_METERS)
+    deltaLon = deltaLat / math.cos(math.radians(lat))
+
+    return (lat + deltaLat, lat - deltaLat, lon + deltaLon, lon - deltaLon)
+
+
+def unit_test():
+    lat, lon = destination_point(36.159334, -115.152807, 90, 1000)
+    assert abs(haversine_distance(36.159334, -115.152807, lat, lon) - 1000) < 0.01
+    assert abs(initial_bearing(36.159334, -115.152807, lat, lon) - 90) < 0.01
+    distances = haversine_distance_array([36.159334, 36.159334], [-115.152807, -115.152807], [lat, 36.159334], [lon, -115.152807])
+    assert abs(distances[0] - 1000) < 0.01 and distances[1] == 0
+    assert abs(initial_bearing_array([36.159334], [-115.152807], [lat], [lon])[0] - 90) < 0.01
+
+    north, south, east, west = bbox_from_point(36.159334, -115.152807, 1000)
+    assert abs(haversine_distance(36.159334, -115.152807, north, -115.152807) - 1000) < 0.01
+    assert abs(haversine_distance(36.159334, -115.152807, 36.159334, east) - 1000) < 1
+    assert abs((north + south) / 2 - 36.159334) < 1e-9 and abs((east + west) / 2 + 115.152807) < 1e-9
+    print("All tests passed!")
+
+
+if __name__ == "__main__":
+    unit_test()
@@ -0,0 +1,230 @@
+#!/usr/bin/env python
+
+# Turn-by-turn instructions for a route from RoutePlanner.py
+# https://osmnx.readthedocs.io/en/stable/user-reference.html#osmnx.bearing.add_edge_bearings
+# https://www.movable-type.co.uk/scripts/latlong.html#bearing
+#
+# The bearing of every edge is computed once per graph in one vectorized call and cached (and stored
+# as the "bearing" edge attribute like osmnx.bearing.add_edge_bearings). The turn angle at every node
+# of a route is then the wrapped difference of two looked up bearings, done for the whole route in
+# NumPy. Turns sharper than TURN_THRESHOLD_IN_DEGREES become maneuvers, everything else is riding
+# straight on. As the rider advances only the maneuvers still ahead are returned, and after a reroute
+# only the new part of the route is recomputed.
+
+# Standard library imports not needing pip installs
+import bisect
+import weakref
+
+# 3rd party libraries
+import numpy as np                  # pip install numpy
+
+# Internal libraries
+from GeoMath import initial_bearing_array
+
+TURN_THRESHOLD_IN_DEGREES = 30
+
+LEFT = "left"
+RIGHT = "right"
+ARRIVE = "arrive"
+
+# One bearing table per graph object, built on first use
+bearingTables = weakref.WeakKeyDictionary()
+
+
+def edge_bearings(graph) -> dict:
+    """ Bearing of every edge of an unprojected graph, computed on the first call and reused for as long as the graph exists
+
+    Args:
+        graph (networkx.MultiDiGraph): Road network graph with x (longitude) and y (latitude) on every node.
+
+    Returns:
+        dict: (u, v) to the bearing in degrees clockwise from north.
+    """
+    bearings = bearingTables.get(graph)
+    if bearings is not None:
+        return bearings
+
+    edges = list(graph.edges(keys=True))
+    nodes = graph.nodes
+    lat1 = np.array([nodes[u]["y"] for u, _, _ in edges])
+    lon1 = np.array([nodes[u]["x"] for u, _, _ in edges])
+    lat2 = np.array([nodes[v]["y"] for _, v, _ in edges])
+    lon2 = np.array([nodes[v]["x"] for _, v, _ in edges])
+    values = initial_bearing_array(lat1, lon1, lat2, lon2).round(1).tolist()
+
+    bearings = {}
+    for (u, v, key), bearing in zip(edges, values):
+        graph.edges[u, v, key]["bearing"] = bearing
+        bearings[(u, v)] = bearing
+    bearingTables[graph] = bearings
+
+    return bearings
+
+
+def turn_angles(bearings: np.ndarray) -> np.ndarray:
+    """ Turn at each node between consecutive edges, positive to the right
+
+    Args:
+        bearings (np.ndarray): Bearing of every edge along the route in degrees.
+
+    Returns:
+        np.ndarray: One angle per inner node of the route, between -180 and 180 degrees.
+    """
+    return (np.diff(bearings) + 180) % 360 - 180
+
+
+def extract_maneuvers(graph, route: list, startIndex: int = 0, threshold: float = TURN_THRESHOLD_IN_DEGREES, startDistance: float = None) -> list:
+    """ Maneuvers along a route from one of its nodes to the destination
+
+    Args:
+        graph (networkx.MultiDiGraph): Unprojected road network graph with a length on every edge.
+        route (list): Graph nodes of the route, like RoutePlanner.route() returns.
+        startIndex (int, optional): Position in route to start from. Defaults to 0.
+        threshold (float, optional): Smallest turn in degrees that is a maneuver. Defaults to 30.
+        startDistance (float, optional): Meters from the route start to route[startIndex], summed from the route when None. Defaults to None.
+
+    Returns:
+        list: (direction, degree, meters from the route start, position in route) per maneuver, ending with ARRIVE.
+    """
+    bearingTable = edge_bearings(graph)
+    edges = list(zip(route[startIndex:-1], route[startIndex + 1:]))
+    lengths = np.array([min(data["length"] for data in graph[u][v].values()) for u, v in edges])
+    if startDistance is None:
+        startDistance = route_distances(graph, route[:startIndex + 1])[-1]
+    distances = startDistance + np.concatenate([[0.0], np.cumsum(lengths)])
+
+    maneuvers = []
+    if len(edges) > 1:
+        angles = turn_angles(np.array([bearingTable[edge] for edge in edges]))
+        for position in np.flatnonzero(np.abs(angles) >= threshold).tolist():
+            angle = angles[position]
+            maneuvers.append((RIGHT if angle > 0 else LEFT, int(round(abs(angle))), float(distances[position + 1]), startIndex + position + 1))
+
+    maneuvers.append((ARRIVE, 0, float(distances[-1]), len(route) - 1))
+
+    return maneuvers
+
+
+def route_distances(graph, route: list) -> np.ndarray:
+    """ Meters from the start of a route to each of its nodes
+
+    Args:
+        graph (networkx.MultiDiGraph): Road network graph with a length on every edge.
+        route (list): Graph nodes of the route.
+
+    Returns:
+        np.ndarray: One distance per route node, starting at 0.
+    """
+    lengths = [min(data["length"] for data in graph[u][v].values()) for u, v in zip(route[:-1], route[1:])]
+
+    return np.concatenate([[0.0], np.cumsum(lengths)])
+
+
+class ManeuverTracker:
+
+    def __init__(self, graph, route: list, threshold: float = TURN_THRESHOLD_IN_DEGREES):
+        """ Compute the maneuvers of a route once and follow the rider along it.
+
+        Args:
+            graph (networkx.MultiDiGraph): Unprojected road network graph with a length on every edge.
+            route (list): Graph nodes of the route.
+            threshold (float, optional): Smallest turn in degrees that is a maneuver. Defaults to 30.
+        """
+        self.graph = graph
+        self.threshold = threshold
+        self.route = list(route)
+        self.distances = route_distances(graph, self.route)
+        self.maneuvers = extract_maneuvers(graph, self.route, 0, threshold)
+        self.routeIndex = 0
+
+        self.stats = {"recomputedEdges": len(self.route) - 1}
+
+
+    def __str__(self):
+        return f"ManeuverTracker(routeNodes={len(self.route)}, maneuvers={len(self.maneuvers)}, routeIndex={self.routeIndex}, stats={self.stats})"
+
+
+    def advance(self, routeIndex: int, metersAlongEdge: float = 0.0) -> list:
+        """ Maneuvers still ahead of the rider, with the distance left to each one
+
+        Args:
+            routeIndex (int): Position in the route of the last node the rider passed.
+            metersAlongEdge (float, optional): Meters ridden past that node. Defaults to 0.
+
+        Returns:
+            list: (direction, degree, meters to the maneuver) per maneuver ahead.
+        """
+        self.routeIndex = routeIndex
+        ridden = float(self.distances[routeIndex]) + metersAlongEdge
+        first = bisect.bisect_right([position for _, _, _, position in self.maneuvers], routeIndex)
+
+        return [(direction, degree, distance - ridden) for direction, degree, distance, _ in self.maneuvers[first:]]
+
+
+    def reroute(self, routeIndex: int, newRoute: list) -> list:
+        """ Replace the route after one of its nodes, only computing maneuvers for the new part
+
+        Args:
+            routeIndex (int): Position in the current route where the new route starts.
+            newRoute (list): Graph nodes from route[routeIndex] to the destination, like RouteSession.reroute() returns.
+
+        Returns:
+            list: The maneuvers ahead from routeIndex, like advance().
+        """
+        if newRoute[0] != self.route[routeIndex]:
+            raise ValueError(f"New route starts at {newRoute[0]}, not at route node {self.route[routeIndex]}")
+
+        self.route = self.route[:routeIndex] + list(newRoute)
+        self.distances = np.concatenate([self.distances[:routeIndex + 1], self.distances[routeIndex] + route_distances(self.graph, newRoute)[1:]])
+
+        # The turn at the first node of the new route depends on the edge before it
+        start = max(routeIndex - 1, 0)
+        kept = [maneuver for maneuver in self.maneuvers if maneuver[3] <= start]
+        self.maneuvers = kept + [maneuver for maneuver in extract_maneuvers(self.graph, self.route, start, self.threshold, float(self.distances[start])) if maneuver[3] > start]
+        self.stats["recomputedEdges"] += len(self.route) - 1 - start
+
+        return self.advance(routeIndex)
+
+
+def unit_test():
+    import networkx as nx
+
+    # An L shaped street: 3 blocks north, turn right for 2 blocks east, then left north again
+    step = 0.001
+    points = [(0, 0), (1, 0), (2, 0), (3, 0), (3, 1), (3, 2), (4, 2)]
+    graph = nx.MultiDiGraph(crs="epsg:4326")
+    for node, (row, column) in enumerate(points):
+        graph.add_node(node, y=36.0 + row * step, x=-115.0 + column * step)
+    for u in range(len(points) - 1):
+        graph.add_edge(u, u + 1, length=100.0)
+        graph.add_edge(u + 1, u, length=100.0)
+    graph.add_node(7, y=36.0 + 3 * step, x=-115.0 - step)
+    graph.add_edge(3, 7, length=100.0)
+    graph.add_edge(7, 6, length=300.0)
+
+    bearings = edge_bearings(graph)
+    assert edge_bearings(graph) is bearings and graph.edges[0, 1, 0]["bearing"] == 0.0
+    assert abs(bearings[(3, 4)] - 90) < 0.5 and abs(bearings[(1, 0)] - 180) < 0.5
+    assert turn_angles(np.array([350.0, 10.0, 280.0])).tolist() == [20.0, -90.0]
+
+    route = list(range(7))
+    maneuvers = extract_maneuvers(graph, route)
+    assert [(direction, position) for direction, _, _, position in maneuvers] == [(RIGHT, 3), (LEFT, 5), (ARRIVE, 6)]
+    assert abs(maneuvers[0][1] - 90) <= 1 and maneuvers[0][2] == 300 and maneuvers[-1][2] == 600
+
+    # The rider advances, only what is still ahead is returned with the distance left
+    tracker = ManeuverTracker(graph, route)
+    assert tracker.advance(1, 50)[0][0] == RIGHT and tracker.advance(1, 50)[0][2] == 150
+    assert [direction for direction, _, _ in tracker.advance(4)] == [LEFT, ARRIVE]
+
+    # Rerouting at node 3 west through node 7 only recomputes the new part
+    recomputed = tracker.stats["recomputedEdges"]
+    ahead = tracker.reroute(3, [3, 7, 6])
+    assert tracker.route == [0, 1, 2, 3, 7, 6] and tracker.maneuvers[0][0] == LEFT
+    assert ahead[0][0] == RIGHT and ahead[-1] == (ARRIVE, 0, 400.0)
+    assert tracker.stats["recomputedEdges"] - recomputed == 3
+    print("All tests passed!")
+
+
+if __name__ == "__main__":
+    unit_test()
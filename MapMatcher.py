@@ -0,0 +1,396 @@
+#!/usr/bin/env python
+
+# Snap GPS fixes onto the road network graph
+# https://en.wikipedia.org/wiki/Equirectangular_projection
+# https://www.microsoft.com/en-us/research/publication/hidden-markov-map-matching-noise-sparseness/
+#
+# Every edge (or the straight pieces of its osmnx geometry) is projected once to local meters around
+# the graph center and bucketed into a square grid of cellInMeters cells. A fix only measures the
+# segments in the cells around it, growing the search ring until no closer segment can exist, so the
+# nearest edge costs a dictionary lookup and a few vectorized distances. match_track() matches a
+# whole track at once with the Newson & Krumm hidden Markov model: candidates near each fix, a
+# Gaussian on the GPS error and a penalty on route length that differs from the straight distance.
+
+# Standard library imports not needing pip installs
+import math
+import time
+import weakref
+
+# 3rd party libraries
+import networkx as nx               # pip install networkx
+import numpy as np                  # pip install numpy
+
+# Internal libraries
+from GeoMath import EARTH_RADIUS_IN_METERS
+
+DEFAULT_CELL_IN_METERS = 50
+DEFAULT_SEARCH_RADIUS_IN_METERS = 50
+DEFAULT_GPS_SIGMA_IN_METERS = 5
+DEFAULT_TRANSITION_BETA_IN_METERS = 10
+MAX_CANDIDATES_PER_FIX = 8
+
+# One MapMatcher per graph object, built on first use
+matchers = weakref.WeakKeyDictionary()
+
+
+class MapMatcher:
+
+    def __init__(self, graph, cellInMeters: float = DEFAULT_CELL_IN_METERS):
+        """ Build the spatial index over every edge of an unprojected road network graph.
+
+        Args:
+            graph (networkx.MultiDiGraph): Graph with x (longitude) and y (latitude) on every node, like BikeAutoPilot.build_road_network()
+            cellInMeters (float, optional): Width of a grid cell. Defaults to 50 m.
+        """
+        crs = str(graph.graph.get("crs", "epsg:4326")).lower()
+        if crs not in ("epsg:4326", "wgs84"):
+            raise ValueError(f"MapMatcher needs an unprojected graph, not crs {crs}")
+        if graph.number_of_edges() == 0:
+            raise ValueError("MapMatcher needs a graph with edges")
+
+        self.graph = graph
+        self.cellInMeters = cellInMeters
+
+        lats = np.array([data["y"] for _, data in graph.nodes(data=True)])
+        lons = np.array([data["x"] for _, data in graph.nodes(data=True)])
+        self.lat0 = float((lats.min() + lats.max()) / 2)
+        self.lon0 = float((lons.min() + lons.max()) / 2)
+        self.metersPerDegreeLat = math.radians(1) * EARTH_RADIUS_IN_METERS
+        self.metersPerDegreeLon = self.metersPerDegreeLat * math.cos(math.radians(self.lat0))
+
+        # Straight pieces of every edge with the distance along the edge where each one starts
+        self.edges = []
+        starts = []
+        ends = []
+        segmentEdges = []
+        segmentOffsets = []
+        for u, v, key, data in graph.edges(keys=True, data=True):
+            if "geometry" in data:
+                lonLat = np.asarray(data["geometry"].coords)
+            else:
+                lonLat = np.array([(graph.nodes[u]["x"], graph.nodes[u]["y"]), (graph.nodes[v]["x"], graph.nodes[v]["y"])])
+            points = np.column_stack(self.project(lonLat[:, 1], lonLat[:, 0]))
+            pieceLengths = np.hypot(*(points[1:] - points[:-1]).T)
+
+            starts.append(points[:-1])
+            ends.append(points[1:])
+            segmentEdges.append(np.full(len(pieceLengths), len(self.edges)))
+            segmentOffsets.append(np.concatenate([[0.0], np.cumsum(pieceLengths)[:-1]]))
+            self.edges.append((u, v, key))
+
+        self.starts = np.concatenate(starts)
+        self.ends = np.concatenate(ends)
+        self.segmentEdges = np.concatenate(segmentEdges)
+        self.segmentOffsets = np.concatenate(segmentOffsets)
+        self.edgeLengths = np.bincount(self.segmentEdges, weights=np.hypot(*(self.ends - self.starts).T), minlength=len(self.edges))
+
+        # Grid cell to the segments whose bounding box touches it
+        low = np.floor(np.minimum(self.starts, self.ends) / cellInMeters).astype(np.int64)
+        high = np.floor(np.maximum(self.starts, self.ends) / cellInMeters).astype(np.int64)
+        cells = {}
+        for segment, (x0, y0, x1, y1) in enumerate(np.column_stack([low, high]).tolist()):
+            for cellX in range(x0, x1 + 1):
+                for cellY in range(y0, y1 + 1):
+                    cells.setdefault((cellX, cellY), []).append(segment)
+        self.cells = {cell: np.array(segments, dtype=np.int64) for cell, segments in cells.items()}
+
+        cellIds = np.array(list(self.cells))
+        self.cellBounds = (*cellIds.min(axis=0).tolist(), *cellIds.max(axis=0).tolist())
+
+        # Shortest path lengths from a node as (cutoff, lengths), one entry per node searched with the largest
+        # cutoff so far, reused for every smaller cutoff across match_track() calls
+        self.pathLengths = {}
+
+
+    def __str__(self):
+        return f"MapMatcher(edges={len(self.edges)}, segments={len(self.starts)}, cells={len(self.cells)}, cellInMeters={self.cellInMeters})"
+
+
+    def project(self, lat, lon) -> tuple:
+        """ Local meters east and north of the graph center
+
+        Args:
+            lat (array_like): Latitudes in degrees
+            lon (array_like): Longitudes in degrees
+
+        Returns:
+            tuple: (x, y) in meters.
+        """
+        return ((np.asarray(lon) - self.lon0) * self.metersPerDegreeLon, (np.asarray(lat) - self.lat0) * self.metersPerDegreeLat)
+
+
+    def segment_distances(self, segments: np.ndarray, x: float, y: float) -> tuple:
+        """ Distance from a point to segments and how far along each segment the closest point is
+
+        Args:
+            segments (np.ndarray): Segment indices.
+            x (float): Meters east of the graph center.
+            y (float): Meters north of the graph center.
+
+        Returns:
+            tuple: (distances, meters along each segment) arrays.
+        """
+        starts = self.starts[segments]
+        directions = self.ends[segments] - starts
+        lengthsSquared = np.einsum("ij,ij->i", directions, directions)
+        relative = (x, y) - starts
+        t = np.clip(np.einsum("ij,ij->i", relative, directions) / np.maximum(lengthsSquared, 1e-12), 0, 1)
+        offsets = directions * t[:, None] - relative
+
+        return np.sqrt(np.einsum("ij,ij->i", offsets, offsets)), t * np.sqrt(lengthsSquared)
+
+
+    def nearby_segments(self, cellX: int, cellY: int, ring: int) -> np.ndarray:
+        if ring == 0:
+            return self.cells.get((cellX, cellY), np.zeros(0, dtype=np.int64))
+
+        found = [self.cells[cell] for cell in ((cellX + dx, cellY + dy) for dx in range(-ring, ring + 1) for dy in range(-ring, ring + 1)) if cell in self.cells]
+
+        return np.unique(np.concatenate(found)) if found else np.zeros(0, dtype=np.int64)
+
+
+    def nearest_edge(self, lat: float, lon: float) -> tuple:
+        """ Edge closest to a GPS fix
+
+        Args:
+            lat (float): The latitude in degrees
+            lon (float): The longitude in degrees
+
+        Returns:
+            tuple: ((u, v, key) edge, meters along the edge from u, meters from the fix to the edge)
+        """
+        x = (lon - self.lon0) * self.metersPerDegreeLon
+        y = (lat - self.lat0) * self.metersPerDegreeLat
+        cellX, cellY = math.floor(x / self.cellInMeters), math.floor(y / self.cellInMeters)
+        insideX, insideY = x - cellX * self.cellInMeters, y - cellY * self.cellInMeters
+        insideCell = min(insideX, self.cellInMeters - insideX, insideY, self.cellInMeters - insideY)
+        minX, minY, maxX, maxY = self.cellBounds
+        maxRing = max(abs(cellX - minX), abs(cellX - maxX), abs(cellY - minY), abs(cellY - maxY))
+
+        # Every segment within ring cells plus the distance to the cell border has been measured
+        ring = 0
+        while True:
+            segments = self.nearby_segments(cellX, cellY, ring)
+            if len(segments):
+                distances, along = self.segment_distances(segments, x, y)
+                best = int(np.argmin(distances))
+                if distances[best] <= ring * self.cellInMeters + insideCell or ring >= maxRing:
+                    segment = segments[best]
+                    return (self.edges[self.segmentEdges[segment]], float(self.segmentOffsets[segment] + along[best]), float(distances[best]))
+            elif ring >= maxRing:
+                raise ValueError(f"No edge near {lat}, {lon}")
+            ring += 1
+
+
+    def candidates(self, lat: float, lon: float, searchRadius: float = DEFAULT_SEARCH_RADIUS_IN_METERS) -> list:
+        """ Closest point on every edge within a distance of a GPS fix
+
+        Args:
+            lat (float): The latitude in degrees
+            lon (float): The longitude in degrees
+            searchRadius (float, optional): Largest GPS error in meters. Defaults to 50 m.
+
+        Returns:
+            list: (edge index, meters along the edge, meters from the fix) for the closest MAX_CANDIDATES_PER_FIX edges.
+        """
+        x = (lon - self.lon0) * self.metersPerDegreeLon
+        y = (lat - self.lat0) * self.metersPerDegreeLat
+        segments = self.nearby_segments(math.floor(x / self.cellInMeters), math.floor(y / self.cellInMeters), int(math.ceil(searchRadius / self.cellInMeters)))
+        if len(segments) == 0:
+            return []
+
+        distances, along = self.segment_distances(segments, x, y)
+        order = np.argsort(distances)
+
+        best = {}
+        for position in order[distances[order] <= searchRadius].tolist():
+            edge = int(self.segmentEdges[segments[position]])
+            if edge not in best:
+                best[edge] = (edge, float(self.segmentOffsets[segments[position]] + along[position]), float(distances[position]))
+            if len(best) == MAX_CANDIDATES_PER_FIX:
+                break
+
+        return list(best.values())
+
+
+    def route_distance(self, first: tuple, second: tuple, cutoff: float) -> float:
+        """ Riding distance between two points on edges, infinite when further than cutoff
+
+        Args:
+            first (tuple): (edge index, meters along the edge) of the start.
+            second (tuple): (edge index, meters along the edge) of the end.
+            cutoff (float): Longest distance worth searching in meters.
+
+        Returns:
+            float: The distance in meters.
+        """
+        firstEdge, firstOffset = first
+        secondEdge, secondOffset = second
+        if firstEdge == secondEdge and secondOffset >= firstOffset:
+            return secondOffset - firstOffset
+
+        u, v, _ = self.edges[firstEdge]
+        start = self.edges[secondEdge][0]
+        toEnd = self.edgeLengths[firstEdge] - firstOffset
+        if toEnd + secondOffset > cutoff:
+            return math.inf
+
+        searched, lengths = self.pathLengths.get(v, (-math.inf, None))
+        if searched < cutoff:
+            lengths = nx.single_source_dijkstra_path_length(self.graph, v, cutoff=cutoff, weight="length")
+            self.pathLengths[v] = (cutoff, lengths)
+
+        # Lengths searched with a larger cutoff can hold paths longer than this one
+        distance = toEnd + lengths.get(start, math.inf) + secondOffset
+        return distance if distance <= cutoff else math.inf
+
+
+    def match_track(self, track: list, searchRadius: float = DEFAULT_SEARCH_RADIUS_IN_METERS, sigma: float = DEFAULT_GPS_SIGMA_IN_METERS, beta: float = DEFAULT_TRANSITION_BETA_IN_METERS) -> list:
+        """ Most likely edges ridden for a whole GPS track, using a hidden Markov model and the Viterbi algorithm
+
+        Args:
+            track (list): (lat, lon) fixes in riding order.
+            searchRadius (float, optional): Largest GPS error in meters. Defaults to 50 m.
+            sigma (float, optional): Standard deviation of the GPS error in meters. Defaults to 5 m.
+            beta (float, optional): Scale of the difference between riding and straight line distance in meters. Defaults to 10 m.
+
+        Returns:
+            list: One ((u, v, key) edge, meters along the edge, meters from the fix) per fix, None for fixes without a nearby edge.
+        """
+        matches = [None] * len(track)
+        previous = None          # (candidates, log probabilities, back pointers, fix index)
+        chains = []
+
+        for index, (lat, lon) in enumerate(track):
+            candidates = self.candidates(lat, lon, searchRadius)
+            if not candidates:
+                continue
+
+            emission = np.array([-0.5 * (distance / sigma) ** 2 for _, _, distance in candidates])
+            if previous is None:
+                previous = (candidates, emission, [None] * len(candidates), index)
+                chains.append([previous])
+                continue
+
+            previousCandidates, previousScores, _, previousIndex = previous
+            straight = float(np.hypot(*np.subtract(self.project(lat, lon), self.project(*track[previousIndex]))))
+            cutoff = straight * 2 + 2 * searchRadius + 100
+
+            scores = np.full(len(candidates), -math.inf)
+            pointers = [None] * len(candidates)
+            for current, (edge, offset, _) in enumerate(candidates):
+                for before, (previousEdge, previousOffset, _) in enumerate(previousCandidates):
+                    distance = self.route_distance((previousEdge, previousOffset), (edge, offset), cutoff)
+                    score = previousScores[before] - abs(distance - straight) / beta
+                    if score > scores[current]:
+                        scores[current] = score
+                        pointers[current] = before
+
+            # No candidate is reachable from the last fix, start a new chain
+            if np.isneginf(scores).all():
+                previous = (candidates, emission, [None] * len(candidates), index)
+                chains.append([previous])
+                continue
+
+            previous = (candidates, scores + emission, pointers, index)
+            chains[-1].append(previous)
+
+        for chain in chains:
+            state = int(np.argmax(chain[-1][1]))
+            for candidates, _, pointers, index in reversed(chain):
+                edge, offset, distance = candidates[state]
+                matches[index] = (self.edges[edge], offset, distance)
+                state = pointers[state]
+
+        return matches
+
+
+def map_matcher(graph) -> MapMatcher:
+    """ The MapMatcher of a graph, built on the first call and reused for as long as the graph exists
+
+    Args:
+        graph (networkx.MultiDiGraph): Unprojected road network graph.
+
+    Returns:
+        MapMatcher: The matcher of the graph.
+    """
+    matcher = matchers.get(graph)
+    if matcher is None:
+        matcher = MapMatcher(graph)
+        matchers[graph] = matcher
+
+    return matcher
+
+
+def benchmark(fixes: int = 10000):
+    """ Print the time to build the index over the cache/ network and to match single fixes
+
+    Args:
+        fixes (int, optional): Random fixes to match. Defaults to 10000.
+    """
+    from OfflineRoadNetwork import build_offline_road_network
+
+    graph = build_offline_road_network((36.144635, -115.326555), 3200)
+
+    start = time.perf_counter()
+    matcher = MapMatcher(graph)
+    buildTime = time.perf_counter() - start
+
+    random = np.random.default_rng(42)
+    lats = random.uniform(36.125, 36.165, fixes)
+    lons = random.uniform(-115.35, -115.30, fixes)
+    start = time.perf_counter()
+    for lat, lon in zip(lats.tolist(), lons.tolist()):
+        matcher.nearest_edge(lat, lon)
+    queryTime = (time.perf_counter() - start) / fixes
+
+    print(f"{matcher}: built in {buildTime * 1000:.0f} ms, nearest_edge {queryTime * 1e6:.0f} us per fix")
+
+
+def unit_test():
+    # Two parallel east-west streets 100 m apart joined at their east end
+    metersPerDegree = math.radians(1) * EARTH_RADIUS_IN_METERS
+    step = 100 / metersPerDegree
+    graph = nx.MultiDiGraph(crs="epsg:4326")
+    for node, (row, column) in enumerate([(0, 0), (0, 1), (0, 2), (1, 0), (1, 1), (1, 2)]):
+        graph.add_node(node, y=36.0 + row * step, x=-115.0 + column * step / math.cos(math.radians(36.0)))
+    for u, v in [(0, 1), (1, 2), (3, 4), (4, 5), (2, 5)]:
+        length = 100.0
+        graph.add_edge(u, v, length=length)
+        graph.add_edge(v, u, length=length)
+
+    matcher = map_matcher(graph)
+    assert map_matcher(graph) is matcher
+
+    edge, offset, distance = matcher.nearest_edge(36.0 + 0.2 * step, -115.0 + 0.3 * step / math.cos(math.radians(36.0)))
+    assert set(edge[:2]) == {0, 1} and abs(distance - 20) < 0.5
+    assert abs(offset - (30 if edge[0] == 0 else 70)) < 0.5
+
+    # Far from every street the search ring grows until it finds one
+    edge, _, distance = matcher.nearest_edge(36.0 - 10 * step, -115.0)
+    assert set(edge[:2]) == {0, 1} and abs(distance - 1000) < 2
+
+    # A fix between the streets is matched to the street the track is riding on
+    track = [(36.0 + 0.1 * step, -115.0 + x * step / math.cos(math.radians(36.0))) for x in [0.2, 0.6, 1.0, 1.4]]
+    track.insert(2, (36.0 + 0.45 * step, -115.0 + 0.8 * step / math.cos(math.radians(36.0))))
+    assert matcher.nearest_edge(*track[2])[0][0] in (0, 1, 3, 4)
+    matches = matcher.match_track(track)
+    assert all(set(match[0][:2]) <= {0, 1, 2} for match in matches)
+    assert matches[0][0] == (0, 1, 0) and matches[-1][0] == (1, 2, 0)
+
+    # Searches from a node are kept once with the largest cutoff and answer the smaller ones
+    searched = {node: cutoff for node, (cutoff, _) in matcher.pathLengths.items()}
+    assert len(matcher.pathLengths) <= graph.number_of_nodes() and matcher.match_track(track) == matches
+    assert {node: cutoff for node, (cutoff, _) in matcher.pathLengths.items()} == searched
+    firstEdge = matcher.edges.index((0, 1, 0))
+    assert abs(matcher.route_distance((firstEdge, 50.0), (matcher.edges.index((2, 5, 0)), 50.0), 1000) - 200) < 0.01
+    assert matcher.route_distance((firstEdge, 50.0), (matcher.edges.index((2, 5, 0)), 50.0), 150) == math.inf
+    assert matcher.pathLengths[1][0] == 1000
+
+    assert matcher.match_track([(37.0, -115.0)]) == [None]
+    print("All tests passed!")
+
+
+if __name__ == "__main__":
+    unit_test()
+    benchmark()
@@ -0,0 +1,251 @@
+#!/usr/bin/env python
+
+# 3x3 slippy map view that only reloads the tiles that changed
+# https://nicegui.io/documentation/image
+# https://developer.mozilla.org/en-US/docs/Web/CSS/background-position
+#
+# The view keeps a fixed pool of ui.image elements absolutely positioned inside one container. On a
+# pan or zoom each tile that is still visible keeps its element and only moves (a style change, no
+# image reload), and only the elements whose tile left the view get a new source. Panning by one
+# tile therefore loads 3 images instead of 9. While a zoomed in tile loads, the already loaded parent
+# tile is shown behind it as a CSS background scaled up to the quarter the child covers.
+
+# Internal libraries
+from TileMath import TILE_SIZE, get_tile_XY
+from TileCache import local_tile_URL
+
+
+def plan_viewport_update(currentTiles: list, neededTiles: list) -> list:
+    """ Decide which element of the pool shows which tile, reusing elements that already show a needed tile
+
+    Args:
+        currentTiles (list): (zoomLevel, x, y) tile shown by each element, or None for an unused element.
+        neededTiles (list): ((zoomLevel, x, y), (column, row)) for every tile of the new view.
+
+    Returns:
+        list: One (tile, (column, row), needsNewSource) per element, in the order of currentTiles.
+    """
+    if len(neededTiles) > len(currentTiles):
+        raise ValueError(f"{len(neededTiles)} tiles do not fit in a pool of {len(currentTiles)} elements")
+
+    positions = dict(neededTiles)
+    plan = [None] * len(currentTiles)
+
+    # Elements already showing a needed tile keep their image and at most move
+    for element, tile in enumerate(currentTiles):
+        if tile in positions:
+            plan[element] = (tile, positions.pop(tile), False)
+
+    freeElements = [element for element in range(len(currentTiles)) if plan[element] is None]
+    for element, (tile, position) in zip(freeElements, [(tile, position) for tile, position in neededTiles if tile in positions]):
+        plan[element] = (tile, position, True)
+
+    # Elements left over keep whatever they show and stay hidden
+    for element in range(len(currentTiles)):
+        if plan[element] is None:
+            plan[element] = (currentTiles[element], None, False)
+
+    return plan
+
+
+def parent_placeholder_style(tile: tuple, shownTiles: set, layer: str, ext: str, tileURL=local_tile_URL) -> str:
+    """ CSS that shows the loaded parent tile, scaled up, behind a child tile that is still loading
+
+    Args:
+        tile (tuple): (zoomLevel, x, y) of the child tile.
+        shownTiles (set): Tiles the browser already shows, so their images are loaded.
+        layer (str): The tile layer.
+        ext (str): The image file extension.
+        tileURL (function, optional): Builds the tile URL from (zoomLevel, x, y, layer, ext). Defaults to TileCache.local_tile_URL().
+
+    Returns:
+        str: CSS declarations, empty when the parent tile is not loaded.
+    """
+    zoomLevel, x, y = tile
+    parentTile = (zoomLevel - 1, x // 2, y // 2)
+    if zoomLevel == 0 or parentTile not in shownTiles:
+        return ""
+
+    return (f"background-image: url({tileURL(*parentTile, layer, ext)}); "
+            f"background-size: {2 * TILE_SIZE}px {2 * TILE_SIZE}px; "
+            f"background-position: -{(x % 2) * TILE_SIZE}px -{(y % 2) * TILE_SIZE}px;")
+
+
+class MapViewport:
+
+    def __init__(self, columns: int = 3, rows: int = 3, layer: str = "osm", ext: str = "png", tileURL=local_tile_URL):
+        """ Initialize the view, call build() inside a NiceGUI layout to create the elements.
+
+        Args:
+            columns (int, optional): Tiles across. Defaults to 3.
+            rows (int, optional): Tiles down. Defaults to 3.
+            layer (str, optional): The tile layer. Defaults to "osm".
+            ext (str, optional): The image file extension of the layer. Defaults to "png".
+            tileURL (function, optional): Builds the tile URL from (zoomLevel, x, y, layer, ext), like TileCompositor.composite_tile_URL(). Defaults to TileCache.local_tile_URL().
+        """
+        self.columns = columns
+        self.rows = rows
+        self.layer = layer
+        self.ext = ext
+        self.tileURL = tileURL
+        self.refreshCount = 0
+
+        self.centerTile = None
+        self.container = None
+        self.images = []
+        self.shownTiles = [None] * (columns * rows)
+
+        self.stats = {"updates": 0, "sourceSwaps": 0, "moves": 0, "refreshes": 0}
+
+
+    def __str__(self):
+        return f"MapViewport(centerTile={self.centerTile}, stats={self.stats})"
+
+
+    def build(self):
+        """ Create the container and the pool of image elements.
+        """
+        from nicegui import ui              # pip install nicegui
+
+        with ui.element("div").style(f"position: relative; overflow: hidden; width: {self.columns * TILE_SIZE}px; height: {self.rows * TILE_SIZE}px;") as self.container:
+            for _ in range(self.columns * self.rows):
+                image = ui.image("").props("no-spinner no-transition")
+                image.visible = False
+                self.images.append(image)
+
+
+    def show(self, lat: float, lon: float, zoomLevel: int):
+        """ Center the view on a GPS location.
+
+        Args:
+            lat (float): The latitude in degrees
+            lon (float): The longitude in degrees
+            zoomLevel (int): The zoom level.
+        """
+        x, y = get_tile_XY(zoomLevel, lat, lon)
+        self.show_tile(zoomLevel, x, y)
+
+
+    def pan(self, dx: int, dy: int):
+        """ Move the view by whole tiles.
+
+        Args:
+            dx (int): Tiles to move right, negative to move left.
+            dy (int): Tiles to move down, negative to move up.
+        """
+        zoomLevel, x, y = self.centerTile
+        n = 1 << zoomLevel
+        self.show_tile(zoomLevel, (x + dx) % n, min(max(y + dy, 0), n - 1))
+
+
+    def show_tile(self, zoomLevel: int, x: int, y: int):
+        """ Center the view on a tile, only touching the elements whose tile or position changed.
+
+        Args:
+            zoomLevel (int): The zoom level.
+            x (int): The x-coordinate of the center tile.
+            y (int): The y-coordinate of the center tile.
+        """
+        self.centerTile = (zoomLevel, x, y)
+        plan = plan_viewport_update(self.shownTiles, self.view_tiles())
+        previouslyShown = {tile for tile in self.shownTiles if tile is not None}
+
+        self.stats["updates"] += 1
+        for image, (tile, position, needsNewSource) in zip(self.images, plan):
+            if position is None:
+                image.visible = False
+                continue
+
+            style = f"position: absolute; left: {position[0] * TILE_SIZE}px; top: {position[1] * TILE_SIZE}px; width: {TILE_SIZE}px; height: {TILE_SIZE}px;"
+            if needsNewSource:
+                image.style(replace=style + parent_placeholder_style(tile, previouslyShown, self.layer, self.ext, self.tileURL))
+                image.set_source(self.source(tile))
+                self.stats["sourceSwaps"] += 1
+            else:
+                image.style(replace=style)
+                self.stats["moves"] += 1
+            image.visible = True
+
+        self.shownTiles = [tile for tile, _, _ in plan]
+
+
+    def refresh(self, tiles: list = None):
+        """ Make the browser load shown tiles again, for example after an overlay layer of the tiles changed.
+
+        Args:
+            tiles (list, optional): (zoomLevel, x, y) tiles to reload, None for every shown tile. Defaults to None.
+        """
+        self.refreshCount += 1
+        for image, tile in zip(self.images, self.shownTiles):
+            if tile is not None and (tiles is None or tile in tiles):
+                image.set_source(self.source(tile))
+                self.stats["refreshes"] += 1
+
+
+    def source(self, tile: tuple) -> str:
+        """ Image source of a tile, with the refresh count so the browser does not reuse an image from before the last refresh()
+
+        Args:
+            tile (tuple): (zoomLevel, x, y) tile ID.
+
+        Returns:
+            str: The image URL.
+        """
+        url = self.tileURL(*tile, self.layer, self.ext)
+        if self.refreshCount == 0:
+            return url
+
+        return f"{url}?refresh={self.refreshCount}"
+
+
+    def view_tiles(self) -> list:
+        """ Tiles of the view around centerTile with their grid positions, rows above or below the map are left empty
+
+        Returns:
+            list: ((zoomLevel, x, y), (column, row)) pairs.
+        """
+        zoomLevel, x, y = self.centerTile
+        n = 1 << zoomLevel
+
+        tiles = []
+        for row in range(self.rows):
+            for column in range(self.columns):
+                tileY = y + row - self.rows // 2
+                tile = (zoomLevel, (x + column - self.columns // 2) % n, tileY)
+                if 0 <= tileY < n and tile not in dict(tiles):
+                    tiles.append((tile, (column, row)))
+
+        return tiles
+
+
+def unit_test():
+    viewport = MapViewport()
+    viewport.centerTile = (16, 11772, 25701)
+    plan = plan_viewport_update(viewport.shownTiles, viewport.view_tiles())
+    assert sum(needsNewSource for _, _, needsNewSource in plan) == 9
+    shown = [tile for tile, _, _ in plan]
+
+    # Panning one tile right keeps 6 images and only swaps the source of 3
+    viewport.centerTile = (16, 11773, 25701)
+    plan = plan_viewport_update(shown, viewport.view_tiles())
+    assert sum(needsNewSource for _, _, needsNewSource in plan) == 3
+    assert all(tile[1] == 11774 for tile, _, needsNewSource in plan if needsNewSource)
+    assert {position for _, position, _ in plan} == {(column, row) for column in range(3) for row in range(3)}
+
+    # Showing the same view again changes nothing, zooming in changes every tile
+    assert sum(needsNewSource for _, _, needsNewSource in plan_viewport_update([tile for tile, _, _ in plan], viewport.view_tiles())) == 0
+    viewport.centerTile = (17, 23546, 51402)
+    assert sum(needsNewSource for _, _, needsNewSource in plan_viewport_update(shown, viewport.view_tiles())) == 9
+
+    assert "url(/tiles/osm/16/11772/25701.png)" in parent_placeholder_style((17, 23545, 51403), set(shown), "osm", "png")
+    assert "-256px -256px" in parent_placeholder_style((17, 23545, 51403), set(shown), "osm", "png")
+    assert parent_placeholder_style((17, 0, 0), set(shown), "osm", "png") == ""
+
+    # Only 2 rows exist at zoom level 1 so the top row of the view stays empty
+    viewport.centerTile = (1, 0, 0)
+    assert len(viewport.view_tiles()) == 4
+    print("All tests passed!")
+
+
+if __name__ == "__main__":
+    unit_test()
@@ -0,0 +1,326 @@
+#!/usr/bin/env python
+
+# Log-odds occupancy grid of stationary radar returns in world coordinates, kept across rides
+# https://en.wikipedia.org/wiki/Occupancy_grid_mapping
+# https://wiki.openstreetmap.org/wiki/Slippy_map_tilenames
+# https://numpy.org/doc/stable/reference/generated/numpy.lib.format.open_memmap.html
+#
+# The grid cells are the pixels of the Slippy-map tiles at tileZoom (about 1.9 meters in Las Vegas at
+# zoom 16), so one grid tile is one map tile and is stored as one memory-mapped 256 x 256 float32 .npy
+# file named after its quadkey. Tiles are only opened when the rider's radar reaches them and only a
+# few are kept open. Every scan adds evidence to the cells the radar sees, a hit where a stationary
+# object is and a miss everywhere else, clamped so parked cars that leave fade out again. Cells that
+# pass STATIC_LOG_ODDS are known static clutter and can be masked out of new frames before grouping.
+# Only earlier rides count as known: a ride adds its evidence to <quadkey>.ride.npy copies of the tiles,
+# and flush() at the end of the ride replaces the tiles with them. A car stopped in the lane is
+# therefore never masked on the ride it is seen on. Ride files left by a crash are merged on opening.
+
+# Standard library imports not needing pip installs
+from collections import OrderedDict
+import glob
+import math
+import os
+import tempfile
+import time
+
+# 3rd party libraries
+import numpy as np                  # pip install numpy
+
+# Internal libraries
+from GeoMath import EARTH_RADIUS_IN_METERS
+from TileMath import TILE_SIZE, get_tile_fraction_XY
+from QuadKey import tileXY_to_quadkey
+from RadarGeoreference import polar_to_world_offsets
+
+DEFAULT_CACHE_FOLDER = os.path.join(os.path.dirname(os.path.abspath(__file__)), "cache", "occupancy")
+DEFAULT_TILE_ZOOM = 16
+RIDE_SUFFIX = ".ride.npy"
+
+# Grid tiles kept open, a 300 meter radar never reaches more than 4 tiles at zoom 16
+MAX_TILES_IN_MEMORY = 16
+
+# Log-odds of a hit (p=0.7) and a miss (p=0.4), clamped so a cell can always change its mind
+LOG_ODDS_HIT = 0.85
+LOG_ODDS_MISS = -0.4
+LOG_ODDS_MIN = -2.0
+LOG_ODDS_MAX = 3.5
+
+# Cells at or above this are known static clutter (p=0.88, at least 3 more hits than misses)
+STATIC_LOG_ODDS = 2.0
+
+
+class OccupancyGrid:
+
+    def __init__(self, folder: str = DEFAULT_CACHE_FOLDER, tileZoom: int = DEFAULT_TILE_ZOOM, maxRadius: int = 300, staticLogOdds: float = STATIC_LOG_ODDS):
+        """ Open (or create) the occupancy grid folder.
+
+        Args:
+            folder (str, optional): Folder of the grid tiles. Defaults to cache/occupancy.
+            tileZoom (int, optional): Zoom level of the grid tiles, cells are their pixels. Defaults to 16.
+            maxRadius (int, optional): Maximum range of the RADAR in meters, like Radar.maxRadius. Defaults to 300.
+            staticLogOdds (float, optional): Log-odds at which a cell is static clutter. Defaults to 2.0.
+        """
+        self.folder = folder
+        self.tileZoom = tileZoom
+        self.staticLogOdds = staticLogOdds
+        os.makedirs(folder, exist_ok=True)
+
+        # (x, y, ride) of a tile to its memory map, or None when it is not on disk yet
+        self.tiles = OrderedDict()
+
+        # Meters north and east of every radar bin when heading north, rotated to the heading on each update
+        radius, theta = np.meshgrid(np.arange(maxRadius), np.arange(360), indexing="ij")
+        self.binNorth, self.binEast = polar_to_world_offsets(radius, theta, 0)
+
+        self.stats = {"updates": 0, "tileLoads": 0, "tilesCreated": 0, "maskedPoints": 0, "ridesMerged": 0}
+
+        # A ride that ended without flush() still counts as an earlier ride
+        self.flush()
+
+
+    def __str__(self):
+        return f"OccupancyGrid(folder={self.folder}, tileZoom={self.tileZoom}, openTiles={len(self.tiles)}, stats={self.stats})"
+
+
+    def path(self, x: int, y: int, ride: bool = False) -> str:
+        return os.path.join(self.folder, f"{tileXY_to_quadkey(self.tileZoom, x, y)}{RIDE_SUFFIX if ride else '.npy'}")
+
+
+    def tile(self, x: int, y: int, create: bool = False, ride: bool = False):
+        """ Memory map of a grid tile, opened from disk on first use
+
+        Args:
+            x (int): The x-coordinate of the tile.
+            y (int): The y-coordinate of the tile.
+            create (bool, optional): Create the tile file when it does not exist. Defaults to False.
+            ride (bool, optional): The copy of the tile this ride updates, created from the tile of the earlier rides. Defaults to False.
+
+        Returns:
+            numpy.memmap: (256, 256) float32 log-odds indexed [pixelY, pixelX], None if not on disk and not created.
+        """
+        key = (x, y, ride)
+        tile = self.tiles.get(key)
+        if tile is None:
+            path = self.path(x, y, ride)
+            if key not in self.tiles and os.path.exists(path):
+                tile = np.load(path, mmap_mode="r+")
+                self.stats["tileLoads"] += 1
+            elif create:
+                earlierRides = self.tile(x, y) if ride else None
+                tile = np.lib.format.open_memmap(path, mode="w+", dtype=np.float32, shape=(TILE_SIZE, TILE_SIZE))
+                if earlierRides is not None:
+                    tile[:] = earlierRides
+                self.stats["tilesCreated"] += 1
+            self.tiles[key] = tile
+        self.tiles.move_to_end(key)
+
+        while len(self.tiles) > MAX_TILES_IN_MEMORY:
+            _, evicted = self.tiles.popitem(last=False)
+            if evicted is not None:
+                evicted.flush()
+
+        return tile
+
+
+    def cells(self, north: np.ndarray, east: np.ndarray, lat: float, lon: float) -> tuple:
+        """ Grid cells of points given in meters from the rider
+
+        Web Mercator is conformal, so within radar range meters scale to pixels by the same factor on both axes.
+
+        Args:
+            north (np.ndarray): Meters north of the rider
+            east (np.ndarray): Meters east of the rider
+            lat (float): Latitude of the rider in degrees
+            lon (float): Longitude of the rider in degrees
+
+        Returns:
+            tuple: int64 arrays (globalPixelX, globalPixelY) at tileZoom.
+        """
+        x, y = get_tile_fraction_XY(self.tileZoom, lat, lon)
+        pixelsPerMeter = TILE_SIZE * 2 ** self.tileZoom / (2 * math.pi * EARTH_RADIUS_IN_METERS * math.cos(math.radians(lat)))
+
+        return (np.floor(x * TILE_SIZE + east * pixelsPerMeter).astype(np.int64), np.floor(y * TILE_SIZE - north * pixelsPerMeter).astype(np.int64))
+
+
+    def log_odds(self, globalPixelX: np.ndarray, globalPixelY: np.ndarray, ride: bool = False) -> np.ndarray:
+        """ Log-odds of grid cells, 0 (unknown) for cells in tiles that were never seen
+
+        Args:
+            globalPixelX (np.ndarray): Cell x-coordinates like cells() returns
+            globalPixelY (np.ndarray): Cell y-coordinates like cells() returns
+            ride (bool, optional): Include the evidence of this ride, static_mask() only uses the earlier rides. Defaults to False.
+
+        Returns:
+            np.ndarray: float32 log-odds per cell.
+        """
+        values = np.zeros(len(globalPixelX), dtype=np.float32)
+        for tileX, tileY, members in self._group_by_tile(globalPixelX, globalPixelY):
+            tile = self.tile(tileX, tileY, ride=True) if ride else None
+            if tile is None:
+                tile = self.tile(tileX, tileY)
+            if tile is not None:
+                values[members] = tile[globalPixelY[members] % TILE_SIZE, globalPixelX[members] % TILE_SIZE]
+
+        return values
+
+
+    def update(self, dataTimeSlice: np.ndarray, lat: float, lon: float, headingDegrees: float):
+        """ Add the evidence of one radar time slice to this ride's copy of the grid, see flush()
+
+        Args:
+            dataTimeSlice (np.ndarray): Boolean (maxRadius, 360) array of stationary points like Radar.dataTimeSliceStationary
+            lat (float): Latitude of the rider in degrees
+            lon (float): Longitude of the rider in degrees
+            headingDegrees (float): Heading of the rider in degrees clockwise from north
+        """
+        rows = dataTimeSlice.shape[0]
+        heading = math.radians(headingDegrees)
+        cosHeading, sinHeading = math.cos(heading), math.sin(heading)
+        binNorth, binEast = self.binNorth[:rows], self.binEast[:rows]
+        north = binNorth * cosHeading - binEast * sinHeading
+        east = binNorth * sinHeading + binEast * cosHeading
+        globalPixelX, globalPixelY = self.cells(north.ravel(), east.ravel(), lat, lon)
+
+        # Many bins near the rider share a cell, each cell gets one hit or one miss per scan
+        cellIds, inverse = np.unique((globalPixelX << 32) | globalPixelY, return_inverse=True)
+        cellHit = np.zeros(len(cellIds), dtype=bool)
+        cellHit[inverse[dataTimeSlice.ravel()]] = True
+        delta = np.where(cellHit, LOG_ODDS_HIT, LOG_ODDS_MISS).astype(np.float32)
+
+        cellX, cellY = cellIds >> 32, cellIds & 0xFFFFFFFF
+        for tileX, tileY, members in self._group_by_tile(cellX, cellY):
+            tile = self.tile(tileX, tileY, create=True, ride=True)
+            pixelX, pixelY = cellX[members] % TILE_SIZE, cellY[members] % TILE_SIZE
+            tile[pixelY, pixelX] = np.clip(tile[pixelY, pixelX] + delta[members], LOG_ODDS_MIN, LOG_ODDS_MAX)
+        self.stats["updates"] += 1
+
+
+    def static_mask(self, dataTimeSlice: np.ndarray, lat: float, lon: float, headingDegrees: float) -> np.ndarray:
+        """ Points of a radar time slice that fall on static clutter known from earlier rides
+
+        Only the occupied bins are looked up, so the cost follows the number of detections.
+
+        Args:
+            dataTimeSlice (np.ndarray): Boolean (maxRadius, 360) array like Radar.dataTimeSliceStationary
+            lat (float): Latitude of the rider in degrees
+            lon (float): Longitude of the rider in degrees
+            headingDegrees (float): Heading of the rider in degrees clockwise from north
+
+        Returns:
+            np.ndarray: Boolean array shaped like dataTimeSlice, True for points on static clutter.
+        """
+        radius, theta = np.nonzero(dataTimeSlice)
+        north, east = polar_to_world_offsets(radius, theta, headingDegrees)
+        static = self.log_odds(*self.cells(north, east, lat, lon)) >= self.staticLogOdds
+
+        mask = np.zeros(dataTimeSlice.shape, dtype=bool)
+        mask[radius[static], theta[static]] = True
+        self.stats["maskedPoints"] += int(static.sum())
+
+        return mask
+
+
+    def flush(self):
+        """ End the ride: write every open tile to disk and make this ride's evidence known to the next ride
+        """
+        for tile in self.tiles.values():
+            if tile is not None:
+                tile.flush()
+        self.tiles.clear()
+
+        ridePaths = glob.glob(os.path.join(glob.escape(self.folder), "*" + RIDE_SUFFIX))
+        for ridePath in ridePaths:
+            os.replace(ridePath, ridePath[:-len(RIDE_SUFFIX)] + ".npy")
+        if ridePaths:
+            self.stats["ridesMerged"] += 1
+
+
+    def _group_by_tile(self, globalPixelX: np.ndarray, globalPixelY: np.ndarray):
+        """ Yield (tileX, tileY, indices of the cells in that tile) for every tile the cells touch
+        """
+        tileX, tileY = globalPixelX // TILE_SIZE, globalPixelY // TILE_SIZE
+        tileIds = (tileX << 32) | tileY
+        order = np.argsort(tileIds, kind="stable")
+        starts = np.flatnonzero(np.diff(tileIds[order], prepend=-1))
+        for start, end in zip(starts.tolist(), starts[1:].tolist() + [len(order)]):
+            members = order[start:end]
+            yield (int(tileX[members[0]]), int(tileY[members[0]]), members)
+
+
+def benchmark(scans: int = 50):
+    """ Time update() and static_mask() for a full 300 x 360 radar frame
+    """
+    with tempfile.TemporaryDirectory() as folder:
+        grid = OccupancyGrid(folder)
+        dataTimeSlice = np.random.default_rng(0).random((300, 360)) < 0.01
+
+        start = time.perf_counter()
+        for i in range(scans):
+            grid.update(dataTimeSlice, 36.149727 + i * 1e-5, -115.334172, 10)
+        updateTime = (time.perf_counter() - start) / scans
+
+        start = time.perf_counter()
+        for i in range(scans):
+            grid.static_mask(dataTimeSlice, 36.149727 + i * 1e-5, -115.334172, 10)
+        maskTime = (time.perf_counter() - start) / scans
+
+        print(f"update: {updateTime * 1000:.2f} ms, static_mask: {maskTime * 1000:.2f} ms per scan, {grid}")
+
+
+def unit_test():
+    lat, lon = 36.149727, -115.334172
+    metersPerDegreeLat = math.radians(EARTH_RADIUS_IN_METERS)
+
+    with tempfile.TemporaryDirectory() as folder:
+        grid = OccupancyGrid(folder)
+
+        # A pole 50 meters straight ahead of a rider heading north, seen on 4 scans while riding 2 meters per scan.
+        # Like a car stopped in the lane it is never masked on the ride it is first seen on.
+        for scan in range(4):
+            riderLat = lat + 2 * scan / metersPerDegreeLat
+            dataTimeSlice = np.zeros((300, 360), dtype=bool)
+            dataTimeSlice[50 - 2 * scan, 270] = True
+            assert not grid.static_mask(dataTimeSlice, riderLat, lon, 0).any()
+            grid.update(dataTimeSlice, riderLat, lon, 0)
+        assert grid.stats["tilesCreated"] > 0 and len(os.listdir(folder)) == grid.stats["tilesCreated"] and grid.stats["maskedPoints"] == 0
+
+        poleX, poleY = grid.cells(np.array([50.0]), np.array([0.0]), lat, lon)
+        assert grid.log_odds(poleX, poleY)[0] == 0
+        assert grid.log_odds(poleX, poleY, ride=True)[0] == np.float32(4 * LOG_ODDS_HIT).clip(LOG_ODDS_MIN, LOG_ODDS_MAX)
+        emptyX, emptyY = grid.cells(np.array([20.0]), np.array([20.0]), lat, lon)
+        assert grid.log_odds(emptyX, emptyY, ride=True)[0] < 0
+        grid.flush()
+        assert grid.log_odds(poleX, poleY)[0] == np.float32(4 * LOG_ODDS_HIT).clip(LOG_ODDS_MIN, LOG_ODDS_MAX)
+        assert not glob.glob(os.path.join(folder, "*" + RIDE_SUFFIX))
+
+        # On the next ride the pole is known from disk, also when approached heading east from its south west
+        grid = OccupancyGrid(folder)
+        riderLat = lat + 10 / metersPerDegreeLat
+        riderLon = lon - 30 / (metersPerDegreeLat * math.cos(math.radians(lat)))
+        poleTheta = 270 - round(math.degrees(math.atan2(30, 40))) + 90
+        dataTimeSlice = np.zeros((300, 360), dtype=bool)
+        dataTimeSlice[50, poleTheta] = True
+        dataTimeSlice[100, 270] = True
+        mask = grid.static_mask(dataTimeSlice, riderLat, riderLon, 90)
+        assert grid.stats["tileLoads"] > 0 and grid.stats["tilesCreated"] == 0
+        assert mask[50, poleTheta] and mask.sum() == 1
+
+        # Unseen tiles are unknown and are not created by lookups
+        farX, farY = grid.cells(np.array([0.0]), np.array([0.0]), lat + 1, lon)
+        assert grid.log_odds(farX, farY)[0] == 0 and grid.stats["tilesCreated"] == 0
+
+        # The evidence of a ride that crashed before flush() is merged when the grid is opened again
+        grid.update(dataTimeSlice, riderLat, riderLon, 90)
+        for tile in grid.tiles.values():
+            if tile is not None:
+                tile.flush()
+        grid = OccupancyGrid(folder)
+        assert grid.stats["ridesMerged"] == 1 and not glob.glob(os.path.join(folder, "*" + RIDE_SUFFIX))
+        print(grid)
+
+    print("All tests passed!")
+
+
+if __name__ == "__main__":
+    unit_test()
+    benchmark()
@@ -0,0 +1,330 @@
+#!/usr/bin/env python
+
+# Build the bike road network from local OpenStreetMap data when there is no coverage for osmnx
+# https://wiki.openstreetmap.org/wiki/Key:highway
+# https://osmnx.readthedocs.io/en/stable/user-reference.html#osmnx.graph.graph_from_point
+# https://docs.osmcode.org/pyosmium/latest/
+#
+# Regions are Overpass JSON responses (like the osmnx cache/ files, read through OverpassCache.py) or
+# .osm.pbf extracts. Ways pass the same tag filter osmnx uses for network_type="bike", every pair of
+# consecutive nodes becomes an edge like an unsimplified osmnx graph, and oneway ways only get their
+# forward edge. As the rider moves, regions whose bounds reach the area around the rider are added to
+# the one graph; OSM node IDs are shared between regions so roads crossing a region border join up,
+# and segments already in the graph are skipped.
+
+# Standard library imports not needing pip installs
+import os
+import re
+
+# 3rd party libraries
+import networkx as nx               # pip install networkx
+import numpy as np                  # pip install numpy
+
+# Internal libraries
+from GeoMath import bbox_from_point, haversine_distance_array
+from OverpassCache import OverpassData, load_overpass, overpass_json_files, parse_overpass_json
+from RoadNetworkCache import subset_graph
+
+DEFAULT_RADIUS_IN_METERS = 3200
+
+# Same way filter as osmnx network_type="bike", tag to regular expression the value must not match
+EXCLUDED_TAG_VALUES = {
+    "area": re.compile("yes"),
+    "access": re.compile("private"),
+    "highway": re.compile("abandoned|bus_guideway|construction|corridor|elevator|escalator|footway|motor|no|planned|platform|proposed|raceway|razed|steps"),
+    "bicycle": re.compile("no"),
+    "service": re.compile("private"),
+}
+
+# Way tags copied onto every edge, like osmnx.settings.useful_tags_way
+USEFUL_WAY_TAGS = ["bridge", "tunnel", "lanes", "ref", "name", "highway", "maxspeed", "service", "access", "area", "landuse", "width", "est_width", "junction", "surface", "cycleway"]
+
+ONEWAY_VALUES = {"yes", "true", "1", "-1", "reverse", "T", "F"}
+REVERSED_VALUES = {"-1", "reverse", "T"}
+
+
+def is_bike_way(tags: dict) -> bool:
+    """ True if a way belongs in the bike network, matching the osmnx network_type="bike" filter
+
+    Args:
+        tags (dict): OSM tags of the way.
+
+    Returns:
+        bool: True for ways a bike can use.
+    """
+    if "highway" not in tags:
+        return False
+
+    return not any(key in tags and pattern.search(tags[key]) for key, pattern in EXCLUDED_TAG_VALUES.items())
+
+
+def way_direction(tags: dict) -> tuple:
+    """ Whether a bike may only ride a way in one direction, and if that direction is against the node order
+
+    Args:
+        tags (dict): OSM tags of the way.
+
+    Returns:
+        tuple: (oneway, reversed) booleans.
+    """
+    # Contraflow cycle lanes make a oneway street two way for bikes
+    if tags.get("oneway:bicycle") == "no":
+        return (False, False)
+
+    oneway = tags.get("oneway")
+    if oneway in ONEWAY_VALUES:
+        return (True, oneway in REVERSED_VALUES)
+    if tags.get("junction") == "roundabout":
+        return (True, False)
+
+    return (False, False)
+
+
+def load_pbf(path: str) -> OverpassData:
+    """ Read a .osm.pbf extract into the same arrays as an Overpass response
+
+    Args:
+        path (str): Path of the .osm.pbf file.
+
+    Returns:
+        OverpassData: The nodes and highway ways of the extract.
+    """
+    import osmium                   # pip install osmium
+
+    elements = []
+
+    class Handler(osmium.SimpleHandler):
+
+        def node(self, node):
+            element = {"type": "node", "id": node.id, "lat": node.location.lat, "lon": node.location.lon}
+            if len(node.tags):
+                element["tags"] = {tag.k: tag.v for tag in node.tags}
+            elements.append(element)
+
+        def way(self, way):
+            if "highway" in way.tags:
+                elements.append({"type": "way", "id": way.id, "nodes": [node.ref for node in way.nodes], "tags": {tag.k: tag.v for tag in way.tags}})
+
+    Handler().apply_file(path, locations=False)
+
+    return parse_overpass_json({"elements": elements}, path)
+
+
+def load_region(path: str) -> OverpassData:
+    """ Load an Overpass JSON file or a .osm.pbf extract
+
+    Args:
+        path (str): Path of the region file.
+
+    Returns:
+        OverpassData: The region as arrays.
+    """
+    if path.endswith(".pbf"):
+        return load_pbf(path)
+
+    return load_overpass(path)
+
+
+def region_bounds(data: OverpassData) -> tuple:
+    """ Box around every node of a region
+
+    Args:
+        data (OverpassData): The region.
+
+    Returns:
+        tuple: (north, south, east, west) in degrees, or None for a region without nodes.
+    """
+    if len(data.nodeIds) == 0:
+        return None
+
+    latLon = np.asarray(data.nodeLatLon)
+    south, west = latLon.min(axis=0)
+    north, east = latLon.max(axis=0)
+
+    return (float(north), float(south), float(east), float(west))
+
+
+class OfflineRoadNetwork:
+
+    def __init__(self, sources: list = None):
+        """ Initialize an empty bike network over a set of local region files.
+
+        Args:
+            sources (list, optional): Overpass JSON and .osm.pbf paths. Defaults to the Overpass responses in cache/.
+        """
+        self.sources = list(overpass_json_files() if sources is None else sources)
+        self.graph = nx.MultiDiGraph(crs="epsg:4326", created_with="OfflineRoadNetwork")
+
+        # Path to region data and bounds, read on first use
+        self.regions = {}
+        self.bounds = {}
+
+        self.loadedSources = []
+        self.segments = set()
+
+        self.stats = {"regions": 0, "edgesAdded": 0, "edgesSkipped": 0}
+
+
+    def __str__(self):
+        return f"OfflineRoadNetwork(nodes={self.graph.number_of_nodes()}, edges={self.graph.number_of_edges()}, regions={len(self.loadedSources)}/{len(self.sources)}, stats={self.stats})"
+
+
+    def region(self, path: str) -> OverpassData:
+        if path not in self.regions:
+            self.regions[path] = load_region(path)
+            self.bounds[path] = region_bounds(self.regions[path])
+
+        return self.regions[path]
+
+
+    def update_position(self, lat: float, lon: float, radius: float = DEFAULT_RADIUS_IN_METERS) -> list:
+        """ Add every region that reaches the area around the rider and is not in the graph yet
+
+        Args:
+            lat (float): The latitude in degrees
+            lon (float): The longitude in degrees
+            radius (float, optional): Distance around the rider the graph must cover in meters. Defaults to 3200.
+
+        Returns:
+            list: Paths of the regions that were added.
+        """
+        north, south, east, west = bbox_from_point(lat, lon, radius)
+
+        added = []
+        for path in self.sources:
+            if path in self.loadedSources:
+                continue
+
+            data = self.region(path)
+            bounds = self.bounds[path]
+            if bounds is None or bounds[1] > north or bounds[0] < south or bounds[3] > east or bounds[2] < west:
+                continue
+
+            self.add_region(data)
+            self.loadedSources.append(path)
+            added.append(path)
+
+        return added
+
+
+    def add_region(self, data: OverpassData) -> int:
+        """ Add the bike ways of a region to the graph, joining it to the regions already added
+
+        Args:
+            data (OverpassData): The region.
+
+        Returns:
+            int: Number of edges added.
+        """
+        self.stats["regions"] += 1
+        wayNodeOffsets = np.asarray(data.wayNodeOffsets)
+        wayNodes = np.asarray(data.wayNodes)
+        nodeIds = np.asarray(data.nodeIds)
+        nodeLatLon = np.asarray(data.nodeLatLon)
+
+        # Segments of every bike way, with the lengths of all of them in one vectorized call
+        ways = [(index, data.way_tags(index)) for index in range(len(data.wayIds))]
+        ways = [(index, tags) for index, tags in ways if is_bike_way(tags)]
+        starts = np.concatenate([np.arange(wayNodeOffsets[index], wayNodeOffsets[index + 1] - 1) for index, _ in ways] or [np.zeros(0, dtype=np.int64)])
+        lengths = haversine_distance_array(nodeLatLon[wayNodes[starts], 0], nodeLatLon[wayNodes[starts], 1],
+                                           nodeLatLon[wayNodes[starts + 1], 0], nodeLatLon[wayNodes[starts + 1], 1])
+
+        edges = []
+        usedNodes = set()
+        segment = 0
+        for index, tags in ways:
+            wayId = int(data.wayIds[index])
+            oneway, reverse = way_direction(tags)
+            attributes = {key: tags[key] for key in USEFUL_WAY_TAGS if key in tags}
+            nodes = wayNodes[wayNodeOffsets[index]:wayNodeOffsets[index + 1]].tolist()
+
+            for position in range(len(nodes) - 1):
+                length = float(lengths[segment])
+                segment += 1
+                first, second = nodes[position], nodes[position + 1]
+                # Nodes missing from the response happen at the edge of a region, another region fills the gap
+                if first < 0 or second < 0:
+                    continue
+
+                u, v = int(nodeIds[first]), int(nodeIds[second])
+                directions = [(v, u, True)] if reverse else [(u, v, False)]
+                if not oneway:
+                    directions.append((v, u, True))
+
+                for fromNode, toNode, isReversed in directions:
+                    if (wayId, fromNode, toNode) in self.segments:
+                        self.stats["edgesSkipped"] += 1
+                        continue
+                    self.segments.add((wayId, fromNode, toNode))
+                    edges.append((fromNode, toNode, {"osmid": wayId, "oneway": oneway, "reversed": isReversed, "length": length, **attributes}))
+                    usedNodes.add(first)
+                    usedNodes.add(second)
+
+        for node in usedNodes:
+            nodeId = int(nodeIds[node])
+            if nodeId not in self.graph:
+                self.graph.add_node(nodeId, y=float(nodeLatLon[node, 0]), x=float(nodeLatLon[node, 1]))
+
+        self.graph.add_edges_from(edges)
+        self.stats["edgesAdded"] += len(edges)
+
+        return len(edges)
+
+
+def build_offline_road_network(mapCenter: tuple, radius: int = DEFAULT_RADIUS_IN_METERS, sources: list = None):
+    """ Offline version of BikeAutoPilot.build_road_network() using only local region files
+
+    Args:
+        mapCenter (tuple): The center point of the map in (latitude, longitude) format
+        radius (int, optional): The square radius of the map in meters. Defaults to 3200.
+        sources (list, optional): Overpass JSON and .osm.pbf paths. Defaults to the Overpass responses in cache/.
+
+    Returns:
+        networkx.MultiDiGraph: The bike network inside the box around mapCenter.
+    """
+    network = OfflineRoadNetwork(sources)
+    network.update_position(*mapCenter, radius)
+
+    return subset_graph(network.graph, mapCenter, radius)
+
+
+def unit_test():
+    assert is_bike_way({"highway": "residential"}) and is_bike_way({"highway": "cycleway"})
+    assert not is_bike_way({"highway": "motorway_link"}) and not is_bike_way({"highway": "footway"})
+    assert not is_bike_way({"highway": "residential", "bicycle": "no"}) and not is_bike_way({"building": "yes"})
+    assert way_direction({"oneway": "-1"}) == (True, True) and way_direction({"junction": "roundabout"}) == (True, False)
+    assert way_direction({"oneway": "yes", "oneway:bicycle": "no"}) == (False, False) and way_direction({"oneway": "no"}) == (False, False)
+
+    # Two ways sharing node 2, the oneway one only gets its forward edge
+    region = parse_overpass_json({"elements": [
+        {"type": "node", "id": 1, "lat": 36.0, "lon": -115.0},
+        {"type": "node", "id": 2, "lat": 36.001, "lon": -115.0},
+        {"type": "node", "id": 3, "lat": 36.001, "lon": -115.001},
+        {"type": "way", "id": 10, "nodes": [1, 2], "tags": {"highway": "residential", "name": "Tungsten Street"}},
+        {"type": "way", "id": 11, "nodes": [2, 3, 4], "tags": {"highway": "tertiary", "oneway": "yes"}},
+        {"type": "way", "id": 12, "nodes": [1, 3], "tags": {"highway": "steps"}},
+    ]})
+    network = OfflineRoadNetwork([])
+    assert network.add_region(region) == 3
+    assert sorted(network.graph.edges()) == [(1, 2), (2, 1), (2, 3)]
+    assert abs(network.graph.edges[1, 2, 0]["length"] - 111.2) < 0.1 and network.graph.edges[1, 2, 0]["name"] == "Tungsten Street"
+    assert network.add_region(region) == 0 and network.stats["edgesSkipped"] == 3
+
+    # Riding west adds the large cache/ region, riding into the smaller region inside it adds no new edges
+    sources = [path for path in overpass_json_files() if os.path.basename(path).startswith(("d1ca", "d2a8"))]
+    network = OfflineRoadNetwork(sources)
+    assert network.update_position(36.0, -114.0, 1000) == []
+    assert network.update_position(36.17, -115.30, 500) == [sources[1]]
+    edges = network.graph.number_of_edges()
+    assert network.update_position(36.144635, -115.326555, 3200) == [sources[0]]
+    assert network.graph.number_of_edges() == edges
+    assert len(max(nx.weakly_connected_components(network.graph), key=len)) > 10000
+
+    graph = build_offline_road_network((36.144635, -115.326555), 1000, sources)
+    north, south, east, west = bbox_from_point(36.144635, -115.326555, 1000)
+    assert graph.number_of_edges() > 0 and all(south <= data["y"] <= north and west <= data["x"] <= east for _, data in graph.nodes(data=True))
+    print("All tests passed!")
+
+
+if __name__ == "__main__":
+    unit_test()
@@ -0,0 +1,487 @@
+#!/usr/bin/env python
+
+# Fast loader for the Overpass API JSON responses that osmnx stores in cache/
+# https://wiki.openstreetmap.org/wiki/Overpass_API/Overpass_QL#JSON_output
+# https://numpy.org/doc/stable/reference/generated/numpy.load.html
+#
+# The first load parses the JSON once and writes a sibling <name>.overpass/ directory of .npy files:
+# node IDs (sorted) and lat/lon as arrays, the nodes of every way as CSR offsets into one index array,
+# and the tags as CSR (key, value) pairs pointing into one interned string table. Later loads
+# memory-map those arrays, so startup only pays for the pages it touches. meta.json records the size,
+# mtime and SHA-1 of the source JSON; when the JSON changes the binary form is rebuilt from it.
+
+# Standard library imports not needing pip installs
+import glob
+import hashlib
+import json
+import os
+import shutil
+import time
+
+# 3rd party libraries
+import numpy as np                  # pip install numpy
+
+FORMAT_VERSION = 1
+BINARY_SUFFIX = ".overpass"
+CACHE_FOLDER = os.path.join(os.path.dirname(os.path.abspath(__file__)), "cache")
+
+# Arrays written to the binary directory, one <name>.npy each
+ARRAY_NAMES = ["nodeIds", "nodeLatLon", "nodeTagOffsets", "nodeTags",
+               "wayIds", "wayNodeOffsets", "wayNodes", "wayTagOffsets", "wayTags",
+               "stringOffsets", "stringBytes"]
+
+
+class OverpassData:
+
+    def __init__(self, arrays: dict, sourcePath: str = None):
+        """ Wrap the arrays of one Overpass response, use load_overpass() to create one from a file.
+
+        Args:
+            arrays (dict): Array name from ARRAY_NAMES to NumPy array (or read only memory map).
+            sourcePath (str, optional): The JSON file the arrays came from. Defaults to None.
+        """
+        self.sourcePath = sourcePath
+        self.nodeIds = arrays["nodeIds"]                # int64, sorted so node_index() can binary search
+        self.nodeLatLon = arrays["nodeLatLon"]          # float64 (nodes x 2)
+        self.nodeTagOffsets = arrays["nodeTagOffsets"]  # int64 (nodes + 1)
+        self.nodeTags = arrays["nodeTags"]              # int32 (tags x 2) of (key, value) string indices
+        self.wayIds = arrays["wayIds"]                  # int64
+        self.wayNodeOffsets = arrays["wayNodeOffsets"]  # int64 (ways + 1)
+        self.wayNodes = arrays["wayNodes"]              # int32 node indices, -1 for nodes not in the response
+        self.wayTagOffsets = arrays["wayTagOffsets"]    # int64 (ways + 1)
+        self.wayTags = arrays["wayTags"]                # int32 (tags x 2)
+        self.stringOffsets = arrays["stringOffsets"]    # int64 (strings + 1) into stringBytes
+        self.stringBytes = arrays["stringBytes"]        # uint8 UTF-8 text of every string back to back
+
+        self._strings = None
+
+
+    def __str__(self):
+        return f"OverpassData(sourcePath={self.sourcePath}, nodes={len(self.nodeIds)}, ways={len(self.wayIds)}, strings={len(self.stringOffsets) - 1})"
+
+
+    @property
+    def strings(self) -> list:
+        """ The interned string table, decoded on first use
+        """
+        if self._strings is None:
+            text = self.stringBytes.tobytes()
+            offsets = self.stringOffsets.tolist()
+            self._strings = [text[start:end].decode("utf-8") for start, end in zip(offsets[:-1], offsets[1:])]
+
+        return self._strings
+
+
+    def node_index(self, nodeIds) -> np.ndarray:
+        """ Positions of OSM node IDs in the node arrays
+
+        Args:
+            nodeIds (array_like): OSM node IDs.
+
+        Returns:
+            np.ndarray: int64 indices, -1 for IDs not in the response.
+        """
+        return search_sorted_ids(self.nodeIds, np.asarray(nodeIds, dtype=np.int64))
+
+
+    def node_tags(self, index: int) -> dict:
+        """ Tags of the node at a position of the node arrays
+
+        Args:
+            index (int): Position in nodeIds.
+
+        Returns:
+            dict: Tag key to value.
+        """
+        return self.tags(self.nodeTags, self.nodeTagOffsets, index)
+
+
+    def way_tags(self, index: int) -> dict:
+        """ Tags of the way at a position of the way arrays
+
+        Args:
+            index (int): Position in wayIds.
+
+        Returns:
+            dict: Tag key to value.
+        """
+        return self.tags(self.wayTags, self.wayTagOffsets, index)
+
+
+    def way_nodes(self, index: int) -> np.ndarray:
+        """ Node indices along a way
+
+        Args:
+            index (int): Position in wayIds.
+
+        Returns:
+            np.ndarray: int32 positions in nodeIds, -1 for nodes not in the response.
+        """
+        return self.wayNodes[self.wayNodeOffsets[index]:self.wayNodeOffsets[index + 1]]
+
+
+    def way_latlon(self, index: int) -> np.ndarray:
+        """ GPS points along a way, skipping nodes that are not in the response
+
+        Args:
+            index (int): Position in wayIds.
+
+        Returns:
+            np.ndarray: float64 (points x 2) of (lat, lon).
+        """
+        nodes = self.way_nodes(index)
+        return self.nodeLatLon[nodes[nodes >= 0]]
+
+
+    def tags(self, pairs: np.ndarray, offsets: np.ndarray, index: int) -> dict:
+        strings = self.strings
+        return {strings[key]: strings[value] for key, value in pairs[offsets[index]:offsets[index + 1]].tolist()}
+
+
+    def to_json(self) -> dict:
+        """ Rebuild an Overpass JSON response, for code that needs the original {"elements": [...]} layout
+
+        Returns:
+            dict: Overpass JSON with nodes followed by ways.
+        """
+        elements = []
+        latLon = self.nodeLatLon.tolist()
+        for index, nodeId in enumerate(self.nodeIds.tolist()):
+            element = {"type": "node", "id": nodeId, "lat": latLon[index][0], "lon": latLon[index][1]}
+            if self.nodeTagOffsets[index + 1] > self.nodeTagOffsets[index]:
+                element["tags"] = self.node_tags(index)
+            elements.append(element)
+
+        nodeIds = self.nodeIds.tolist()
+        for index, wayId in enumerate(self.wayIds.tolist()):
+            element = {"type": "way", "id": wayId, "nodes": [nodeIds[node] for node in self.way_nodes(index).tolist() if node >= 0]}
+            if self.wayTagOffsets[index + 1] > self.wayTagOffsets[index]:
+                element["tags"] = self.way_tags(index)
+            elements.append(element)
+
+        return {"elements": elements}
+
+
+def search_sorted_ids(sortedIds: np.ndarray, ids: np.ndarray) -> np.ndarray:
+    """ Vectorized lookup of IDs in a sorted ID array
+
+    Args:
+        sortedIds (np.ndarray): Sorted int64 IDs.
+        ids (np.ndarray): int64 IDs to find.
+
+    Returns:
+        np.ndarray: int64 positions in sortedIds, -1 for IDs that are missing.
+    """
+    positions = np.searchsorted(sortedIds, ids)
+    clipped = np.minimum(positions, max(len(sortedIds) - 1, 0))
+    found = (positions < len(sortedIds)) & (sortedIds[clipped] == ids) if len(sortedIds) else np.zeros(len(ids), dtype=bool)
+
+    return np.where(found, positions, -1)
+
+
+def parse_overpass_json(response: dict, sourcePath: str = None) -> OverpassData:
+    """ Convert a parsed Overpass JSON response to arrays, elements other than nodes and ways are ignored
+
+    Args:
+        response (dict): Overpass JSON with an "elements" list.
+        sourcePath (str, optional): The file the response was read from. Defaults to None.
+
+    Returns:
+        OverpassData: The response as arrays.
+    """
+    stringIndex = {}
+
+    def intern_tags(tags: dict) -> list:
+        return [(stringIndex.setdefault(key, len(stringIndex)), stringIndex.setdefault(value, len(stringIndex))) for key, value in tags.items()]
+
+    nodes = []
+    ways = []
+    for element in response.get("elements", []):
+        if element["type"] == "node":
+            nodes.append(element)
+        elif element["type"] == "way":
+            ways.append(element)
+
+    # Nodes sorted by ID so later lookups are a binary search
+    nodes.sort(key=lambda node: node["id"])
+    nodeIds = np.array([node["id"] for node in nodes], dtype=np.int64)
+    nodeLatLon = np.array([(node["lat"], node["lon"]) for node in nodes], dtype=np.float64).reshape(-1, 2)
+    nodeTags = [intern_tags(node.get("tags", {})) for node in nodes]
+
+    wayIds = np.array([way["id"] for way in ways], dtype=np.int64)
+    wayNodeLists = [way.get("nodes", []) for way in ways]
+    wayNodeOffsets = np.zeros(len(ways) + 1, dtype=np.int64)
+    np.cumsum([len(wayNodes) for wayNodes in wayNodeLists], out=wayNodeOffsets[1:])
+    wayNodeIds = np.fromiter((nodeId for wayNodes in wayNodeLists for nodeId in wayNodes), dtype=np.int64, count=int(wayNodeOffsets[-1]))
+    wayTags = [intern_tags(way.get("tags", {})) for way in ways]
+
+    nodeTagOffsets, nodeTagPairs = pack_tags(nodeTags)
+    wayTagOffsets, wayTagPairs = pack_tags(wayTags)
+
+    encoded = [string.encode("utf-8") for string in stringIndex]
+    stringOffsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+    np.cumsum([len(string) for string in encoded], out=stringOffsets[1:])
+
+    return OverpassData({
+        "nodeIds": nodeIds,
+        "nodeLatLon": nodeLatLon,
+        "nodeTagOffsets": nodeTagOffsets,
+        "nodeTags": nodeTagPairs,
+        "wayIds": wayIds,
+        "wayNodeOffsets": wayNodeOffsets,
+        "wayNodes": search_sorted_ids(nodeIds, wayNodeIds).astype(np.int32),
+        "wayTagOffsets": wayTagOffsets,
+        "wayTags": wayTagPairs,
+        "stringOffsets": stringOffsets,
+        "stringBytes": np.frombuffer(b"".join(encoded), dtype=np.uint8),
+    }, sourcePath)
+
+
+def pack_tags(tagLists: list) -> tuple:
+    """ Pack per element lists of (key, value) string indices into CSR offsets and one pair array
+
+    Args:
+        tagLists (list): One list of (key, value) pairs per element.
+
+    Returns:
+        tuple: (int64 offsets with one more entry than tagLists, int32 (pairs x 2) array)
+    """
+    offsets = np.zeros(len(tagLists) + 1, dtype=np.int64)
+    np.cumsum([len(tags) for tags in tagLists], out=offsets[1:])
+    pairs = np.array([pair for tags in tagLists for pair in tags], dtype=np.int32).reshape(-1, 2)
+
+    return offsets, pairs
+
+
+def binary_path(jsonPath: str) -> str:
+    """ Directory the binary form of an Overpass JSON file is stored in, next to the JSON file
+
+    Args:
+        jsonPath (str): Path of the Overpass JSON file.
+
+    Returns:
+        str: The .overpass directory path.
+    """
+    return os.path.splitext(jsonPath)[0] + BINARY_SUFFIX
+
+
+def file_sha1(path: str) -> str:
+    hasher = hashlib.sha1()
+    with open(path, "rb") as file:
+        for block in iter(lambda: file.read(1024 * 1024), b""):
+            hasher.update(block)
+
+    return hasher.hexdigest()
+
+
+def source_stamp(jsonPath: str) -> dict:
+    status = os.stat(jsonPath)
+    return {"size": status.st_size, "mtimeNs": status.st_mtime_ns}
+
+
+def write_binary(data: OverpassData, jsonPath: str, sha1: str = None):
+    """ Store the arrays of a response next to its JSON file, replacing an older binary form
+
+    Args:
+        data (OverpassData): The parsed response.
+        jsonPath (str): Path of the Overpass JSON file the data came from.
+        sha1 (str, optional): SHA-1 of the JSON file if already known. Defaults to None.
+    """
+    path = binary_path(jsonPath)
+    temporaryPath = f"{path}.tmp{os.getpid()}"
+    shutil.rmtree(temporaryPath, ignore_errors=True)
+    os.makedirs(temporaryPath)
+
+    for name in ARRAY_NAMES:
+        np.save(os.path.join(temporaryPath, f"{name}.npy"), getattr(data, name))
+
+    meta = {"version": FORMAT_VERSION, "sha1": sha1 or file_sha1(jsonPath), **source_stamp(jsonPath)}
+    with open(os.path.join(temporaryPath, "meta.json"), "w") as file:
+        json.dump(meta, file)
+
+    # Swap in the finished directory so a crash never leaves a half written binary form behind
+    shutil.rmtree(path, ignore_errors=True)
+    os.replace(temporaryPath, path)
+
+
+def read_binary(jsonPath: str) -> OverpassData:
+    """ Memory-map the binary form of an Overpass JSON file if it still matches the JSON file
+
+    Args:
+        jsonPath (str): Path of the Overpass JSON file.
+
+    Returns:
+        OverpassData: The memory mapped arrays, or None if the binary form is missing or out of date.
+    """
+    path = binary_path(jsonPath)
+    try:
+        with open(os.path.join(path, "meta.json")) as file:
+            meta = json.load(file)
+    except (OSError, ValueError):
+        return None
+
+    if meta.get("version") != FORMAT_VERSION:
+        return None
+
+    # Size and mtime unchanged is trusted, otherwise only the content hash decides
+    stamp = source_stamp(jsonPath)
+    if stamp["size"] != meta.get("size"):
+        return None
+    if stamp["mtimeNs"] != meta.get("mtimeNs"):
+        if file_sha1(jsonPath) != meta.get("sha1"):
+            return None
+        meta.update(stamp)
+        with open(os.path.join(path, "meta.json"), "w") as file:
+            json.dump(meta, file)
+
+    try:
+        arrays = {name: np.load(os.path.join(path, f"{name}.npy"), mmap_mode="r") for name in ARRAY_NAMES}
+    except (OSError, ValueError):
+        return None
+
+    return OverpassData(arrays, jsonPath)
+
+
+def load_overpass(jsonPath: str, writeBinary: bool = True) -> OverpassData:
+    """ Load an Overpass JSON file, memory-mapping its binary form when it is up to date
+
+    Args:
+        jsonPath (str): Path of the Overpass JSON file.
+        writeBinary (bool, optional): Write the binary form after parsing the JSON. Defaults to True.
+
+    Returns:
+        OverpassData: The response as arrays.
+    """
+    data = read_binary(jsonPath)
+    if data is not None:
+        return data
+
+    with open(jsonPath, "rb") as file:
+        content = file.read()
+    data = parse_overpass_json(json.loads(content), jsonPath)
+
+    if writeBinary:
+        try:
+            write_binary(data, jsonPath, hashlib.sha1(content).hexdigest())
+        except OSError as e:
+            print(f"Error writing binary form of {jsonPath}: {e}")
+
+    return data
+
+
+def overpass_json_files(folder: str = CACHE_FOLDER) -> list:
+    """ Overpass JSON responses in a folder, like the osmnx cache/
+
+    Args:
+        folder (str, optional): Folder to search. Defaults to cache/ next to this file.
+
+    Returns:
+        list: Sorted JSON file paths.
+    """
+    return sorted(glob.glob(os.path.join(folder, "*.json")))
+
+
+def benchmark(folder: str = CACHE_FOLDER, mapCenter: tuple = (36.144635, -115.326555), radius: int = 3000):
+    """ Print the time to load every Overpass response in a folder, and to build the road network with osmnx and from the memory mapped arrays
+
+    Args:
+        folder (str, optional): Folder to search. Defaults to cache/ next to this file.
+        mapCenter (tuple, optional): (lat, lon) center of the road network. Defaults to the BikeAutoPilot test ride.
+        radius (int, optional): Square radius of the road network in meters. Defaults to 3000.
+    """
+    paths = overpass_json_files(folder)
+
+    start = time.perf_counter()
+    for path in paths:
+        with open(path) as file:
+            json.load(file)
+    jsonTime = time.perf_counter() - start
+
+    for path in paths:
+        load_overpass(path)
+
+    start = time.perf_counter()
+    for path in paths:
+        data = load_overpass(path)
+        data.way_latlon(len(data.wayIds) - 1)
+    binaryTime = time.perf_counter() - start
+
+    print(f"Time to load {len(paths)} Overpass responses: json.load {jsonTime * 1000:.1f} ms, memory mapped arrays {binaryTime * 1000:.1f} ms")
+
+    # What the rider waits for: build_road_network(center, 3000) through osmnx against offline=True through these arrays
+    try:
+        from BikeAutoPilot import build_road_network
+    except ImportError as e:
+        print(f"BikeAutoPilot.build_road_network() unavailable ({e}), timing OfflineRoadNetwork.build_offline_road_network() only")
+        from OfflineRoadNetwork import build_offline_road_network
+        build_road_network = lambda center, dist, offline: build_offline_road_network(center, dist)
+        modes = [True]
+    else:
+        modes = [False, True]
+
+    for offline in modes:
+        start = time.perf_counter()
+        graph = build_road_network(mapCenter, radius, offline=offline)
+        buildTime = time.perf_counter() - start
+        print(f"build_road_network({mapCenter}, {radius}{', offline=True' if offline else ''}): {buildTime * 1000:.1f} ms for {len(graph)} nodes and {graph.number_of_edges()} edges")
+
+
+def unit_test():
+    import tempfile
+
+    response = {"version": 0.6, "elements": [
+        {"type": "node", "id": 30, "lat": 36.1, "lon": -115.3, "tags": {"highway": "traffic_signals"}},
+        {"type": "node", "id": 10, "lat": 36.0, "lon": -115.1},
+        {"type": "node", "id": 20, "lat": 36.2, "lon": -115.2},
+        {"type": "way", "id": 5, "nodes": [10, 20, 30, 99], "tags": {"highway": "residential", "name": "Silk Tassel Drive"}},
+        {"type": "way", "id": 6, "nodes": [30, 10]},
+        {"type": "relation", "id": 7, "members": []},
+    ]}
+
+    data = parse_overpass_json(response)
+    assert data.nodeIds.tolist() == [10, 20, 30]
+    assert data.way_nodes(0).tolist() == [0, 1, 2, -1]
+    assert data.way_latlon(0).tolist() == [[36.0, -115.1], [36.2, -115.2], [36.1, -115.3]]
+    assert data.way_tags(0) == {"highway": "residential", "name": "Silk Tassel Drive"}
+    assert data.node_tags(2) == {"highway": "traffic_signals"} and data.node_tags(0) == {} and data.way_tags(1) == {}
+    assert data.node_index([20, 11, 30]).tolist() == [1, -1, 2]
+    assert len(data.to_json()["elements"]) == 5
+
+    with tempfile.TemporaryDirectory() as folder:
+        jsonPath = os.path.join(folder, "response.json")
+        with open(jsonPath, "w") as file:
+            json.dump(response, file)
+
+        # The first load writes the binary form, the second memory-maps it
+        assert read_binary(jsonPath) is None
+        load_overpass(jsonPath)
+        mapped = read_binary(jsonPath)
+        assert isinstance(mapped.nodeIds, np.memmap)
+        assert mapped.to_json() == data.to_json()
+
+        # A touched but unchanged file keeps the binary form, a changed file falls back to the JSON
+        os.utime(jsonPath, ns=(0, 0))
+        assert read_binary(jsonPath) is not None
+        response["elements"][1]["lat"] = 35.0
+        with open(jsonPath, "w") as file:
+            json.dump(response, file)
+        assert read_binary(jsonPath) is None
+        assert load_overpass(jsonPath).nodeLatLon[0, 0] == 35.0
+        assert read_binary(jsonPath).nodeLatLon[0, 0] == 35.0
+
+    # Every bundled response survives the round trip through the arrays
+    for path in overpass_json_files():
+        with open(path) as file:
+            original = json.load(file)
+        data = parse_overpass_json(original, path)
+        ways = [element for element in original["elements"] if element["type"] == "way"]
+        assert data.wayIds.tolist() == [way["id"] for way in ways]
+        assert all(data.way_tags(index) == way.get("tags", {}) for index, way in enumerate(ways))
+        assert (data.way_nodes(len(ways) - 1) >= 0).all()
+
+    print("All tests passed!")
+
+
+if __name__ == "__main__":
+    unit_test()
+    benchmark()
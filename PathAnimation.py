@@ -0,0 +1,379 @@
+#!/usr/bin/env python
+
+# Draw the rider moving over the road network without redrawing the map every frame
+# https://matplotlib.org/stable/users/explain/animations/blitting.html
+# https://en.wikipedia.org/wiki/Ramer%E2%80%93Douglas%E2%80%93Peucker_algorithm
+#
+# The graph is projected once to local meters (cached per graph) and drawn as one LineCollection. The
+# rendered map is kept as the blitting background, so a frame only restores it and draws the dot and
+# the trail. A whole path is first decimated with Douglas-Peucker to the size of one screen pixel for
+# the trail, while the dot moves along the decimated line a fixed number of pixels per frame, so long
+# straight stretches still play smoothly. Live positions from a generator only extend the trail once
+# they moved a pixel away from its end.
+
+# Standard library imports not needing pip installs
+import math
+import time
+import weakref
+
+# 3rd party libraries
+import numpy as np                  # pip install numpy
+
+# Internal libraries
+from GeoMath import EARTH_RADIUS_IN_METERS
+from RoadNetworkCache import node_latlon
+
+DEFAULT_TOLERANCE_IN_PIXELS = 1.0
+DEFAULT_INTERVAL_IN_SECONDS = 0.15
+DEFAULT_STEP_IN_PIXELS = 4.0
+
+# One projection and one animator per graph object, built on first use
+projections = weakref.WeakKeyDictionary()
+animators = weakref.WeakKeyDictionary()
+
+
+class GraphProjection:
+
+    def __init__(self, graph):
+        """ Project the nodes and edges of a road network graph to local meters around its center.
+
+        Args:
+            graph (networkx.MultiDiGraph): Graph from BikeAutoPilot.build_road_network(), projected graphs need lat/lon on their nodes.
+        """
+        latLon = {}
+        for node, data in graph.nodes(data=True):
+            latLon[node] = node_latlon(graph, data)
+            if latLon[node] is None:
+                raise ValueError(f"Node {node} has no GPS location")
+
+        lats, lons = np.array(list(latLon.values())).reshape(-1, 2).T
+        self.lat0 = float((lats.min() + lats.max()) / 2) if len(lats) else 0.0
+        self.lon0 = float((lons.min() + lons.max()) / 2) if len(lons) else 0.0
+        self.metersPerDegreeLat = math.radians(1) * EARTH_RADIUS_IN_METERS
+        self.metersPerDegreeLon = self.metersPerDegreeLat * math.cos(math.radians(self.lat0))
+
+        # Both directions of a two way street are drawn once, curved osmnx edges keep their shape
+        unprojected = str(graph.graph.get("crs", "epsg:4326")).lower() in ("epsg:4326", "wgs84")
+        segments = []
+        drawn = set()
+        for u, v, data in graph.edges(data=True):
+            if (v, u) in drawn or (u, v) in drawn:
+                continue
+            drawn.add((u, v))
+            if unprojected and "geometry" in data:
+                lonLat = np.asarray(data["geometry"].coords)
+            else:
+                lonLat = np.array([latLon[u][::-1], latLon[v][::-1]])
+            x, y = self.project(lonLat[:, 1], lonLat[:, 0])
+            points = np.column_stack([x, y])
+            segments.extend(np.stack([points[:-1], points[1:]], axis=1))
+
+        self.segments = np.array(segments).reshape(-1, 2, 2)
+
+
+    def __str__(self):
+        return f"GraphProjection(center=({self.lat0}, {self.lon0}), segments={len(self.segments)})"
+
+
+    def project(self, lat, lon) -> tuple:
+        """ Local meters east and north of the graph center
+
+        Args:
+            lat (array_like): Latitudes in degrees
+            lon (array_like): Longitudes in degrees
+
+        Returns:
+            tuple: (x, y) in meters.
+        """
+        return ((np.asarray(lon, dtype=float) - self.lon0) * self.metersPerDegreeLon, (np.asarray(lat, dtype=float) - self.lat0) * self.metersPerDegreeLat)
+
+
+def graph_projection(graph) -> GraphProjection:
+    """ The GraphProjection of a graph, built on the first call and reused for as long as the graph exists
+
+    Args:
+        graph (networkx.MultiDiGraph): Road network graph.
+
+    Returns:
+        GraphProjection: The projection of the graph.
+    """
+    projection = projections.get(graph)
+    if projection is None:
+        projection = GraphProjection(graph)
+        projections[graph] = projection
+
+    return projection
+
+
+def douglas_peucker(points: np.ndarray, tolerance: float) -> np.ndarray:
+    """ Points of a polyline to keep so no dropped point is further than tolerance from the simplified line
+
+    Args:
+        points (np.ndarray): (points x 2) polyline.
+        tolerance (float): Largest allowed distance in the units of points.
+
+    Returns:
+        np.ndarray: Sorted indices of the points to keep, always including the first and last one.
+    """
+    if len(points) <= 2:
+        return np.arange(len(points))
+
+    keep = np.zeros(len(points), dtype=bool)
+    keep[[0, -1]] = True
+
+    # Explicit stack instead of recursion, long GPS tracks would overflow Python's recursion limit
+    stack = [(0, len(points) - 1)]
+    while stack:
+        first, last = stack.pop()
+        if last - first < 2:
+            continue
+
+        start = points[first]
+        direction = points[last] - start
+        relative = points[first + 1:last] - start
+        length = math.hypot(*direction)
+        if length == 0:
+            distances = np.hypot(relative[:, 0], relative[:, 1])
+        else:
+            distances = np.abs(direction[0] * relative[:, 1] - direction[1] * relative[:, 0]) / length
+
+        farthest = int(np.argmax(distances))
+        if distances[farthest] > tolerance:
+            split = first + 1 + farthest
+            keep[split] = True
+            stack.append((first, split))
+            stack.append((split, last))
+
+    return np.flatnonzero(keep)
+
+
+class PathAnimator:
+
+    def __init__(self, graph, figsize: tuple = (8, 8), dpi: int = 100, tolerancePixels: float = DEFAULT_TOLERANCE_IN_PIXELS):
+        """ Draw the road network once and prepare the animated dot and trail.
+
+        Args:
+            graph (networkx.MultiDiGraph): Road network graph.
+            figsize (tuple, optional): Figure size in inches. Defaults to (8, 8).
+            dpi (int, optional): Pixels per inch. Defaults to 100.
+            tolerancePixels (float, optional): Largest error of the decimated trail on screen. Defaults to 1 pixel.
+        """
+        import matplotlib.pyplot as plt                      # pip install matplotlib
+        from matplotlib.collections import LineCollection
+
+        self.projection = graph_projection(graph)
+        self.tolerancePixels = tolerancePixels
+
+        self.figure, self.ax = plt.subplots(figsize=figsize, dpi=dpi, facecolor="#111111")
+        self.ax.set_facecolor("#111111")
+        self.ax.add_collection(LineCollection(self.projection.segments, colors="#999999", linewidths=1))
+        self.ax.set_aspect("equal")
+        self.ax.autoscale_view()
+        self.ax.set_axis_off()
+
+        self.trail, = self.ax.plot([], [], "-", color="#ff6666", linewidth=2, animated=True)
+        self.dot, = self.ax.plot([], [], "ro", markersize=8, animated=True)
+        self.trailX = []
+        self.trailY = []
+
+        # Captured after every full draw, a resized window renders the map again once
+        self.background = None
+        self.figure.canvas.mpl_connect("draw_event", self.on_draw)
+
+        self.stats = {"backgroundRenders": 0, "frames": 0, "pointsIn": 0, "pointsKept": 0}
+
+
+    def __str__(self):
+        return f"PathAnimator(projection={self.projection}, stats={self.stats})"
+
+
+    def on_draw(self, event):
+        self.background = self.figure.canvas.copy_from_bbox(self.figure.bbox)
+        self.stats["backgroundRenders"] += 1
+
+
+    def meters_per_pixel(self) -> float:
+        """ Map meters covered by one screen pixel at the current zoom
+
+        Returns:
+            float: Meters per pixel.
+        """
+        left, right = self.ax.get_xlim()
+        return abs(right - left) / max(self.ax.get_window_extent().width, 1)
+
+
+    def decimate(self, path_latlng: list) -> tuple:
+        """ Project a GPS path and drop the points that would not move the drawn line by a pixel
+
+        Args:
+            path_latlng (list): (lat, lon) points.
+
+        Returns:
+            tuple: (x, y) arrays of the points to draw.
+        """
+        latLon = np.asarray(path_latlng, dtype=float).reshape(-1, 2)
+        x, y = self.projection.project(latLon[:, 0], latLon[:, 1])
+        keep = douglas_peucker(np.column_stack([x, y]), self.tolerancePixels * self.meters_per_pixel())
+
+        return x[keep], y[keep]
+
+
+    def reset(self):
+        """ Clear the trail before a new path
+        """
+        self.trailX = []
+        self.trailY = []
+
+
+    def draw_frame(self, x: float, y: float):
+        """ Move the dot by restoring the cached map and drawing only the dot and trail
+
+        Args:
+            x (float): Meters east of the graph center.
+            y (float): Meters north of the graph center.
+        """
+        canvas = self.figure.canvas
+        if self.background is None:
+            canvas.draw()
+
+        canvas.restore_region(self.background)
+        self.trail.set_data(self.trailX, self.trailY)
+        self.dot.set_data([x], [y])
+        self.ax.draw_artist(self.trail)
+        self.ax.draw_artist(self.dot)
+        canvas.blit(self.figure.bbox)
+        canvas.flush_events()
+        self.stats["frames"] += 1
+
+
+    def play(self, path_latlng: list, interval: float = DEFAULT_INTERVAL_IN_SECONDS, stepPixels: float = DEFAULT_STEP_IN_PIXELS) -> int:
+        """ Animate a whole path, the trail decimated to the screen resolution and the dot moving at a steady pace
+
+        Args:
+            path_latlng (list): (lat, lon) points.
+            interval (float, optional): Seconds between frames. Defaults to 0.15.
+            stepPixels (float, optional): Screen pixels the dot moves along the path every frame. Defaults to 4.
+
+        Returns:
+            int: Number of frames drawn.
+        """
+        if stepPixels <= 0:
+            raise ValueError(f"Step must be more than 0 pixels, not {stepPixels}")
+
+        self.reset()
+        x, y = self.decimate(path_latlng)
+        self.stats["pointsIn"] += len(path_latlng)
+        self.stats["pointsKept"] += len(x)
+        if len(x) == 0:
+            return 0
+
+        # Resample the decimated line by distance, the trail ends at the dot and holds the vertices passed
+        travelled = np.concatenate(([0.0], np.cumsum(np.hypot(np.diff(x), np.diff(y)))))
+        step = stepPixels * self.meters_per_pixel()
+        distances = np.append(np.arange(0.0, travelled[-1], step), travelled[-1])
+        passed = np.searchsorted(travelled, distances, side="right")
+        dotX, dotY = np.interp(distances, travelled, x), np.interp(distances, travelled, y)
+
+        for count, pointX, pointY in zip(passed.tolist(), dotX.tolist(), dotY.tolist()):
+            self.trailX = x[:count].tolist() + [pointX]
+            self.trailY = y[:count].tolist() + [pointY]
+            self.draw_frame(pointX, pointY)
+            if interval:
+                time.sleep(interval)
+
+        return len(distances)
+
+
+    def stream(self, positions, interval: float = 0.0) -> int:
+        """ Animate positions as they arrive, like GPS fixes from a generator
+
+        Args:
+            positions (iterable): (lat, lon) points, consumed one at a time.
+            interval (float, optional): Seconds to wait after each frame. Defaults to 0.
+
+        Returns:
+            int: Number of frames drawn.
+        """
+        self.reset()
+        frames = 0
+        for lat, lon in positions:
+            x, y = (float(value) for value in self.projection.project(lat, lon))
+            self.stats["pointsIn"] += 1
+
+            # Only points a pixel away from the end of the trail extend it, the dot always moves
+            tolerance = self.tolerancePixels * self.meters_per_pixel()
+            if not self.trailX or math.hypot(x - self.trailX[-1], y - self.trailY[-1]) > tolerance:
+                self.trailX.append(x)
+                self.trailY.append(y)
+                self.stats["pointsKept"] += 1
+
+            self.draw_frame(x, y)
+            frames += 1
+            if interval:
+                time.sleep(interval)
+
+        return frames
+
+
+def path_animator(graph) -> PathAnimator:
+    """ The PathAnimator of a graph, reusing the rendered map for as long as the graph exists
+
+    Args:
+        graph (networkx.MultiDiGraph): Road network graph.
+
+    Returns:
+        PathAnimator: The animator of the graph.
+    """
+    animator = animators.get(graph)
+    if animator is None:
+        animator = PathAnimator(graph)
+        animators[graph] = animator
+
+    return animator
+
+
+def unit_test():
+    import matplotlib
+    matplotlib.use("Agg")
+    import networkx as nx
+
+    # A straight line with tiny GPS noise collapses to its end points, a corner survives
+    line = np.column_stack([np.arange(100.0), np.tile([0.0, 0.05], 50)])
+    assert douglas_peucker(line, 0.1).tolist() == [0, 99]
+    corner = np.array([[0, 0], [5, 0.01], [10, 0], [10, 5], [10, 10]], dtype=float)
+    assert douglas_peucker(corner, 0.1).tolist() == [0, 2, 4]
+    assert douglas_peucker(line[:2], 0.1).tolist() == [0, 1]
+
+    graph = nx.MultiDiGraph(crs="epsg:4326")
+    for node, (lat, lon) in enumerate([(36.144, -115.327), (36.144, -115.325), (36.146, -115.325)]):
+        graph.add_node(node, y=lat, x=lon)
+    for u, v in [(0, 1), (1, 0), (1, 2)]:
+        graph.add_edge(u, v, length=1.0)
+
+    projection = graph_projection(graph)
+    assert graph_projection(graph) is projection and len(projection.segments) == 2
+
+    animator = path_animator(graph)
+    assert path_animator(graph) is animator
+
+    # 4000 fixes along the two streets keep a 3 point trail, the dot still moves 4 pixels per frame
+    path = [(36.144, -115.327 + 0.002 * t) for t in np.linspace(0, 1, 2000)] + [(36.144 + 0.002 * t, -115.325) for t in np.linspace(0, 1, 2000)]
+    dots = []
+    drawFrame = animator.draw_frame
+    animator.draw_frame = lambda x, y: (dots.append((x, y)), drawFrame(x, y))
+    frames = animator.play(path, interval=0)
+    del animator.draw_frame
+    steps = np.hypot(*np.diff(np.array(dots), axis=0).T)
+    assert animator.stats["pointsKept"] == 3 and len(animator.trailX) == 4 and frames == len(dots) > 200
+    assert steps.max() <= 4.0 * animator.meters_per_pixel() + 1e-6 and np.allclose(dots[-1], animator.projection.project(*path[-1]))
+    assert animator.stats["backgroundRenders"] == 1 and animator.stats["frames"] == frames
+
+    # Streaming draws every fix but only extends the trail once a fix moved a pixel
+    frames = animator.stream((point for point in path), interval=0)
+    assert frames == 4000 and len(animator.trailX) < 4000 // 2
+    assert animator.stats["backgroundRenders"] == 1
+    print("All tests passed!")
+
+
+if __name__ == "__main__":
+    unit_test()
@@ -0,0 +1,171 @@
+#!/usr/bin/env python
+
+# Polar <-> Cartesian conversion for the radar's 360 one degree angular bins
+# https://en.wikipedia.org/wiki/Polar_coordinate_system#Converting_between_polar_and_Cartesian_coordinates
+# https://numpy.org/doc/stable/reference/ufuncs.html#output-type-determination
+#
+# Radar theta is always one of the same 360 integers, so cos and sin are computed once into tables and
+# every conversion of integer angles is a table lookup times the radius. Conversions take optional out
+# arrays, so a caller converting the same size of point set every frame allocates nothing. Angles that
+# are not whole degrees fall back to np.cos/np.sin. Theta is in degrees counter-clockwise from +x like
+# Radar.py, and the full (radius, theta) grid of a radar range is cached as Cartesian arrays.
+
+# Standard library imports not needing pip installs
+from functools import lru_cache
+
+# 3rd party libraries
+import numpy as np                  # pip install numpy
+
+FULL_CIRCLE = 360
+
+COS_TABLE = np.cos(np.radians(np.arange(FULL_CIRCLE)))
+SIN_TABLE = np.sin(np.radians(np.arange(FULL_CIRCLE)))
+
+# Exact values on the axes, so (r, 90) is (0, r) and not (6e-17 * r, r)
+COS_TABLE[[90, 270]] = 0.0
+SIN_TABLE[[0, 180]] = 0.0
+
+COS_TABLE.flags.writeable = False
+SIN_TABLE.flags.writeable = False
+
+
+def polar_to_cartesian(radius: float, thetaDegrees) -> tuple:
+    """ Convert one polar point to Cartesian coordinates, by table lookup for whole degrees
+
+    Args:
+        radius (float): The radius.
+        thetaDegrees (int | float): The angle in degrees.
+
+    Returns:
+        tuple: The (x, y) coordinates as floats.
+    """
+    if thetaDegrees == int(thetaDegrees):
+        thetaBin = int(thetaDegrees) % FULL_CIRCLE
+        return (radius * float(COS_TABLE[thetaBin]), radius * float(SIN_TABLE[thetaBin]))
+
+    thetaRadians = np.radians(thetaDegrees)
+    return (radius * float(np.cos(thetaRadians)), radius * float(np.sin(thetaRadians)))
+
+
+def polar_to_cartesian_array(radius, theta, outX: np.ndarray = None, outY: np.ndarray = None) -> tuple:
+    """ Vectorized polar_to_cartesian()
+
+    Args:
+        radius (numpy.ndarray): The radii.
+        theta (numpy.ndarray): The angles in degrees, integer arrays are looked up in the tables.
+        outX (numpy.ndarray, optional): float64 array to write x into. Defaults to None (allocate).
+        outY (numpy.ndarray, optional): float64 array to write y into. Defaults to None (allocate).
+
+    Returns:
+        tuple: (x, y) float64 arrays, outX and outY when given.
+    """
+    theta = np.asarray(theta)
+    if theta.dtype.kind in "iub":
+        bins = theta % FULL_CIRCLE if (theta.size and (theta.min() < 0 or theta.max() >= FULL_CIRCLE)) else theta
+        x = np.take(COS_TABLE, bins, out=outX)
+        y = np.take(SIN_TABLE, bins, out=outY)
+    else:
+        thetaRadians = np.radians(theta)
+        x = np.cos(thetaRadians, out=outX)
+        y = np.sin(thetaRadians, out=outY)
+    np.multiply(x, radius, out=x)
+    np.multiply(y, radius, out=y)
+
+    return (x, y)
+
+
+def cartesian_to_polar_array(x, y, outRadius: np.ndarray = None, outTheta: np.ndarray = None) -> tuple:
+    """ Convert Cartesian coordinates to polar coordinates with theta in [0, 360)
+
+    Args:
+        x (numpy.ndarray): The x-coordinates.
+        y (numpy.ndarray): The y-coordinates.
+        outRadius (numpy.ndarray, optional): float64 array to write the radii into. Defaults to None (allocate).
+        outTheta (numpy.ndarray, optional): float64 array to write the angles into. Defaults to None (allocate).
+
+    Returns:
+        tuple: (radius, theta in degrees) float64 arrays, outRadius and outTheta when given.
+    """
+    radius = np.hypot(x, y, out=outRadius)
+    theta = np.arctan2(y, x, out=outTheta)
+    np.degrees(theta, out=theta)
+    np.mod(theta, FULL_CIRCLE, out=theta)
+
+    return (radius, theta)
+
+
+def nearest_bins(radius: np.ndarray, theta: np.ndarray) -> tuple:
+    """ Nearest (radius, theta) grid bin of polar points, like the rows and columns of Radar time slices
+
+    Args:
+        radius (np.ndarray): The radii in meters.
+        theta (np.ndarray): The angles in degrees.
+
+    Returns:
+        tuple: int64 arrays (radius bin, theta bin in 0 to 359).
+    """
+    return (np.rint(radius).astype(np.int64), np.rint(theta).astype(np.int64) % FULL_CIRCLE)
+
+
+@lru_cache(maxsize=4)
+def grid_cartesian(maxRadius: int) -> tuple:
+    """ Cartesian coordinates of every bin of a (maxRadius, 360) radar time slice, computed once per radius
+
+    Args:
+        maxRadius (int): Number of radius bins.
+
+    Returns:
+        tuple: Read only (x, y) float64 arrays shaped (maxRadius, 360).
+    """
+    radius = np.arange(maxRadius, dtype=np.float64)[:, None]
+    x = radius * COS_TABLE
+    y = radius * SIN_TABLE
+    x.flags.writeable = False
+    y.flags.writeable = False
+
+    return (x, y)
+
+
+def unit_test():
+    import math
+    import time
+
+    assert polar_to_cartesian(2, 90) == (0.0, 2.0) and polar_to_cartesian(3, -90) == (0.0, -3.0)
+    assert np.allclose(polar_to_cartesian(1, 45.5), (math.cos(math.radians(45.5)), math.sin(math.radians(45.5))))
+
+    radius = np.array([0, 1, 2, 3, 100])
+    theta = np.array([0, 90, 180, 270, 405])
+    x, y = polar_to_cartesian_array(radius, theta)
+    assert np.allclose(x, [0, 0, -2, 0, 100 * math.cos(math.radians(45))]) and np.allclose(y, [0, 1, 0, -3, 100 * math.sin(math.radians(45))])
+    assert np.allclose(polar_to_cartesian_array(radius, theta.astype(np.float64) + 0.0)[0], x)
+
+    # Round trip through caller owned buffers, nothing is allocated for the results
+    outX, outY = np.empty(5), np.empty(5)
+    outRadius, outTheta = np.empty(5), np.empty(5)
+    assert polar_to_cartesian_array(radius, theta, outX, outY)[0] is outX
+    assert cartesian_to_polar_array(outX, outY, outRadius, outTheta)[1] is outTheta
+    assert np.allclose(outRadius, radius) and np.allclose(outTheta[1:], theta[1:] % 360)
+    radiusBins, thetaBins = nearest_bins(np.array([0.4, 9.6]), np.array([359.7, 12.2]))
+    assert radiusBins.tolist() == [0, 10] and thetaBins.tolist() == [0, 12]
+
+    gridX, gridY = grid_cartesian(300)
+    assert grid_cartesian(300)[0] is gridX and gridX.shape == (300, 360) and gridY[10, 90] == 10.0
+
+    # Table lookups against recomputing radians, cos and sin for a full frame of integer angles
+    radius, theta = np.nonzero(np.ones((300, 360), dtype=bool))
+    outX, outY = np.empty(len(radius)), np.empty(len(radius))
+    start = time.perf_counter()
+    for _ in range(20):
+        polar_to_cartesian_array(radius, theta, outX, outY)
+    tableTime = time.perf_counter() - start
+    start = time.perf_counter()
+    for _ in range(20):
+        thetaRadians = np.radians(theta)
+        radius * np.cos(thetaRadians), radius * np.sin(thetaRadians)
+    trigTime = time.perf_counter() - start
+    print(f"Full frame polar to Cartesian: {tableTime / 20 * 1000:.2f} ms with tables, {trigTime / 20 * 1000:.2f} ms with np.cos/np.sin")
+    print("All tests passed!")
+
+
+if __name__ == "__main__":
+    unit_test()
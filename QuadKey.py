@@ -0,0 +1,378 @@
+#!/usr/bin/env python
+
+# Bing-style QuadKeys built by bit interleaving (Morton / Z-order codes) instead of digit by digit
+# https://learn.microsoft.com/en-us/bingmaps/articles/bing-maps-tile-system
+# https://en.wikipedia.org/wiki/Z-order_curve
+#
+# Quadkey digit i is (x bit i) + 2 * (y bit i), so the base 4 number spelled by a quadkey is the
+# Morton code of (x, y). The integer form puts a sentinel 1 bit above the Morton code so that the
+# zoom level is stored in the key itself, '' is 1, '0' is 4, '3' is 7 and '0230' is 0b1_00_10_11_00.
+# Zoom levels up to 31 fit in 63 bits, so integer quadkeys are valid int64 / uint64 NumPy values,
+# sort in Z-order within a zoom level and make cheap dict keys for tile caches and spatial indexes.
+
+# 3rd party libraries
+import numpy as np                  # pip install numpy
+
+MAX_ZOOM_LEVEL = 31
+
+# Every hexadecimal digit of a Morton code is two quadkey digits
+HEX_TO_QUADKEY_DIGITS = {f"{i:x}": f"{i >> 2}{i & 3}" for i in range(16)}
+
+# Offsets of the 8 neighbouring tiles, in the same dx-major order as SlippyMap.find_surrounding_tiles()
+NEIGHBOUR_OFFSETS = [(-1, -1), (-1, 0), (-1, 1), (0, -1), (0, 1), (1, -1), (1, 0), (1, 1)]
+
+
+def spread_bits(n: int) -> int:
+    """ Insert a 0 bit between each of the lower 32 bits of an integer, 0b1011 becomes 0b1000101
+
+    Args:
+        n (int): The integer to spread.
+
+    Returns:
+        int: The spread integer.
+    """
+    n &= 0x00000000FFFFFFFF
+    n = (n | (n << 16)) & 0x0000FFFF0000FFFF
+    n = (n | (n << 8)) & 0x00FF00FF00FF00FF
+    n = (n | (n << 4)) & 0x0F0F0F0F0F0F0F0F
+    n = (n | (n << 2)) & 0x3333333333333333
+    n = (n | (n << 1)) & 0x5555555555555555
+
+    return n
+
+
+def compact_bits(n: int) -> int:
+    """ Inverse of spread_bits(), keep every even bit of an integer and pack them together
+
+    Args:
+        n (int): The integer to compact.
+
+    Returns:
+        int: The compacted integer.
+    """
+    n &= 0x5555555555555555
+    n = (n | (n >> 1)) & 0x3333333333333333
+    n = (n | (n >> 2)) & 0x0F0F0F0F0F0F0F0F
+    n = (n | (n >> 4)) & 0x00FF00FF00FF00FF
+    n = (n | (n >> 8)) & 0x0000FFFF0000FFFF
+    n = (n | (n >> 16)) & 0x00000000FFFFFFFF
+
+    return n
+
+
+def check_tile(zoomLevel: int, x: int, y: int):
+    """ Raise ValueError if a tile ID can not be encoded as a quadkey
+
+    Args:
+        zoomLevel (int): The zoom level between 0 - 31
+        x (int): The x-coordinate of the tile.
+        y (int): The y-coordinate of the tile.
+    """
+    if zoomLevel < 0 or zoomLevel > MAX_ZOOM_LEVEL:
+        raise ValueError(f"Zoom level {zoomLevel} must be between 0 and {MAX_ZOOM_LEVEL}")
+
+    n = 1 << zoomLevel
+    if x < 0 or y < 0 or x >= n or y >= n:
+        raise ValueError(f"Tile ({x}, {y}) does not exist at zoom level {zoomLevel}")
+
+
+def tileXY_to_quadkey_int(zoomLevel: int, x: int, y: int) -> int:
+    """ Convert tile (x, y, zoom) to an integer QuadKey
+
+    Args:
+        zoomLevel (int): The zoom level between 0 - 31
+        x (int): The x-coordinate of the tile.
+        y (int): The y-coordinate of the tile.
+
+    Returns:
+        int: The integer quadkey.
+    """
+    check_tile(zoomLevel, x, y)
+
+    return (1 << (2 * zoomLevel)) | spread_bits(x) | (spread_bits(y) << 1)
+
+
+def tileXY_to_quadkey(zoomLevel: int, x: int, y: int) -> str:
+    """ Convert tile (x, y, zoom) to a Bing-style QuadKey string
+        Top-left → 0
+        Top-right → 1
+        Bottom-left → 2
+        Bottom-right → 3
+
+    Args:
+        zoomLevel (int): The zoom level between 0 - 31
+        x (int): The x-coordinate of the tile.
+        y (int): The y-coordinate of the tile.
+
+    Returns:
+        str: The quadkey, one digit per zoom level.
+    """
+    return quadkey_int_to_str(tileXY_to_quadkey_int(zoomLevel, x, y))
+
+
+def quadkey_int_zoom(quadkey: int) -> int:
+    """ Get the zoom level stored in an integer quadkey
+
+    Args:
+        quadkey (int): The integer quadkey.
+
+    Returns:
+        int: The zoom level.
+    """
+    if quadkey < 1:
+        raise ValueError(f"{quadkey} is an invalid integer quadkey")
+
+    return (quadkey.bit_length() - 1) // 2
+
+
+def quadkey_int_to_str(quadkey: int) -> str:
+    """ Convert an integer quadkey to a QuadKey string
+
+    Args:
+        quadkey (int): The integer quadkey.
+
+    Returns:
+        str: The quadkey string.
+    """
+    zoomLevel = quadkey_int_zoom(quadkey)
+    if zoomLevel == 0:
+        return ""
+
+    morton = quadkey ^ (1 << (2 * zoomLevel))
+    digits = "".join(HEX_TO_QUADKEY_DIGITS[c] for c in f"{morton:0{(zoomLevel + 1) // 2}x}")
+
+    return digits[len(digits) - zoomLevel:]
+
+
+def quadkey_str_to_int(quadkey: str) -> int:
+    """ Convert a QuadKey string to an integer quadkey
+
+    Args:
+        quadkey (str): The quadkey string.
+
+    Returns:
+        int: The integer quadkey.
+    """
+    if len(quadkey) > MAX_ZOOM_LEVEL:
+        raise ValueError(f"Quadkey '{quadkey}' is deeper than zoom level {MAX_ZOOM_LEVEL}")
+
+    # The leading 1 is the sentinel bit, int() raises ValueError for any digit other than 0-3
+    return int("1" + quadkey, 4)
+
+
+def quadkey_int_to_tileXY(quadkey: int) -> tuple:
+    """ Convert an integer quadkey back to its tile ID
+
+    Args:
+        quadkey (int): The integer quadkey.
+
+    Returns:
+        tuple: (zoomLevel, x, y)
+    """
+    zoomLevel = quadkey_int_zoom(quadkey)
+    morton = quadkey ^ (1 << (2 * zoomLevel))
+
+    return (zoomLevel, compact_bits(morton), compact_bits(morton >> 1))
+
+
+def quadkey_to_tileXY(quadkey: str) -> tuple:
+    """ Convert a QuadKey string back to its tile ID
+
+    Args:
+        quadkey (str): The quadkey string.
+
+    Returns:
+        tuple: (zoomLevel, x, y)
+    """
+    return quadkey_int_to_tileXY(quadkey_str_to_int(quadkey))
+
+
+def parent(quadkey: int, levels: int = 1) -> int:
+    """ Get the integer quadkey of the tile containing this one a number of zoom levels up
+
+    Args:
+        quadkey (int): The integer quadkey.
+        levels (int, optional): How many zoom levels to go up. Defaults to 1.
+
+    Returns:
+        int: The integer quadkey of the parent tile.
+    """
+    if levels > quadkey_int_zoom(quadkey):
+        raise ValueError(f"Tile {quadkey_int_to_str(quadkey)} has no parent {levels} levels up")
+
+    return quadkey >> (2 * levels)
+
+
+def children(quadkey: int) -> list:
+    """ Get the integer quadkeys of the 4 tiles one zoom level down, in quadkey digit order
+
+    Args:
+        quadkey (int): The integer quadkey.
+
+    Returns:
+        list: The 4 child integer quadkeys.
+    """
+    if quadkey_int_zoom(quadkey) >= MAX_ZOOM_LEVEL:
+        raise ValueError(f"Tile {quadkey_int_to_str(quadkey)} has no children below zoom level {MAX_ZOOM_LEVEL}")
+
+    first = quadkey << 2
+
+    return [first, first | 1, first | 2, first | 3]
+
+
+def descendant_range(quadkey: int, zoomLevel: int) -> tuple:
+    """ Get the half-open range of integer quadkeys covering this tile at a deeper zoom level
+        Every descendant d satisfies low <= d < high, so sorted quadkeys can be searched with bisect
+
+    Args:
+        quadkey (int): The integer quadkey.
+        zoomLevel (int): The deeper zoom level.
+
+    Returns:
+        tuple: (low, high)
+    """
+    shift = 2 * (zoomLevel - quadkey_int_zoom(quadkey))
+    if shift < 0:
+        raise ValueError(f"Zoom level {zoomLevel} is above tile {quadkey_int_to_str(quadkey)}")
+
+    return (quadkey << shift, (quadkey + 1) << shift)
+
+
+def neighbours(quadkey: int) -> list:
+    """ Get the integer quadkeys of the up to 8 tiles surrounding this one at the same zoom level
+        X wraps around the antimeridian, rows above the top or below the bottom of the map are skipped
+
+    Args:
+        quadkey (int): The integer quadkey.
+
+    Returns:
+        list: The neighbouring integer quadkeys.
+    """
+    zoomLevel, x, y = quadkey_int_to_tileXY(quadkey)
+    n = 1 << zoomLevel
+
+    tiles = []
+    for dx, dy in NEIGHBOUR_OFFSETS:
+        nx = (x + dx) % n
+        ny = y + dy
+        if 0 <= ny < n and (nx, ny) != (x, y):
+            key = tileXY_to_quadkey_int(zoomLevel, nx, ny)
+            if key not in tiles:
+                tiles.append(key)
+
+    return tiles
+
+
+def spread_bits_array(n):
+    """ Vectorized spread_bits()
+
+    Args:
+        n (numpy.ndarray): The integers to spread.
+
+    Returns:
+        numpy.ndarray: uint64 array of spread integers.
+    """
+    n = np.asarray(n).astype(np.uint64) & np.uint64(0x00000000FFFFFFFF)
+    n = (n | (n << np.uint64(16))) & np.uint64(0x0000FFFF0000FFFF)
+    n = (n | (n << np.uint64(8))) & np.uint64(0x00FF00FF00FF00FF)
+    n = (n | (n << np.uint64(4))) & np.uint64(0x0F0F0F0F0F0F0F0F)
+    n = (n | (n << np.uint64(2))) & np.uint64(0x3333333333333333)
+    n = (n | (n << np.uint64(1))) & np.uint64(0x5555555555555555)
+
+    return n
+
+
+def compact_bits_array(n):
+    """ Vectorized compact_bits()
+
+    Args:
+        n (numpy.ndarray): The uint64 integers to compact.
+
+    Returns:
+        numpy.ndarray: uint64 array of compacted integers.
+    """
+    n = np.asarray(n, dtype=np.uint64) & np.uint64(0x5555555555555555)
+    n = (n | (n >> np.uint64(1))) & np.uint64(0x3333333333333333)
+    n = (n | (n >> np.uint64(2))) & np.uint64(0x0F0F0F0F0F0F0F0F)
+    n = (n | (n >> np.uint64(4))) & np.uint64(0x00FF00FF00FF00FF)
+    n = (n | (n >> np.uint64(8))) & np.uint64(0x0000FFFF0000FFFF)
+    n = (n | (n >> np.uint64(16))) & np.uint64(0x00000000FFFFFFFF)
+
+    return n
+
+
+def tileXY_to_quadkey_int_array(zoomLevel: int, x, y):
+    """ Vectorized tileXY_to_quadkey_int(), for example on the output of TileMath.get_tile_XY_array()
+
+    Args:
+        zoomLevel (int): The zoom level between 0 - 31 shared by all tiles
+        x (numpy.ndarray): The x-coordinates of the tiles.
+        y (numpy.ndarray): The y-coordinates of the tiles.
+
+    Returns:
+        numpy.ndarray: int64 array of integer quadkeys.
+    """
+    x = np.asarray(x)
+    y = np.asarray(y)
+    check_tile(zoomLevel, 0, 0)
+    n = 1 << zoomLevel
+    if np.any(x < 0) or np.any(y < 0) or np.any(x >= n) or np.any(y >= n):
+        raise ValueError(f"Tiles must be between 0 and {n - 1} at zoom level {zoomLevel}")
+
+    quadkeys = np.uint64(1 << (2 * zoomLevel)) | spread_bits_array(x) | (spread_bits_array(y) << np.uint64(1))
+
+    return quadkeys.astype(np.int64)
+
+
+def quadkey_int_to_tileXY_array(zoomLevel: int, quadkeys) -> tuple:
+    """ Vectorized quadkey_int_to_tileXY() for integer quadkeys that all have the same zoom level
+
+    Args:
+        zoomLevel (int): The zoom level of every quadkey.
+        quadkeys (numpy.ndarray): The integer quadkeys.
+
+    Returns:
+        tuple: int64 arrays (x, y)
+    """
+    morton = np.asarray(quadkeys).astype(np.uint64) ^ np.uint64(1 << (2 * zoomLevel))
+    x = compact_bits_array(morton)
+    y = compact_bits_array(morton >> np.uint64(1))
+
+    return (x.astype(np.int64), y.astype(np.int64))
+
+
+def unit_test():
+    assert tileXY_to_quadkey(16, 11772, 25701) == "0230130113311302"
+    assert tileXY_to_quadkey(0, 0, 0) == ""
+    assert tileXY_to_quadkey(3, 3, 5) == "213"
+    assert tileXY_to_quadkey_int(1, 1, 1) == 7
+    assert quadkey_to_tileXY("0230130113311302") == (16, 11772, 25701)
+    assert quadkey_str_to_int("213") == tileXY_to_quadkey_int(3, 3, 5)
+    assert quadkey_int_to_str(quadkey_str_to_int("0000")) == "0000"
+
+    key = quadkey_str_to_int("0230130113311302")
+    assert quadkey_int_to_str(parent(key)) == "023013011331130"
+    assert quadkey_int_to_str(parent(key, 16)) == ""
+    assert [quadkey_int_to_str(child) for child in children(key)] == ["0230130113311302" + d for d in "0123"]
+    low, high = descendant_range(parent(key, 4), 16)
+    assert low <= key < high and not low <= quadkey_str_to_int("0230130113301302") < high
+    assert sorted(quadkey_int_to_tileXY(k)[1:] for k in neighbours(key)) == sorted((11772 + dx, 25701 + dy) for dx, dy in NEIGHBOUR_OFFSETS)
+    assert len(neighbours(tileXY_to_quadkey_int(1, 0, 0))) == 3
+    assert len(neighbours(tileXY_to_quadkey_int(3, 0, 0))) == 5
+
+    rng = np.random.default_rng(42)
+    for zoomLevel in (0, 1, 7, 18, 31):
+        x = rng.integers(0, 1 << zoomLevel, 500)
+        y = rng.integers(0, 1 << zoomLevel, 500)
+        quadkeys = tileXY_to_quadkey_int_array(zoomLevel, x, y)
+        xBack, yBack = quadkey_int_to_tileXY_array(zoomLevel, quadkeys)
+        assert np.array_equal(x, xBack) and np.array_equal(y, yBack)
+        for i in range(0, 500, 50):
+            assert quadkeys[i] == tileXY_to_quadkey_int(zoomLevel, int(x[i]), int(y[i]))
+            assert len(tileXY_to_quadkey(zoomLevel, int(x[i]), int(y[i]))) == zoomLevel
+
+    print("All tests passed!")
+
+
+if __name__ == "__main__":
+    unit_test()
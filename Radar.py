@@ -5,22 +5,28 @@
 #freeze_support()                            # noqa
 
 # External libraries
-from nicegui import native, ui      # pip install nicegui
+# NiceGUI, Plotly, pyserial and dotenv are imported where they are first used, so the processing core
+# starts fast on the bike's SBC, see StartupBenchmark.py
 import numpy as np                  # pip install numpy
 #import threading
-import serial                       # pip install pyserial
 import math                         # pip install math
-import plotly.graph_objects as go   # pip install plotly
 import os
-from dotenv import load_dotenv
+import asyncio
+from collections import OrderedDict
 
 # Internal libraries
 from StationaryObject import StationaryObject
+from RadarGeoreference import RadarGeoreference
+from ClutterMap import ClutterMap
+from PolarGeometry import FULL_CIRCLE, polar_to_cartesian as table_polar_to_cartesian, cartesian_to_polar_array, nearest_bins, grid_cartesian
+from SpeedSensor import SpeedSensor
 
-speedInMetersPerSecond = 10
-pollingRateInHz = 2
 objectsFound = 0
 
+# Frame displacements are rounded to this before looking up a remap table in find_stationary_points()
+DISPLACEMENT_BUCKET_IN_METERS = 0.5
+MAX_REMAP_TABLES = 32
+
 class Radar:
 
     DEBUG_STATEMENTS_ON = False
@@ -33,22 +39,38 @@ class Radar:
     THETA = 1
     GROUP_ID = 2
 
-    FULL_CIRCLE = 360
+    FULL_CIRCLE = FULL_CIRCLE
     QUARTER_CIRCLE = int(FULL_CIRCLE / 4)
     EIGHTH_CIRCLE = int(FULL_CIRCLE / 8)
 
-    def __init__(self, maxRadius: int = 300, port: str = '/dev/ttyUSB0', mode: str = 'TESTING'):
+    # Whole frames the TESTING loop:// connection can hold before a write blocks
+    TESTING_FRAMES_BUFFERED = 2
+
+    def __init__(self, maxRadius: int = 300, port: str = '/dev/ttyUSB0', mode: str = 'TESTING', speedSensor: SpeedSensor = None):
         """Initialize the Radar object.
 
         Args:
             maxRadius (int, optional): Maximum range of the RADAR in meters. Defaults to 300.
             port (str, optional): Serial port for communication. Defaults to '/dev/ttyUSB0'.
             mode (str, optional): Operating mode ('TESTING' or 'PRODUCTION'). Defaults to 'TESTING'.
+            speedSensor (SpeedSensor, optional): GPS and wheel-speed input, None to open one in the same mode. Defaults to None.
         """
+        import serial                       # pip install pyserial
+
         self.mode = mode
+        self.speedSensor = speedSensor if speedSensor is not None else SpeedSensor(mode=mode)
+
+        # Meters ridden between the past and current time slice, stamped by scan() from the speed sensor
+        self.frameDisplacementInMeters = 0.0
+
+        # Displacement bucket to (flat index of the past bin, valid) per current bin, see remap_table()
+        self.remapTables = OrderedDict()
 
         if mode == "TESTING":
-            self.serialConnection = serial.serial_for_url('loop://', timeout=1)
+            # The loop:// stand-in holds 4096 bytes unless told otherwise, make room for a few whole frames
+            self.serialConnection = serial.serial_for_url('loop://', timeout=1, do_not_open=True)
+            self.serialConnection.buffer_size = Radar.TESTING_FRAMES_BUFFERED * maxRadius * Radar.FULL_CIRCLE
+            self.serialConnection.open()
             #threading.Thread(target=Radar.scan(currentPlotContainer), args=(self.serialConnection,), daemon=True).start()
         else:
             try:
@@ -56,6 +78,7 @@ class Radar:
                 self.serialConnection = serial.Serial(port, 9600)
             except serial.serialutil.SerialException as e:
                 print(f"Error initializing serial connection: {e}")
+                from nicegui import ui
                 ui.notify("ERROR: RADAR module serial port connection failed")
                 self.serialConnection = None
 
@@ -71,6 +94,23 @@ class Radar:
 
         # Uses StationaryObject Dataclass
         self.stationaryObjects = []
+        self.stationaryGroupedPoints = []
+
+        # Rider GPS (latitude, longitude, heading) from set_pose(), None until the first GPS fix
+        self.pose = None
+        self.georeference = RadarGeoreference()
+
+        # Background subtraction of bins that stay occupied while the bike moves, see ClutterMap.py
+        self.clutterMap = ClutterMap(maxRadius)
+
+        # Optional OccupancyGrid.OccupancyGrid shared across rides, known static clutter is left out of grouping
+        self.occupancyGrid = None
+
+        # Optional SessionArchive.SessionArchiveWriter every processed frame is recorded to
+        self.sessionRecorder = None
+
+        # Set while next_scan_async() waits for its worker thread
+        self.scanInProgress = False
 
 
     def __str__(self):
@@ -78,6 +118,53 @@ class Radar:
 
 
 
+    def set_pose(self, lat: float, lon: float, headingDegrees: float):
+        """ Set the rider's GPS position and heading used to place detections on the map.
+
+        Args:
+            lat (float): Latitude of the rider in degrees
+            lon (float): Longitude of the rider in degrees
+            headingDegrees (float): Heading of the rider in degrees clockwise from north
+        """
+        self.pose = (lat, lon, headingDegrees)
+
+
+    def georeferenced_detections(self, timeSlice: str = "CURRENT") -> tuple:
+        """ GPS coordinates and map tiles of every detection in a time slice, see RadarGeoreference.frame()
+
+        Args:
+            timeSlice (str, optional): "CURRENT", "PAST" or "STATIONARY OBJECTS". Defaults to "CURRENT".
+
+        Returns:
+            tuple: Arrays (lat, lon, x, y, pixelX, pixelY), one entry per detection.
+        """
+        if self.pose is None:
+            raise ValueError("Rider pose is unknown, call set_pose() first")
+
+        if timeSlice == "CURRENT":
+            dataTimeSlice = self.dataTimeSliceCurrent
+        elif timeSlice == "PAST":
+            dataTimeSlice = self.dataTimeSlicePast
+        elif timeSlice == "STATIONARY OBJECTS":
+            dataTimeSlice = self.dataTimeSliceStationary
+        else:
+            raise ValueError("Invalid time slice")
+
+        return self.georeference.frame(dataTimeSlice, *self.pose)
+
+
+    def nearest_moving_range(self):
+        """ Range of the closest point in the current time slice that is not stationary, for ScanScheduler.py
+
+        Returns:
+            float: The range in meters, None if every point is stationary.
+        """
+        moving = self.dataTimeSliceCurrent & ~self.dataTimeSliceStationary
+        radii = np.flatnonzero(moving.any(axis=1))
+
+        return float(radii[0]) if len(radii) > 0 else None
+
+
     def group_points(self, dataTimeSlice):
         """ Group points by adjacency and add a group ID for all touch points.
 
@@ -91,11 +178,8 @@ class Radar:
         groupId = 0
 
 
-        # Get points from current data time slice with group ID set to 0
-        for r in range(self.maxRadius):
-            for t in range(Radar.FULL_CIRCLE):
-                if dataTimeSlice[r, t]:
-                    points.append([r, t, groupId])  # Sort by radius
+        # Get points from current data time slice with group ID set to 0, sorted by radius
+        points = [[r, t, groupId] for r, t in np.argwhere(dataTimeSlice).tolist()]
 
         #print(f"Raw Data: {points}")
 
@@ -130,7 +214,7 @@ class Radar:
 
         finalGroupedPoints = sorted(pointsSortedByTheta, key=lambda x: x[Radar.GROUP_ID])
         #print(f"Final Grouping: {finalGroupedPoints}")
-        print(f"Number of groups: {len(set(point[Radar.GROUP_ID] for point in finalGroupedPoints))}")
+        if (Radar.DEBUG_STATEMENTS_ON): print(f"Number of groups: {len(set(point[Radar.GROUP_ID] for point in finalGroupedPoints))}")
 
         return finalGroupedPoints
 
@@ -160,35 +244,51 @@ class Radar:
         Returns:
             tuple: A tuple containing the x and y coordinates rounded to three decimal places.
         """
-        thetaRadians = math.radians(thetaDegrees)
-        x = round(r * math.cos(thetaRadians), 3)
-        y = round(r * math.sin(thetaRadians), 3)
+        x, y = table_polar_to_cartesian(r, thetaDegrees)
 
-        return (x, y)
+        return (round(x, 3), round(y, 3))
 
 
-    def find_stationary_points(self, velocity: int, pollRate: int = 2):
-        """" Determine if consecutive time slices contain stationary objects.
+    def remap_table(self, distanceMoved: float) -> tuple:
+        """ Past time slice bin where a stationary object in each current bin was, for a displacement bucket
 
         Args:
-            velocity (int): The velocity of the moving RADAR module moving towards 270 degrees (down in GUI).
-            pollRate (int): The rate at which the data is polled in Hertz.
+            distanceMoved (float): Meters the RADAR module moved towards 270 degrees between the two time slices.
+
+        Returns:
+            tuple: (flat index into the past time slice, True where that bin is inside the radar range), both shaped like a time slice.
         """
+        bucket = int(round(distanceMoved / DISPLACEMENT_BUCKET_IN_METERS))
+        table = self.remapTables.get(bucket)
+        if table is None:
+            x, y = grid_cartesian(self.maxRadius)
+            pastRadius, pastTheta = nearest_bins(*cartesian_to_polar_array(x, y - bucket * DISPLACEMENT_BUCKET_IN_METERS))
+            valid = pastRadius < self.maxRadius
+            valid[0] = False
+            table = (np.where(valid, pastRadius * Radar.FULL_CIRCLE + pastTheta, 0), valid)
+            self.remapTables[bucket] = table
+            while len(self.remapTables) > MAX_REMAP_TABLES:
+                self.remapTables.popitem(last=False)
+        self.remapTables.move_to_end(bucket)
+
+        return table
+
+
+    def find_stationary_points(self, distanceMoved: float):
+        """" Determine if consecutive time slices contain stationary objects.
 
-        distanceMoved = velocity * pollRate
-        for r1 in range(1, self.maxRadius - distanceMoved):
-            for t1 in range(Radar.FULL_CIRCLE):
-                x1, y1 = Radar.polar_to_cartesian(r1, t1)
-                y2 = y1 - distanceMoved
-                r2, t2 = Radar.cartesian_to_polar(x1, y2)
+        A current point is stationary when the past time slice has a point where it was before the RADAR
+        module moved, looked up for all bins at once with a cached remap table.
 
-                if self.dataTimeSliceCurrent[r1, t1] and self.dataTimeSlicePast[int(r2), int(t2)]:
-                    print(f"(r1={r1}, t1={t1}) -> (r2={int(r2)}, t2={int(t2)}) = (x1={x1}, y2={y2})")
-                    self.dataTimeSliceStationary[r1, t1] = True
+        Args:
+            distanceMoved (float): Meters the RADAR module moved towards 270 degrees (down in GUI) since the past time slice.
+        """
+        pastIndex, valid = self.remap_table(distanceMoved)
+        self.dataTimeSliceStationary = self.dataTimeSliceCurrent & valid & self.dataTimeSlicePast.ravel()[pastIndex]
 
 
     def scan(self, currentPlotContainer):
-        """
+        """ Process the next frame and show it in the GUI
 
         Args:
             currentPlotContainer (PlotContainer): The current plot container
@@ -196,50 +296,141 @@ class Radar:
         Returns:
             None
         """
-        global speedInMetersPerSecond, pollingRateInHz
+        self.process_frame()
 
-        print("Scanning...")
+        self.show_time_slice(currentPlotContainer, "CURRENT")
 
-        self.reset_current_radar_database()
+        if len(self.stationaryGroupedPoints) > 0:
+            objectsFoundLabel.set_text(f"Stationary Objects Found: {len(self.stationaryGroupedPoints)} ........ Group ID Data: {self.stationaryGroupedPoints}")
 
-        if self.mode == "TESTING":
-            if (Radar.DEBUG_STATEMENTS_ON): print(self.serial_test())
-        else:
-            #self.generate_random_data(100)
-            self.serial_scan_test()
-            data = self.serialConnection.read(self.maxRadius * Radar.FULL_CIRCLE)
-
-        i = 0
-        for r in range(self.maxRadius):
-            for t in range(Radar.FULL_CIRCLE):
-                if i >= len(data):
-                    break  # prevent index error
-                bit = data[i:i+1]
-                i += 1
-                self.update_radar_database(bit == b'1', r, t, Radar.CURRENT)
-
-        currentPlotContainer.figure = self.GUI("CURRENT")
-        currentPlotContainer.update()
+        self.show_time_slice(stationaryPlotContainer, "STATIONARY OBJECTS")
+
+
+    def process_frame(self, data: bytes = None):
+        """ Read the next frame from the serial connection and find the stationary objects in it, without any GUI
+
+        Args:
+            data (bytes, optional): Frame bytes already read with read_frame(). Defaults to None (read the serial connection).
+        """
+        if (Radar.DEBUG_STATEMENTS_ON): print("Scanning...")
+
+        self.frameDisplacementInMeters = self.speedSensor.stamp_frame()
+        if self.speedSensor.pose is not None:
+            pose = self.speedSensor.pose
+            self.set_pose(pose.lat, pose.lon, pose.headingDegrees)
+
+        if data is None:
+            if self.mode != "TESTING":
+                #self.generate_random_data(100)
+                self.serial_scan_test()
+            data = self.read_frame()
+        dataTimeSlice = self.decode_frame(data)
+        self.process_time_slice(dataTimeSlice, self.speedSensor.speedInMetersPerSecond)
+
+        # The frame as received, so a replay runs the clutter map and detection again
+        if self.sessionRecorder is not None:
+            from SessionArchive import risk_record
+            self.sessionRecorder.append(self.sessionRecorder.now(), dataTimeSlice, self.pose, self.speedSensor.speedInMetersPerSecond, self.frameDisplacementInMeters,
+                                        [risk_record(obj) for obj in self.stationaryObjects])
+
+
+    def process_time_slice(self, dataTimeSlice: np.ndarray, speedInMetersPerSecond: float):
+        """ Find the stationary objects in a decoded frame, the pose and frame displacement must already be set
+
+        Args:
+            dataTimeSlice (np.ndarray): Boolean (maxRadius, 360) time slice as received from the radar.
+            speedInMetersPerSecond (float): Speed of the rider, the clutter map only learns while moving.
+        """
+        self.dataTimeSliceCurrent = self.clutterMap.apply(dataTimeSlice, learn=speedInMetersPerSecond > 0)
+        if (Radar.DEBUG_STATEMENTS_ON): print(f"Clutter suppressed: {self.clutterMap.stats['suppressedFraction']:.1%}")
 
         self.stationaryObjects = []
-        self.find_stationary_points(speedInMetersPerSecond, pollingRateInHz)
+        self.find_stationary_points(self.frameDisplacementInMeters)
         #print(f"Stationary Data: {self.dataTimeSliceStationary}")
-        stationaryGroupedPoints = self.group_points(self.dataTimeSliceStationary)
+        stationaryPoints = self.dataTimeSliceStationary
+        if self.occupancyGrid is not None and self.pose is not None:
+            knownStatic = self.occupancyGrid.static_mask(stationaryPoints, *self.pose)
+            self.occupancyGrid.update(stationaryPoints, *self.pose)
+            stationaryPoints = stationaryPoints & ~knownStatic
+        self.stationaryGroupedPoints = self.group_points(stationaryPoints)
         groupId = 0
-        if len(stationaryGroupedPoints) > 0:
-            objectsFoundLabel.set_text(f"Stationary Objects Found: {len(stationaryGroupedPoints)} ........ Group ID Data: {stationaryGroupedPoints}")
-            for i in range(stationaryGroupedPoints[-1][Radar.GROUP_ID]+1):
+        if len(self.stationaryGroupedPoints) > 0:
+            for i in range(self.stationaryGroupedPoints[-1][Radar.GROUP_ID]+1):
                 obj = StationaryObject()
-                for point in stationaryGroupedPoints:
+                for point in self.stationaryGroupedPoints:
                     if point[Radar.GROUP_ID] == groupId:
                         obj.add_point(point[Radar.RADIUS], point[Radar.THETA])
                 obj.define_object_outer_polyline()
                 groupId += 1
                 self.stationaryObjects.append(obj)
 
-        print("Stationary Objects:", self.stationaryObjects)
-        stationaryPlotContainer.figure = self.GUI("STATIONARY OBJECTS")
-        stationaryPlotContainer.update()
+        # Every frame, so each risk always points at the map tile its object is in
+        if self.pose is not None:
+            self.georeference.tag_risks(self.stationaryObjects, *self.pose)
+
+        if (Radar.DEBUG_STATEMENTS_ON): print("Stationary Objects:", self.stationaryObjects)
+
+
+    def replay(self, archive, startTime: float = None, endTime: float = None):
+        """ Run the frames of a recorded ride through the pipeline again, without the serial connection or speed sensor
+
+        Args:
+            archive (SessionArchive): The recorded ride.
+            startTime (float, optional): First timestamp to replay. Defaults to None (the start).
+            endTime (float, optional): Last timestamp to replay. Defaults to None (the end).
+
+        Yields:
+            ArchivedFrame: Each frame after it is processed, the results are in the Radar attributes like after next_frame().
+        """
+        if archive.maxRadius != self.maxRadius:
+            raise ValueError(f"Archive range {archive.maxRadius} does not match radar range {self.maxRadius}")
+
+        for frame in archive.frames(startTime, endTime):
+            self.dataTimeSlicePast = self.dataTimeSliceCurrent.copy()
+            self.frameDisplacementInMeters = frame.displacementInMeters
+            if frame.pose is not None:
+                self.set_pose(*frame.pose)
+            self.process_time_slice(frame.dataTimeSlice, frame.speedInMetersPerSecond)
+            yield frame
+
+
+    def next_frame(self, data: bytes = None):
+        """ Headless next_scan(), the current time slice becomes the past one and the next frame is processed
+
+        Args:
+            data (bytes, optional): Frame bytes already read with read_frame(). Defaults to None (read the serial connection).
+        """
+        self.dataTimeSlicePast = self.dataTimeSliceCurrent.copy()
+        self.process_frame(data)
+
+
+    def read_frame(self) -> bytes:
+        """ Read one frame from the serial connection, one b'0' or b'1' byte per (radius, theta) bin with theta changing fastest
+
+        Returns:
+            bytes: Up to maxRadius * 360 bytes, fewer if the read timed out.
+        """
+        if self.serialConnection is None:
+            return b""
+
+        return self.serialConnection.read(self.maxRadius * Radar.FULL_CIRCLE)
+
+
+    def decode_frame(self, data: bytes) -> np.ndarray:
+        """ Convert the bytes of a frame to a time slice, bins missing from a short frame are False
+
+        Args:
+            data (bytes): Frame bytes like read_frame() returns.
+
+        Returns:
+            np.ndarray: Boolean (maxRadius, 360) time slice.
+        """
+        dataTimeSlice = np.zeros(self.maxRadius * Radar.FULL_CIRCLE, dtype=bool)
+        received = np.frombuffer(data, dtype=np.uint8)[:len(dataTimeSlice)]
+        dataTimeSlice[:len(received)] = received == ord("1")
+
+        return dataTimeSlice.reshape(self.maxRadius, Radar.FULL_CIRCLE)
+
 
     def serial_scan_test(self):
 
@@ -269,12 +460,35 @@ class Radar:
             pastPlotContainer (PlotContainer): The container for the past plot.
         """
         self.dataTimeSlicePast = self.dataTimeSliceCurrent.copy()
-        pastPlotContainer.figure = self.GUI("PAST")
-        pastPlotContainer.update()
+        self.show_time_slice(pastPlotContainer, "PAST")
 
         self.scan(currentPlotContainer)
 
 
+    async def next_scan_async(self, currentPlotContainer, pastPlotContainer):
+        """ next_scan() for the event loop: the serial read and processing run in a worker thread, only the plot updates on the loop
+
+        Args:
+            currentPlotContainer (PlotContainer): The container for the current plot.
+            pastPlotContainer (PlotContainer): The container for the past plot.
+        """
+        # A manual scan while a scheduled one is still reading would interleave two frames
+        if self.scanInProgress:
+            return
+
+        self.scanInProgress = True
+        try:
+            await asyncio.to_thread(self.next_frame)
+        finally:
+            self.scanInProgress = False
+
+        self.show_time_slice(pastPlotContainer, "PAST")
+        self.show_time_slice(currentPlotContainer, "CURRENT")
+        if len(self.stationaryGroupedPoints) > 0:
+            objectsFoundLabel.set_text(f"Stationary Objects Found: {len(self.stationaryGroupedPoints)} ........ Group ID Data: {self.stationaryGroupedPoints}")
+        self.show_time_slice(stationaryPlotContainer, "STATIONARY OBJECTS")
+
+
     def reset_current_radar_database(self):
         """ Reset the current time slice RADAR Numpy array to False
 
@@ -337,16 +551,9 @@ class Radar:
         Returns:
             tuple: A tuple containing the radius plot points and theta plot points.
         """
-        radiusPlotPoints = []
-        thetaPlotPoints = []
+        radiusPlotPoints, thetaPlotPoints = np.nonzero(data)
 
-        for r in range(self.maxRadius):
-            for t in range(Radar.FULL_CIRCLE):
-                if data[r, t]:
-                    radiusPlotPoints.append(r)
-                    thetaPlotPoints.append(t)
-
-        return radiusPlotPoints, thetaPlotPoints
+        return radiusPlotPoints.tolist(), thetaPlotPoints.tolist()
 
 
     def GUI(self, timeSlice: str):
@@ -358,16 +565,9 @@ class Radar:
         Returns:
             go.Figure: The Plotly figure.
         """
+        import plotly.graph_objects as go   # pip install plotly
 
-        if timeSlice == "CURRENT":
-            radiusList, thetaList = self.create_plot_points(self.dataTimeSliceCurrent)
-        elif timeSlice == "PAST":
-            radiusList, thetaList = self.create_plot_points(self.dataTimeSlicePast)
-        elif timeSlice == "STATIONARY OBJECTS":
-            radiusList, thetaList = self.create_plot_points(self.dataTimeSliceStationary)
-        else:
-            raise ValueError("Invalid time slice")
-
+        radiusList, thetaList = self.create_plot_points(self.select_time_slice(timeSlice))
 
         figure = go.Figure(go.Scatterpolar(r= radiusList, theta= thetaList,
             mode="markers",
@@ -389,6 +589,39 @@ class Radar:
         return figure
 
 
+    def select_time_slice(self, timeSlice: str) -> np.ndarray:
+        """ The time slice array shown for a GUI time slice name
+
+        Args:
+            timeSlice (str): "CURRENT", "PAST" or "STATIONARY OBJECTS".
+
+        Returns:
+            np.ndarray: The boolean (maxRadius, 360) time slice.
+        """
+        if timeSlice == "CURRENT":
+            return self.dataTimeSliceCurrent
+        elif timeSlice == "PAST":
+            return self.dataTimeSlicePast
+        elif timeSlice == "STATIONARY OBJECTS":
+            return self.dataTimeSliceStationary
+        else:
+            raise ValueError("Invalid time slice")
+
+
+    def show_time_slice(self, plotContainer, timeSlice: str):
+        """ Update a plot container, a RadarCanvas gets only the changed bins and a ui.plotly a new figure
+
+        Args:
+            plotContainer (RadarCanvas | ui.plotly): The container to update.
+            timeSlice (str): "CURRENT", "PAST" or "STATIONARY OBJECTS".
+        """
+        if hasattr(plotContainer, "encoder"):
+            plotContainer.push(self.select_time_slice(timeSlice))
+        else:
+            plotContainer.figure = self.GUI(timeSlice)
+            plotContainer.update()
+
+
     def toggle_GUI(value: str):
         """ Toggle the visibility of the GUI plots based on the time slice selected via Radio Button.
 
@@ -412,24 +645,54 @@ class Radar:
 
 
 if __name__ in {"__main__", "__mp_main__"}:
+    from nicegui import app, native, ui # pip install nicegui
+    from dotenv import load_dotenv
+    from ScanScheduler import ScanScheduler
+    from OccupancyGrid import OccupancyGrid
+    from SessionArchive import SessionArchiveWriter, session_path
 
     EP3 = Radar(300, '/dev/ttyUSB0', 'PRODUCTION')
     #EP3.generate_random_data(100)
     EP3.manual_update()
 
+    # Static clutter learned on earlier rides is left out of grouping, this ride is merged into the grid on shutdown
+    EP3.occupancyGrid = OccupancyGrid(maxRadius=EP3.maxRadius)
+    app.on_shutdown(EP3.occupancyGrid.flush)
+
+    # Every ride is recorded for replay, closing writes the index so seeking needs no recovery
+    EP3.sessionRecorder = SessionArchiveWriter(session_path(), EP3.maxRadius)
+    app.on_shutdown(EP3.sessionRecorder.close)
+
+    load_dotenv()
+    onAirKey = os.getenv("ON_AIR_TOKEN")
+
+    # Over On Air stream only the changed bins to a canvas instead of a full Plotly figure per scan
+    streamFrames = onAirKey is not None
     with ui.row().classes('justify-center w-full'):
-        currentPlotContainer = ui.plotly(EP3.GUI("CURRENT")).classes('w-[600px] h-[525px]')
-        pastPlotContainer = ui.plotly(EP3.GUI("PAST")).classes('w-[600px] h-[525px]')
-        stationaryPlotContainer = ui.plotly(EP3.GUI("STATIONARY OBJECTS")).classes('w-[600px] h-[525px]')
+        if streamFrames:
+            from RadarCanvas import RadarCanvas
+            currentPlotContainer, pastPlotContainer, stationaryPlotContainer = (RadarCanvas(EP3.maxRadius) for _ in range(3))
+        else:
+            currentPlotContainer = ui.plotly(EP3.GUI("CURRENT")).classes('w-[600px] h-[525px]')
+            pastPlotContainer = ui.plotly(EP3.GUI("PAST")).classes('w-[600px] h-[525px]')
+            stationaryPlotContainer = ui.plotly(EP3.GUI("STATIONARY OBJECTS")).classes('w-[600px] h-[525px]')
         pastPlotContainer.visible = False
         stationaryPlotContainer.visible = False
 
-    ui.button("PERFORM NEW RADAR SCAN", icon='radar', on_click= lambda: EP3.next_scan(currentPlotContainer, pastPlotContainer)).props('color=orange').classes('justify-center w-full')
+    ui.button("PERFORM NEW RADAR SCAN", icon='radar', on_click= lambda: EP3.next_scan_async(currentPlotContainer, pastPlotContainer)).props('color=orange').classes('justify-center w-full')
     with ui.row().classes('items-center'):
         ui.label("RADAR Time Slice:")
         radioTimeSliceInput = ui.radio(["CURRENT", "PAST", "STATIONARY OBJECTS"], value="CURRENT", on_change= lambda e: Radar.toggle_GUI(e.value)).props('inline').classes('mr-2')
         objectsFoundLabel = ui.label("Stationary Objects Found: 0")
 
-    load_dotenv()
-    onAirKey = os.getenv("ON_AIR_TOKEN")
+    # Scan continuously at a rate that follows the rider's speed and approaching traffic
+    # The blocking serial read runs in a worker thread, so the GUI keeps responding during a scan
+    scanScheduler = ScanScheduler(lambda: EP3.next_scan_async(currentPlotContainer, pastPlotContainer),
+                                  lambda: (EP3.speedSensor.speedInMetersPerSecond, EP3.nearest_moving_range()))
+    app.on_startup(scanScheduler.start)
+    scanRateLabel = ui.label()
+    ui.timer(1.0, lambda: scanRateLabel.set_text(f"Scan rate: {scanScheduler.stats['achievedRateInHz']} Hz ({scanScheduler.decision}), skipped scans: {scanScheduler.stats['skippedScans']}"))
+    if streamFrames:
+        bandwidthLabel = ui.label()
+        ui.timer(1.0, lambda: bandwidthLabel.set_text(f"Stream: {sum(container.encoder.stats['bytesPerSecond'] for container in (currentPlotContainer, pastPlotContainer, stationaryPlotContainer)) / 1000:.1f} kB/s"))
     ui.run(native=True, dark=True, window_size=(660, 800), title='RADAR Data', on_air=onAirKey) #, reload=False, port=native.find_open_port())
@@ -0,0 +1,61 @@
+// Browser side of RadarCanvas.py, applies FrameStream.py messages to a bin grid and draws it on a canvas
+// Theta is counter-clockwise from the right like the Plotly polar plot of Radar.GUI()
+export default {
+  template: `<canvas ref="canvas" :width="size" :height="size" style="background:#4d4d4d"></canvas>`,
+  props: {
+    maxRadius: Number,
+    size: Number,
+  },
+  mounted() {
+    this.bins = new Uint8Array(this.maxRadius * 360);
+    this.sequence = null;
+    this.draw();
+
+    // Ask for a keyframe, the frames sent before this viewer joined are unknown
+    this.$emit("resync");
+  },
+  methods: {
+    applyRuns(runs, value) {
+      let index = 0;
+      for (let i = 0; i < runs.length; i += 2) {
+        index += runs[i];
+        this.bins.fill(value, index, index + runs[i + 1]);
+        index += runs[i + 1];
+      }
+    },
+    apply(message) {
+      if (message.key) {
+        this.bins.fill(0);
+      } else if (this.sequence === null || message.seq !== this.sequence + 1) {
+        // A missed message, wait for the keyframe
+        if (this.sequence !== null) this.$emit("resync");
+        this.sequence = null;
+        return;
+      }
+      this.applyRuns(message.removed, 0);
+      this.applyRuns(message.added, 1);
+      this.sequence = message.seq;
+      this.draw();
+    },
+    draw() {
+      const context = this.$refs.canvas.getContext("2d");
+      const center = this.size / 2;
+      const scale = (this.size / 2 - 4) / this.maxRadius;
+      context.clearRect(0, 0, this.size, this.size);
+
+      context.strokeStyle = "#808080";
+      for (const ring of [100, 200, this.maxRadius]) {
+        context.beginPath();
+        context.arc(center, center, ring * scale, 0, 2 * Math.PI);
+        context.stroke();
+      }
+
+      context.fillStyle = "red";
+      for (let index = this.bins.indexOf(1); index !== -1; index = this.bins.indexOf(1, index + 1)) {
+        const radius = Math.floor(index / 360) * scale;
+        const theta = ((index % 360) * Math.PI) / 180;
+        context.fillRect(center + radius * Math.cos(theta) - 2, center - radius * Math.sin(theta) - 2, 4, 4);
+      }
+    },
+  },
+};
@@ -0,0 +1,64 @@
+#!/usr/bin/env python
+
+# NiceGUI element that streams radar time slices as FrameStream.py deltas to a canvas in the browser
+# https://nicegui.io/documentation/section_advanced_concepts#custom_vue_components
+# https://developer.mozilla.org/en-US/docs/Web/API/Canvas_API
+#
+# A drop-in for the ui.plotly containers of Radar.py: push() replaces setting .figure and calling
+# update(). Every push sends one FrameDeltaEncoder message to the browser with run_method() and the
+# RadarCanvas.js component applies it to its own copy of the bins and redraws. A viewer that joins
+# late or misses a message emits "resync" and the next push is a keyframe.
+
+# 3rd party libraries
+from nicegui import ui              # pip install nicegui
+import numpy as np                  # pip install numpy
+
+# Internal libraries
+from FrameStream import KEYFRAME_INTERVAL, FrameDeltaEncoder
+
+
+class RadarCanvas(ui.element, component='RadarCanvas.js'):
+
+    def __init__(self, maxRadius: int = 300, size: int = 525, keyframeInterval: int = KEYFRAME_INTERVAL):
+        """ Create the canvas element in the current NiceGUI context.
+
+        Args:
+            maxRadius (int, optional): Number of radius bins of the time slices. Defaults to 300.
+            size (int, optional): Width and height of the canvas in pixels. Defaults to 525.
+            keyframeInterval (int, optional): Frames between keyframes. Defaults to 50.
+        """
+        super().__init__()
+        self._props["maxRadius"] = maxRadius
+        self._props["size"] = size
+        self.encoder = FrameDeltaEncoder(maxRadius, keyframeInterval)
+        self.on("resync", lambda: self.encoder.request_keyframe())
+
+
+    def __str__(self):
+        return f"RadarCanvas(encoder={self.encoder})"
+
+
+    def push(self, dataTimeSlice: np.ndarray):
+        """ Send the changes of a time slice to the browser
+
+        Args:
+            dataTimeSlice (np.ndarray): Boolean (maxRadius, 360) time slice.
+        """
+        self.run_method("apply", self.encoder.encode(dataTimeSlice))
+
+
+def unit_test():
+    # Without a running event loop run_method() sends nothing, the encoder still counts every frame
+    canvas = RadarCanvas(300)
+    dataTimeSlice = np.zeros((300, 360), dtype=bool)
+    dataTimeSlice[40, 10:14] = True
+    canvas.push(dataTimeSlice)
+    dataTimeSlice[41, 12] = True
+    canvas.push(dataTimeSlice)
+    assert canvas.encoder.stats["frames"] == 2 and canvas.encoder.stats["keyframes"] == 1 and canvas.props["maxRadius"] == 300
+    print(canvas)
+    print("All tests passed!")
+
+
+if __name__ == "__main__":
+    unit_test()
@@ -0,0 +1,211 @@
+#!/usr/bin/env python
+
+# Places radar detections from Radar.py (bike-relative polar bins) on the map as GPS coordinates and Slippy-map tiles
+# https://www.movable-type.co.uk/scripts/latlong.html#destPoint
+# https://en.wikipedia.org/wiki/Equirectangular_projection
+# https://wiki.openstreetmap.org/wiki/Slippy_map_tilenames
+#
+# The radar reaches at most 300 meters, so a detection is placed with a local flat-earth offset from
+# the rider's GPS fix instead of a great circle per point (under 1 cm of error at that range). Every
+# detection of a frame is transformed in one NumPy batch: polar bins to north/east meters, meters to
+# latitude/longitude, and latitude/longitude to tile and pixel with TileMath.get_tile_pixel_XY_array().
+
+# Standard library imports not needing pip installs
+import math
+
+# 3rd party libraries
+import numpy as np                  # pip install numpy
+
+# Internal libraries
+from GeoMath import EARTH_RADIUS_IN_METERS
+from TileMath import get_tile_pixel_XY_array
+from QuadKey import tileXY_to_quadkey_int_array, quadkey_int_to_str
+from PolarGeometry import polar_to_cartesian_array
+
+# Radar.find_stationary_points() moves the bike towards 270 degrees (down in the Radar.py GUI), so that bin is straight ahead
+RADAR_FORWARD_THETA = 270
+
+# Same leaf zoom as RiskHeatMap.LEAF_ZOOM, about 0.6 meters per pixel at the equator
+DEFAULT_ZOOM_LEVEL = 18
+
+
+def polar_to_world_offsets(radius, theta, headingDegrees: float) -> tuple:
+    """ Meters north and east of the rider for radar detections in polar bins
+
+    Radar theta grows counter-clockwise while compass bearings grow clockwise, so the bearing of a
+    detection is the heading minus its angle from RADAR_FORWARD_THETA. With RADAR_FORWARD_THETA at 270
+    degrees -y is ahead and -x is to the right, rotated by the heading.
+
+    Args:
+        radius (numpy.ndarray): Radius of every detection in meters
+        theta (numpy.ndarray): Theta of every detection in degrees, counter-clockwise like Radar.py
+        headingDegrees (float): Heading of the rider in degrees clockwise from north
+
+    Returns:
+        tuple: float64 arrays (north, east) in meters.
+    """
+    x, y = polar_to_cartesian_array(radius, theta)
+    heading = math.radians(headingDegrees)
+    cosHeading, sinHeading = math.cos(heading), math.sin(heading)
+
+    return (x * sinHeading - y * cosHeading, -x * cosHeading - y * sinHeading)
+
+
+def world_offsets_to_map(north, east, lat: float, lon: float, zoomLevel: int = DEFAULT_ZOOM_LEVEL) -> tuple:
+    """ GPS coordinates, tiles and tile pixels of points given in meters from the rider
+
+    Args:
+        north (numpy.ndarray): Meters north of the rider
+        east (numpy.ndarray): Meters east of the rider
+        lat (float): Latitude of the rider in degrees
+        lon (float): Longitude of the rider in degrees
+        zoomLevel (int, optional): Zoom level of the tiles. Defaults to 18.
+
+    Returns:
+        tuple: Arrays (lat, lon, x, y, pixelX, pixelY), one entry per point.
+    """
+    pointLat = lat + np.degrees(north / EARTH_RADIUS_IN_METERS)
+    pointLon = lon + np.degrees(east / (EARTH_RADIUS_IN_METERS * math.cos(math.radians(lat))))
+    x, y, pixelX, pixelY = get_tile_pixel_XY_array(zoomLevel, pointLat, pointLon)
+
+    return (pointLat, pointLon, x, y, pixelX, pixelY)
+
+
+def georeference_detections(radius, theta, lat: float, lon: float, headingDegrees: float, zoomLevel: int = DEFAULT_ZOOM_LEVEL) -> tuple:
+    """ GPS coordinates, tiles and tile pixels of radar detections in one batch
+
+    Args:
+        radius (numpy.ndarray): Radius of every detection in meters
+        theta (numpy.ndarray): Theta of every detection in degrees, counter-clockwise like Radar.py
+        lat (float): Latitude of the rider in degrees
+        lon (float): Longitude of the rider in degrees
+        headingDegrees (float): Heading of the rider in degrees clockwise from north
+        zoomLevel (int, optional): Zoom level of the tiles. Defaults to 18.
+
+    Returns:
+        tuple: Arrays (lat, lon, x, y, pixelX, pixelY), one entry per detection.
+    """
+    north, east = polar_to_world_offsets(radius, theta, headingDegrees)
+
+    return world_offsets_to_map(north, east, lat, lon, zoomLevel)
+
+
+class RadarGeoreference:
+
+    def __init__(self, zoomLevel: int = DEFAULT_ZOOM_LEVEL):
+        """ Turn radar frames and stationary objects into map coordinates for the rider's current pose.
+
+        Args:
+            zoomLevel (int, optional): Zoom level of the tiles and of the risk map tile ids. Defaults to 18.
+        """
+        self.zoomLevel = zoomLevel
+
+        self.stats = {"frames": 0, "detections": 0, "taggedRisks": 0}
+
+
+    def __str__(self):
+        return f"RadarGeoreference(zoomLevel={self.zoomLevel}, stats={self.stats})"
+
+
+    def frame(self, dataTimeSlice: np.ndarray, lat: float, lon: float, headingDegrees: float) -> tuple:
+        """ Georeference every detection of a radar time slice
+
+        Args:
+            dataTimeSlice (np.ndarray): Boolean (maxRadius, 360) array like Radar.dataTimeSliceCurrent
+            lat (float): Latitude of the rider in degrees
+            lon (float): Longitude of the rider in degrees
+            headingDegrees (float): Heading of the rider in degrees clockwise from north
+
+        Returns:
+            tuple: Arrays (lat, lon, x, y, pixelX, pixelY), one entry per detection in radius-major order.
+        """
+        radius, theta = np.nonzero(dataTimeSlice)
+        self.stats["frames"] += 1
+        self.stats["detections"] += len(radius)
+
+        return georeference_detections(radius, theta, lat, lon, headingDegrees, self.zoomLevel)
+
+
+    def tag_risks(self, stationaryObjects: list, lat: float, lon: float, headingDegrees: float) -> list:
+        """ Set the map tile id of the risk of every stationary object to the tile under its centroid
+
+        Args:
+            stationaryObjects (list): StationaryObject instances, like Radar.stationaryObjects
+            lat (float): Latitude of the rider in degrees
+            lon (float): Longitude of the rider in degrees
+            headingDegrees (float): Heading of the rider in degrees clockwise from north
+
+        Returns:
+            list: The quadkey set on each object's risk, None for objects without points.
+        """
+        objects = [obj for obj in stationaryObjects if len(obj.radius) > 0]
+        if len(objects) == 0:
+            return [None] * len(stationaryObjects)
+
+        # Centroids in meters for all objects at once, then one tile lookup for the whole frame
+        owners = np.repeat(np.arange(len(objects)), [len(obj.radius) for obj in objects])
+        north, east = polar_to_world_offsets(np.concatenate([obj.radius for obj in objects]), np.concatenate([obj.theta for obj in objects]), headingDegrees)
+        counts = np.bincount(owners)
+        _, _, x, y, _, _ = world_offsets_to_map(np.bincount(owners, north) / counts, np.bincount(owners, east) / counts, lat, lon, self.zoomLevel)
+        quadkeys = iter([quadkey_int_to_str(quadkey) for quadkey in tileXY_to_quadkey_int_array(self.zoomLevel, x, y).tolist()])
+
+        tileIds = []
+        for obj in stationaryObjects:
+            if len(obj.radius) == 0:
+                tileIds.append(None)
+                continue
+            tileId = next(quadkeys)
+            obj.risk.set_map_title_id(tileId)
+            tileIds.append(tileId)
+        self.stats["taggedRisks"] += len(objects)
+
+        return tileIds
+
+
+def unit_test():
+    from GeoMath import haversine_distance, initial_bearing
+    from TileMath import get_tile_pixel_XY
+    from QuadKey import tileXY_to_quadkey
+    from StationaryObject import StationaryObject
+
+    lat, lon = 36.149727, -115.334172
+
+    # Straight ahead is north when heading north and east when heading east, theta 0 is on the left
+    north, east = polar_to_world_offsets([100, 100, 100], [RADAR_FORWARD_THETA, 0, 180], 0)
+    assert np.allclose(north, [100, 0, 0]) and np.allclose(east, [0, -100, 100])
+    north, east = polar_to_world_offsets([100], [RADAR_FORWARD_THETA], 90)
+    assert np.allclose(north, [0], atol=1e-9) and np.allclose(east, [100])
+
+    # The flat-earth offsets agree with the great circle distance and bearing to well under a meter
+    radius = np.array([10, 150, 299])
+    theta = np.array([RADAR_FORWARD_THETA, 45, 300])
+    detectionLat, detectionLon, x, y, pixelX, pixelY = georeference_detections(radius, theta, lat, lon, 30)
+    for i in range(len(radius)):
+        assert abs(haversine_distance(lat, lon, detectionLat[i], detectionLon[i]) - radius[i]) < 0.01
+        expectedBearing = (30 - (theta[i] - RADAR_FORWARD_THETA)) % 360
+        assert abs((initial_bearing(lat, lon, detectionLat[i], detectionLon[i]) - expectedBearing + 180) % 360 - 180) < 0.01
+        assert (x[i], y[i], pixelX[i], pixelY[i]) == get_tile_pixel_XY(DEFAULT_ZOOM_LEVEL, detectionLat[i], detectionLon[i])
+
+    # A whole frame in one call, in the same order as Radar.create_plot_points()
+    georeference = RadarGeoreference()
+    dataTimeSlice = np.zeros((300, 360), dtype=bool)
+    dataTimeSlice[40, [0, 3]] = True
+    dataTimeSlice[100, 359] = True
+    frameLat, frameLon, _, _, _, _ = georeference.frame(dataTimeSlice, lat, lon, 0)
+    assert len(frameLat) == 3 and frameLon[0] < lon and georeference.stats["detections"] == 3
+
+    # Risks are tagged with the tile under the centroid of each object
+    pole = StationaryObject()
+    pole.add_point(50, 269)
+    pole.add_point(50, 271)
+    empty = StationaryObject()
+    tileIds = georeference.tag_risks([pole, empty], lat, lon, 0)
+    poleLat = lat + math.degrees(50 * math.cos(math.radians(1)) / EARTH_RADIUS_IN_METERS)
+    assert tileIds[1] is None and pole.risk.mapTitleId == tileIds[0]
+    assert tileIds[0] == tileXY_to_quadkey(DEFAULT_ZOOM_LEVEL, *get_tile_pixel_XY(DEFAULT_ZOOM_LEVEL, poleLat, lon)[:2])
+    print(georeference)
+    print("All tests passed!")
+
+
+if __name__ == "__main__":
+    unit_test()
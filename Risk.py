@@ -3,12 +3,9 @@
 # Standard library imports not needing pip installs
 import uuid
 import random
-import asyncio
-import math
 
-# Third-party library imports
-import zmq
-import zmq.asyncio
+# Internal libraries
+from TileMath import get_tile_XY, get_tile_XY_array, convert_tile_XY_to_LatLon
 
 class Risk:
 
@@ -119,21 +116,45 @@ class Risk:
         self.mapTitleId = mapId
 
     def convert_lat_long_to_tile_id(lat: float, lon: float, zoom: int):
-        n = 2 ** zoom
-        latRad = math.radians(lat)
-        xTile = int((lon + 180.0) / 360.0 * n)
-        yTile = int((1.0 - math.asinh(math.tan(latRad)) / math.pi) / 2.0 * n)
+        """ Converts GPS coordinates to the Slippy-map tile containing them, see TileMath.get_tile_XY()
 
-        return xTile, yTile
+        Args:
+            lat (float): The latitude in degrees
+            lon (float): The longitude in degrees
+            zoom (int): The zoom level
+
+        Returns:
+            tuple: The tile coordinates (x, y).
+        """
+        return get_tile_XY(zoom, lat, lon)
+
+
+    def convert_lat_long_to_tile_id_array(lat, lon, zoom: int):
+        """ Vectorized convert_lat_long_to_tile_id() for NumPy arrays of risk locations
+
+        Args:
+            lat (numpy.ndarray): The latitudes in degrees
+            lon (numpy.ndarray): The longitudes in degrees
+            zoom (int): The zoom level
+
+        Returns:
+            tuple: int64 arrays of tile coordinates (x, y).
+        """
+        return get_tile_XY_array(zoom, lat, lon)
 
 
     def convert_tile_id_to_lat_long(xTile: int, yTile: int, zoom: int):
-        n = 2 ** zoom
-        lon = xTile / n * 360.0 - 180.0
-        latRad = math.atan(math.sinh(math.pi * (1 - 2 * yTile / n)))
-        lat = math.degrees(latRad)
+        """ Converts a Slippy-map tile to the unrounded GPS coordinates of its upper left corner
+
+        Args:
+            xTile (int): The x-coordinate of the tile.
+            yTile (int): The y-coordinate of the tile.
+            zoom (int): The zoom level
 
-        return lat, lon
+        Returns:
+            tuple: The latitude and longitude.
+        """
+        return convert_tile_XY_to_LatLon(zoom, xTile, yTile, decimals=None)
 
     def set_risk_direction(self, newDirection: int):
         """ Sets the direction that a risk object is approaching model from
@@ -161,6 +182,7 @@ class Risk:
             None
         """
         global context, socket
+        import zmq.asyncio                  # pip install pyzmq, only needed once risks are published
 
         context = zmq.asyncio.Context()
         socket = context.socket(zmq.PUSH)
@@ -184,6 +206,8 @@ class Risk:
         Args:
             None
         """
+        import asyncio
+
         asyncio.run(send_loop())
 
 
@@ -0,0 +1,253 @@
+#!/usr/bin/python3
+
+# Buckets Risk objects by Slippy-map tile so the map can draw a risk heat layer at any zoom level
+# https://wiki.openstreetmap.org/wiki/Slippy_map_tilenames
+# https://learn.microsoft.com/en-us/bingmaps/articles/bing-maps-tile-system
+
+# Standard library imports not needing pip installs
+import random
+
+# Internal libraries
+from Risk import Risk
+from QuadKey import tileXY_to_quadkey, tileXY_to_quadkey_int, quadkey_int_to_str, quadkey_str_to_int, quadkey_int_to_tileXY, children
+
+# Index into a tile bucket, Risk.LOW, Risk.MEDIUM and Risk.HIGH index their own severity counts
+COUNT = 0
+
+
+class RiskHeatMap:
+    """ Per-tile risk counts and max severity, maintained incrementally for every zoom level.
+
+    Risks are placed in their LEAF_ZOOM tile and every coarser tile is the quadkey prefix of that
+    leaf tile, so one insert or removal updates LEAF_ZOOM + 1 buckets and nothing is ever recomputed.
+    Buckets are keyed by integer quadkeys (see QuadKey.py) where the prefix is a right shift.
+    """
+
+    LEAF_ZOOM = 18
+
+    def __init__(self, leafZoom: int = LEAF_ZOOM):
+        """ Initialize an empty heat map.
+
+        Args:
+            leafZoom (int, optional): Zoom level risks are bucketed at. Defaults to 18.
+        """
+        self.leafZoom = leafZoom
+
+        # One dict per zoom level mapping integer quadkey to [COUNT, LOW count, MEDIUM count, HIGH count]
+        self.levels = [{} for _ in range(leafZoom + 1)]
+
+        # Risk id to (leaf integer quadkey, severity) so removals and severity changes undo the right bucket
+        self.riskTiles = {}
+
+
+    def __len__(self):
+        return len(self.riskTiles)
+
+
+    def __str__(self):
+        return f"RiskHeatMap(leafZoom={self.leafZoom}, risks={len(self.riskTiles)}, leafTiles={len(self.levels[self.leafZoom])})"
+
+
+    def add_risk(self, risk: Risk, lat: float, lon: float) -> str:
+        """ Add a risk at a GPS location and set its map tile id to the leaf quadkey.
+
+        Args:
+            risk (Risk): The risk to add.
+            lat (float): The latitude in degrees
+            lon (float): The longitude in degrees
+
+        Returns:
+            str: The leaf quadkey the risk was bucketed into.
+        """
+        if risk.id in self.riskTiles:
+            raise ValueError(f"Risk {risk.id} is already in the heat map")
+
+        x, y = Risk.convert_lat_long_to_tile_id(lat, lon, self.leafZoom)
+        quadkey = tileXY_to_quadkey_int(self.leafZoom, x, y)
+        risk.set_map_title_id(quadkey_int_to_str(quadkey))
+
+        self.riskTiles[risk.id] = (quadkey, risk.severity)
+        self._apply(quadkey, risk.severity, 1)
+
+        return risk.mapTitleId
+
+
+    def remove_risk(self, risk: Risk):
+        """ Remove a risk from every tile bucket it was counted in.
+
+        Args:
+            risk (Risk): The risk to remove.
+        """
+        if risk.id not in self.riskTiles:
+            raise ValueError(f"Risk {risk.id} is not in the heat map")
+
+        quadkey, severity = self.riskTiles.pop(risk.id)
+        self._apply(quadkey, severity, -1)
+
+
+    def move_risk(self, risk: Risk, lat: float, lon: float) -> str:
+        """ Move a risk to a new GPS location.
+
+        Args:
+            risk (Risk): The risk to move.
+            lat (float): The new latitude in degrees
+            lon (float): The new longitude in degrees
+
+        Returns:
+            str: The new leaf quadkey of the risk.
+        """
+        self.remove_risk(risk)
+
+        return self.add_risk(risk, lat, lon)
+
+
+    def update_risk_severity(self, risk: Risk, newSeverity: int):
+        """ Change the severity of a risk and move its count to the new severity in every bucket.
+
+        Args:
+            risk (Risk): The risk to update.
+            newSeverity (int): The new severity to set.
+        """
+        risk.set_risk_severity(newSeverity)
+
+        if risk.id in self.riskTiles:
+            quadkey, oldSeverity = self.riskTiles[risk.id]
+            self._apply(quadkey, oldSeverity, -1)
+            self._apply(quadkey, newSeverity, 1)
+            self.riskTiles[risk.id] = (quadkey, newSeverity)
+
+
+    def tile_summary(self, zoomLevel: int, x: int, y: int) -> tuple:
+        """ Get the risk count and max severity of one tile.
+
+        Args:
+            zoomLevel (int): The zoom level between 0 and leafZoom
+            x (int): The x-coordinate of the tile.
+            y (int): The y-coordinate of the tile.
+
+        Returns:
+            tuple: (count, maxSeverity) where maxSeverity is None for a tile without risks.
+        """
+        bucket = self.levels[zoomLevel].get(tileXY_to_quadkey_int(zoomLevel, x, y))
+        if bucket is None:
+            return (0, None)
+
+        return (bucket[COUNT], RiskHeatMap.max_severity(bucket))
+
+
+    def heat_layer(self, zoomLevel: int, quadkeyPrefix: str = "") -> dict:
+        """ Get every tile with risks at a zoom level, optionally limited to the area of a coarser tile.
+
+        The search walks down from quadkeyPrefix through occupied child tiles only, so the cost
+        depends on the number of tiles returned and not on the total number of risks.
+
+        Args:
+            zoomLevel (int): The zoom level of the returned tiles.
+            quadkeyPrefix (str, optional): Quadkey of the area to query. Defaults to "" (whole world).
+
+        Returns:
+            dict: (zoomLevel, x, y) tile ID to (count, maxSeverity).
+        """
+        if zoomLevel > self.leafZoom or len(quadkeyPrefix) > zoomLevel:
+            raise ValueError(f"Zoom level {zoomLevel} is outside of quadkey prefix '{quadkeyPrefix}' and leaf zoom {self.leafZoom}")
+
+        layer = {}
+        prefix = quadkey_str_to_int(quadkeyPrefix)
+        if prefix not in self.levels[len(quadkeyPrefix)]:
+            return layer
+
+        stack = [(prefix, len(quadkeyPrefix))]
+        while stack:
+            quadkey, level = stack.pop()
+            if level == zoomLevel:
+                bucket = self.levels[zoomLevel][quadkey]
+                layer[quadkey_int_to_tileXY(quadkey)] = (bucket[COUNT], RiskHeatMap.max_severity(bucket))
+            else:
+                for child in children(quadkey):
+                    if child in self.levels[level + 1]:
+                        stack.append((child, level + 1))
+
+        return layer
+
+
+    def heat_layer_for_tiles(self, tiles: list) -> dict:
+        """ Get the risk summary of a list of (zoomLevel, x, y) tiles, like the output of SlippyMap.find_surrounding_tiles()
+
+        Args:
+            tiles (list): Tile IDs to look up.
+
+        Returns:
+            dict: (zoomLevel, x, y) tile ID to (count, maxSeverity) for every tile in the list.
+        """
+        return {tile: self.tile_summary(*tile) for tile in tiles}
+
+
+    def max_severity(bucket: list):
+        """ Get the highest severity that still has risks in a tile bucket.
+
+        Args:
+            bucket (list): A [COUNT, LOW, MEDIUM, HIGH] tile bucket.
+
+        Returns:
+            int: Risk.HIGH, Risk.MEDIUM, Risk.LOW or None if the bucket is empty.
+        """
+        for severity in (Risk.HIGH, Risk.MEDIUM, Risk.LOW):
+            if bucket[severity] > 0:
+                return severity
+
+        return None
+
+
+    def _apply(self, quadkey: int, severity: int, delta: int):
+        """ Add delta to a leaf tile and all of its parent tiles, deleting buckets that become empty.
+        """
+        for zoomLevel in range(self.leafZoom + 1):
+            key = quadkey >> (2 * (self.leafZoom - zoomLevel))
+            bucket = self.levels[zoomLevel].setdefault(key, [0, 0, 0, 0])
+            bucket[COUNT] += delta
+            bucket[severity] += delta
+            if bucket[COUNT] == 0:
+                del self.levels[zoomLevel][key]
+
+
+def unit_test():
+    heatMap = RiskHeatMap()
+    low = Risk(Risk.LOW)
+    high = Risk(Risk.HIGH)
+    medium = Risk(Risk.MEDIUM)
+
+    quadkey = heatMap.add_risk(low, 36.159334, -115.152807)
+    assert low.mapTitleId == quadkey and len(quadkey) == RiskHeatMap.LEAF_ZOOM
+    assert quadkey_int_to_tileXY(heatMap.riskTiles[low.id][0]) == (RiskHeatMap.LEAF_ZOOM, *Risk.convert_lat_long_to_tile_id(36.159334, -115.152807, RiskHeatMap.LEAF_ZOOM))
+
+    heatMap.add_risk(high, 36.159334, -115.152807)
+    heatMap.add_risk(medium, 36.144635, -115.326555)
+
+    assert heatMap.tile_summary(10, 184, 401) == (2, Risk.HIGH)
+    assert heatMap.tile_summary(0, 0, 0) == (3, Risk.HIGH)
+    assert heatMap.heat_layer(10) == {(10, 184, 401): (2, Risk.HIGH), (10, 183, 401): (1, Risk.MEDIUM)}
+    assert heatMap.heat_layer(12, tileXY_to_quadkey(10, 183, 401)) == {(12, 735, 1606): (1, Risk.MEDIUM)}
+
+    heatMap.update_risk_severity(high, Risk.LOW)
+    assert heatMap.tile_summary(10, 184, 401) == (2, Risk.LOW)
+
+    heatMap.remove_risk(low)
+    heatMap.remove_risk(high)
+    assert heatMap.tile_summary(10, 184, 401) == (0, None)
+    assert heatMap.heat_layer(10) == {(10, 183, 401): (1, Risk.MEDIUM)}
+
+    heatMap.move_risk(medium, 36.159334, -115.152807)
+    assert heatMap.heat_layer(10) == {(10, 184, 401): (1, Risk.MEDIUM)}
+    assert all(len(level) == 1 for level in heatMap.levels)
+    print("All tests passed!")
+
+
+if __name__ == "__main__":
+    unit_test()
+
+    heatMap = RiskHeatMap()
+    for _ in range(1000):
+        heatMap.add_risk(Risk(random.randint(Risk.LOW, Risk.HIGH)), random.uniform(36.0, 36.3), random.uniform(-115.4, -115.0))
+
+    print(heatMap)
+    print(heatMap.heat_layer(10))
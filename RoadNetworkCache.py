@@ -0,0 +1,294 @@
+#!/usr/bin/env python
+
+# Reuse road network graphs instead of downloading and consolidating them on every start
+# https://networkx.org/documentation/stable/reference/readwrite/gpickle.html
+# https://osmnx.readthedocs.io/en/stable/user-reference.html#osmnx.graph.graph_from_point
+#
+# Graphs are keyed by (center snapped to a gridInMeters grid, radius, network type, consolidated) and
+# pickled to one file each, the key is encoded in the file name so the folder is the index. A graph is
+# built around the snapped center with one extra grid cell of radius, so every request whose center
+# snaps to the same cell is fully covered. A request for a smaller area inside any cached graph of the
+# same kind is answered by cutting that graph down to the requested bounding box.
+
+# Standard library imports not needing pip installs
+import math
+import os
+import pickle
+import re
+
+# Internal libraries
+from GeoMath import EARTH_RADIUS_IN_METERS, bbox_from_point
+
+DEFAULT_CACHE_FOLDER = os.path.join(os.path.dirname(os.path.abspath(__file__)), "cache", "graphs")
+DEFAULT_GRID_IN_METERS = 100
+
+# Cached graphs kept in memory as well as on disk
+MAX_GRAPHS_IN_MEMORY = 4
+
+FILE_NAME_PATTERN = re.compile(r"^(?P<networkType>[a-z_]+)_(?P<consolidated>[01])_(?P<latIndex>-?\d+)_(?P<lonIndex>-?\d+)_(?P<radius>\d+)\.pickle$")
+
+
+class RoadNetworkCache:
+
+    def __init__(self, folder: str = DEFAULT_CACHE_FOLDER, gridInMeters: float = DEFAULT_GRID_IN_METERS):
+        """ Open (or create) the graph cache folder.
+
+        Args:
+            folder (str, optional): Folder of the pickled graphs. Defaults to cache/graphs.
+            gridInMeters (float, optional): Size of the grid map centers are snapped to. Defaults to 100 m.
+        """
+        self.folder = folder
+        self.gridInMeters = gridInMeters
+        self.gridInDegrees = math.degrees(gridInMeters / EARTH_RADIUS_IN_METERS)
+        os.makedirs(folder, exist_ok=True)
+
+        # Key to graph of the most recently used graphs, in use order
+        self.graphs = {}
+
+        self.stats = {"memoryHits": 0, "diskHits": 0, "subsets": 0, "builds": 0}
+
+
+    def __str__(self):
+        return f"RoadNetworkCache(folder={self.folder}, cached={len(self.cached_keys())}, stats={self.stats})"
+
+
+    def key(self, mapCenter: tuple, radius: int, networkType: str, consolidated: bool) -> tuple:
+        """ Cache key of a graph request, with the center snapped to the grid
+
+        Args:
+            mapCenter (tuple): The center point of the map in (latitude, longitude) format
+            radius (int): The square radius of the map in meters
+            networkType (str): osmnx network type like "bike".
+            consolidated (bool): True for graphs with consolidated intersections.
+
+        Returns:
+            tuple: (networkType, consolidated, latIndex, lonIndex, radius)
+        """
+        return (networkType, bool(consolidated), round(mapCenter[0] / self.gridInDegrees), round(mapCenter[1] / self.gridInDegrees), int(radius))
+
+
+    def key_center(self, key: tuple) -> tuple:
+        return (key[2] * self.gridInDegrees, key[3] * self.gridInDegrees)
+
+
+    def path(self, key: tuple) -> str:
+        networkType, consolidated, latIndex, lonIndex, radius = key
+        return os.path.join(self.folder, f"{networkType}_{int(consolidated)}_{latIndex}_{lonIndex}_{radius}.pickle")
+
+
+    def cached_keys(self) -> list:
+        """ Keys of every graph stored in the cache folder
+
+        Returns:
+            list: (networkType, consolidated, latIndex, lonIndex, radius) keys.
+        """
+        keys = []
+        for fileName in os.listdir(self.folder):
+            match = FILE_NAME_PATTERN.match(fileName)
+            if match:
+                keys.append((match["networkType"], match["consolidated"] == "1", int(match["latIndex"]), int(match["lonIndex"]), int(match["radius"])))
+
+        return keys
+
+
+    def get_graph(self, mapCenter: tuple, radius: int, networkType: str, consolidated: bool, build):
+        """ Get a road network graph from the cache, building and storing it on a miss
+
+        Args:
+            mapCenter (tuple): The center point of the map in (latitude, longitude) format
+            radius (int): The square radius of the map in meters
+            networkType (str): osmnx network type like "bike".
+            consolidated (bool): True for graphs with consolidated intersections.
+            build (function): Builds the graph from (mapCenter, radius), only called on a miss.
+
+        Returns:
+            networkx.MultiDiGraph: The road network graph.
+        """
+        key = self.key(mapCenter, radius, networkType, consolidated)
+
+        # A graph covering the requested area, the exact key first and then the smallest larger one
+        candidates = [cachedKey for cachedKey in self.cached_keys() if cachedKey[:2] == key[:2] and self.covers(cachedKey, mapCenter, radius)]
+        candidates.sort(key=lambda cachedKey: (cachedKey != key, cachedKey[4]))
+        for cachedKey in candidates:
+            graph = self.load(cachedKey)
+            if graph is None:
+                continue
+            if cachedKey == key:
+                return graph
+
+            subset = subset_graph(graph, mapCenter, radius)
+            if subset is not None:
+                self.stats["subsets"] += 1
+                return subset
+
+        self.stats["builds"] += 1
+        graph = build(self.key_center(key), radius + self.gridInMeters)
+        self.store(key, graph)
+
+        return graph
+
+
+    def covers(self, cachedKey: tuple, mapCenter: tuple, radius: int) -> bool:
+        """ True if a cached graph includes the whole bounding box of a request
+
+        Args:
+            cachedKey (tuple): Key of the cached graph.
+            mapCenter (tuple): The center point of the map in (latitude, longitude) format
+            radius (int): The square radius of the map in meters
+
+        Returns:
+            bool: True if the request can be cut out of the cached graph.
+        """
+        cachedNorth, cachedSouth, cachedEast, cachedWest = bbox_from_point(*self.key_center(cachedKey), cachedKey[4] + self.gridInMeters)
+        north, south, east, west = bbox_from_point(*mapCenter, radius)
+
+        return cachedSouth <= south and north <= cachedNorth and cachedWest <= west and east <= cachedEast
+
+
+    def load(self, key: tuple):
+        """ Get a cached graph from memory or unpickle it from the cache folder
+
+        Args:
+            key (tuple): Key of the graph.
+
+        Returns:
+            networkx.MultiDiGraph: The graph, or None if the file can not be read.
+        """
+        graph = self.graphs.pop(key, None)
+        if graph is not None:
+            self.stats["memoryHits"] += 1
+        else:
+            try:
+                with open(self.path(key), "rb") as file:
+                    graph = pickle.load(file)
+            except (OSError, pickle.UnpicklingError, EOFError) as e:
+                print(f"Error reading cached graph {self.path(key)}: {e}")
+                return None
+            self.stats["diskHits"] += 1
+
+        self.remember(key, graph)
+
+        return graph
+
+
+    def store(self, key: tuple, graph):
+        """ Pickle a graph to the cache folder and keep it in memory
+
+        Args:
+            key (tuple): Key of the graph.
+            graph (networkx.MultiDiGraph): The graph to store.
+        """
+        path = self.path(key)
+        temporaryPath = f"{path}.tmp{os.getpid()}"
+        with open(temporaryPath, "wb") as file:
+            pickle.dump(graph, file, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(temporaryPath, path)
+
+        self.remember(key, graph)
+
+
+    def remember(self, key: tuple, graph):
+        self.graphs.pop(key, None)
+        self.graphs[key] = graph
+        while len(self.graphs) > MAX_GRAPHS_IN_MEMORY:
+            del self.graphs[next(iter(self.graphs))]
+
+
+def node_latlon(graph, data: dict) -> tuple:
+    """ GPS location of a graph node, from the lat/lon osmnx keeps on projected graphs or from an unprojected x/y
+
+    Args:
+        graph (networkx.MultiDiGraph): The graph of the node.
+        data (dict): Attributes of the node.
+
+    Returns:
+        tuple: (lat, lon), or None if the node has no GPS location.
+    """
+    if "lat" in data and "lon" in data:
+        lat, lon = data["lat"], data["lon"]
+        # Consolidated intersections can keep the locations of every merged node
+        if isinstance(lat, (list, tuple)):
+            lat, lon = sum(lat) / len(lat), sum(lon) / len(lon)
+        return (lat, lon)
+
+    crs = str(graph.graph.get("crs", "epsg:4326")).lower()
+    if crs in ("epsg:4326", "wgs84") and "x" in data and "y" in data:
+        return (data["y"], data["x"])
+
+    return None
+
+
+def subset_graph(graph, mapCenter: tuple, radius: int):
+    """ Cut the nodes inside the bounding box of a request out of a larger graph, like osmnx.truncate.truncate_graph_bbox()
+
+    Args:
+        graph (networkx.MultiDiGraph): The larger graph.
+        mapCenter (tuple): The center point of the map in (latitude, longitude) format
+        radius (int): The square radius of the map in meters
+
+    Returns:
+        networkx.MultiDiGraph: A copy of the part of the graph in the box, or None if the nodes have no GPS location.
+    """
+    north, south, east, west = bbox_from_point(*mapCenter, radius)
+
+    nodes = []
+    for node, data in graph.nodes(data=True):
+        latLon = node_latlon(graph, data)
+        if latLon is None:
+            return None
+        if south <= latLon[0] <= north and west <= latLon[1] <= east:
+            nodes.append(node)
+
+    return graph.subgraph(nodes).copy()
+
+
+def unit_test():
+    import tempfile
+    import networkx as nx
+
+    def build_grid(mapCenter: tuple, radius: int):
+        # 21x21 street grid standing in for osmnx.graph_from_point()
+        builds.append((mapCenter, radius))
+        north, south, east, west = bbox_from_point(*mapCenter, radius)
+        graph = nx.MultiDiGraph(crs="epsg:4326")
+        for row in range(21):
+            for column in range(21):
+                graph.add_node((row, column), y=south + (north - south) * row / 20, x=west + (east - west) * column / 20)
+                if column > 0:
+                    graph.add_edge((row, column - 1), (row, column))
+                if row > 0:
+                    graph.add_edge((row - 1, column), (row, column))
+        return graph
+
+    builds = []
+    with tempfile.TemporaryDirectory() as folder:
+        cache = RoadNetworkCache(folder)
+        mapCenter = (36.144635, -115.326555)
+
+        graph = cache.get_graph(mapCenter, 3200, "bike", False, build_grid)
+        assert len(builds) == 1 and builds[0][1] == 3200 + DEFAULT_GRID_IN_METERS
+        assert cache.key(builds[0][0], 3200, "bike", False) == cache.key(mapCenter, 3200, "bike", False)
+
+        # A center 30 m away snaps to the same grid cell and reuses the graph
+        assert cache.get_graph((36.144635, -115.326222), 3200, "bike", False, build_grid) is graph
+        assert len(builds) == 1 and cache.stats["memoryHits"] == 1
+
+        # A new process reads the pickle, a smaller radius is cut out of the larger graph
+        cache = RoadNetworkCache(folder)
+        small = cache.get_graph(mapCenter, 1000, "bike", False, build_grid)
+        assert len(builds) == 1 and cache.stats == {"memoryHits": 0, "diskHits": 1, "subsets": 1, "builds": 0}
+        assert 0 < small.number_of_nodes() < graph.number_of_nodes()
+        north, south, east, west = bbox_from_point(*mapCenter, 1000)
+        assert all(south <= data["y"] <= north and west <= data["x"] <= east for _, data in small.nodes(data=True))
+
+        # Other network types, consolidation and areas outside the cached graph need a new build
+        cache.get_graph(mapCenter, 1000, "walk", False, build_grid)
+        cache.get_graph(mapCenter, 1000, "bike", True, build_grid)
+        cache.get_graph((36.2, -115.326555), 1000, "bike", False, build_grid)
+        assert len(builds) == 4 and len(cache.cached_keys()) == 4
+
+    print("All tests passed!")
+
+
+if __name__ == "__main__":
+    unit_test()
@@ -0,0 +1,455 @@
+#!/usr/bin/env python
+
+# Bike routing over the build_road_network() graph
+# https://en.wikipedia.org/wiki/A*_search_algorithm
+# https://www.microsoft.com/en-us/research/publication/computing-the-shortest-path-a-search-meets-graph-theory/
+#
+# The graph is copied once into forward and reverse adjacency lists of node indices, keeping the
+# shortest of parallel edges. Preprocessing picks landmarks by farthest point selection and stores the
+# shortest distance from and to every landmark; the triangle inequality over those tables gives the
+# ALT lower bound that steers A* towards the destination. The tables can be saved next to the other caches and are reused
+# while the graph fingerprint matches. For rerouting a RouteSession keeps a backward Dijkstra from the
+# destination: every node it settled already knows its way to the destination, and a rider who left the
+# route only resumes the same search until their new node is settled.
+
+# Standard library imports not needing pip installs
+import heapq
+import math
+import os
+import time
+import weakref
+import zlib
+
+# 3rd party libraries
+import numpy as np                  # pip install numpy
+
+DEFAULT_LANDMARKS = 8
+
+# One RoutePlanner per graph object, built on first use
+planners = weakref.WeakKeyDictionary()
+
+
+class RoutePlanner:
+
+    def __init__(self, graph, landmarks: int = DEFAULT_LANDMARKS, cachePath: str = None):
+        """ Copy the graph into arrays and load or compute the landmark distance tables.
+
+        Args:
+            graph (networkx.MultiDiGraph): Road network graph with a length on every edge, like BikeAutoPilot.build_road_network()
+            landmarks (int, optional): Number of landmarks. Defaults to 8.
+            cachePath (str, optional): .npz file to load the landmark tables from and save them to. Defaults to None.
+        """
+        if graph.number_of_nodes() == 0:
+            raise ValueError("RoutePlanner needs a graph with nodes")
+
+        self.graph = graph
+        self.nodes = list(graph.nodes)
+        self.nodeIndex = {node: index for index, node in enumerate(self.nodes)}
+
+        # Shortest edge between each pair of nodes, parallel edges can not make a route shorter
+        lengths = {}
+        for u, v, length in graph.edges(data="length", default=None):
+            if length is None:
+                raise ValueError(f"Edge {u} -> {v} has no length")
+            key = (self.nodeIndex[u], self.nodeIndex[v])
+            lengths[key] = min(length, lengths.get(key, math.inf))
+
+        self.forward = adjacency_lists(len(self.nodes), ((u, v, length) for (u, v), length in lengths.items()))
+        self.reverse = adjacency_lists(len(self.nodes), ((v, u, length) for (u, v), length in lengths.items()))
+        # Landmarks are saved as node indices, so the fingerprint covers the node order too
+        self.fingerprint = f"{len(self.nodes)}-{len(lengths)}-{sum(lengths.values()):.3f}-{zlib.crc32(repr(self.nodes[:16]).encode())}"
+
+        self.landmarks = None
+        self.fromLandmark = None
+        self.toLandmark = None
+        if not (cachePath and self.load(cachePath, landmarks)):
+            self.choose_landmarks(landmarks)
+            if cachePath:
+                self.save(cachePath)
+
+        self.stats = {"routes": 0, "settled": 0}
+
+
+    def __str__(self):
+        return f"RoutePlanner(nodes={len(self.nodes)}, landmarks={len(self.landmarks)}, stats={self.stats})"
+
+
+    def choose_landmarks(self, count: int):
+        """ Pick landmarks far from each other and compute the distances from and to each one
+
+        Args:
+            count (int): Number of landmarks.
+        """
+        count = min(count, len(self.nodes))
+        landmarks = []
+        fromLandmark = []
+        toLandmark = []
+
+        # Start from the node farthest from an arbitrary node, then always take the node farthest from all chosen ones
+        closest = np.nan_to_num(np.array(dijkstra(self.forward, [0])), posinf=-1)
+        for _ in range(count):
+            landmark = int(np.argmax(closest))
+            if landmark in landmarks:
+                break
+            landmarks.append(landmark)
+            fromLandmark.append(dijkstra(self.forward, [landmark]))
+            toLandmark.append(dijkstra(self.reverse, [landmark]))
+            reached = np.nan_to_num(np.array(fromLandmark[-1]), posinf=-1)
+            closest = reached if len(landmarks) == 1 else np.minimum(np.where(closest < 0, reached, closest), np.where(reached < 0, closest, reached))
+            closest[landmarks] = -1
+
+        self.landmarks = np.array(landmarks, dtype=np.int64)
+        self.fromLandmark = np.array(fromLandmark)
+        self.toLandmark = np.array(toLandmark)
+
+
+    def save(self, path: str):
+        """ Save the landmark tables so the next start with the same graph skips preprocessing
+
+        Args:
+            path (str): .npz file path.
+        """
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        np.savez(path, fingerprint=np.array(self.fingerprint), landmarks=self.landmarks, fromLandmark=self.fromLandmark, toLandmark=self.toLandmark)
+
+
+    def load(self, path: str, count: int) -> bool:
+        """ Load saved landmark tables if they were computed for this graph
+
+        Args:
+            path (str): .npz file path.
+            count (int): Number of landmarks wanted.
+
+        Returns:
+            bool: True if the tables were loaded.
+        """
+        if not os.path.exists(path):
+            return False
+
+        try:
+            with np.load(path) as saved:
+                if str(saved["fingerprint"]) != self.fingerprint or len(saved["landmarks"]) != min(count, len(self.nodes)):
+                    return False
+                self.landmarks = saved["landmarks"]
+                self.fromLandmark = saved["fromLandmark"]
+                self.toLandmark = saved["toLandmark"]
+        except (OSError, ValueError, KeyError) as e:
+            print(f"Error loading landmarks from {path}: {e}")
+            return False
+
+        return True
+
+
+    def heuristic(self, target: int) -> list:
+        """ ALT lower bound of the distance from every node to a target
+
+        Args:
+            target (int): Node index of the destination.
+
+        Returns:
+            list: Meters for every node index.
+        """
+        # d(v, t) >= d(L, t) - d(L, v) and d(v, t) >= d(v, L) - d(t, L), terms with unreachable nodes are left out
+        with np.errstate(invalid="ignore"):
+            bounds = np.maximum(self.fromLandmark[:, target:target + 1] - self.fromLandmark, self.toLandmark - self.toLandmark[:, target:target + 1])
+        bounds[~np.isfinite(bounds)] = 0
+
+        return np.max(bounds, axis=0).tolist()
+
+
+    def route(self, origin, destination) -> tuple:
+        """ Shortest route between two graph nodes with ALT A*
+
+        Args:
+            origin: Graph node to start from.
+            destination: Graph node to ride to.
+
+        Returns:
+            tuple: (list of graph nodes, meters), ([], inf) if the destination can not be reached.
+        """
+        source = self.nodeIndex[origin]
+        target = self.nodeIndex[destination]
+        heuristic = self.heuristic(target)
+
+        distances = {source: 0.0}
+        previous = {source: None}
+        settled = set()
+        heap = [(heuristic[source], 0.0, source)]
+        self.stats["routes"] += 1
+
+        while heap:
+            _, distance, node = heapq.heappop(heap)
+            if node in settled:
+                continue
+            settled.add(node)
+            if node == target:
+                break
+
+            for neighbour, length in self.forward[node]:
+                candidate = distance + length
+                if candidate < distances.get(neighbour, math.inf):
+                    distances[neighbour] = candidate
+                    previous[neighbour] = node
+                    heapq.heappush(heap, (candidate + heuristic[neighbour], candidate, neighbour))
+
+        self.stats["settled"] += len(settled)
+        if target not in settled:
+            return ([], math.inf)
+
+        path = []
+        node = target
+        while node is not None:
+            path.append(self.nodes[node])
+            node = previous[node]
+
+        return (path[::-1], distances[target])
+
+
+    def session(self, destination) -> "RouteSession":
+        """ Start a reroutable session towards a destination
+
+        Args:
+            destination: Graph node to ride to.
+
+        Returns:
+            RouteSession: The session.
+        """
+        return RouteSession(self, destination)
+
+
+class RouteSession:
+
+    def __init__(self, planner: RoutePlanner, destination):
+        """ Backward Dijkstra from a destination that is only run as far as the nodes asked for.
+
+        Args:
+            planner (RoutePlanner): Planner of the graph.
+            destination: Graph node to ride to.
+        """
+        self.planner = planner
+        self.destination = destination
+        target = planner.nodeIndex[destination]
+
+        self.distances = {target: 0.0}
+        self.nextNode = {target: None}
+        self.settled = set()
+        self.heap = [(0.0, target)]
+
+        self.stats = {"reroutes": 0, "resumed": 0, "settled": 0}
+
+
+    def __str__(self):
+        return f"RouteSession(destination={self.destination}, settled={len(self.settled)}, stats={self.stats})"
+
+
+    def settle(self, node: int) -> bool:
+        """ Resume the backward search until a node is settled
+
+        Args:
+            node (int): Node index.
+
+        Returns:
+            bool: True if the node can reach the destination.
+        """
+        if node in self.settled:
+            return True
+
+        self.stats["resumed"] += 1
+        reverse = self.planner.reverse
+        while self.heap:
+            distance, current = heapq.heappop(self.heap)
+            if current in self.settled:
+                continue
+            self.settled.add(current)
+            self.stats["settled"] += 1
+
+            for neighbour, length in reverse[current]:
+                candidate = distance + length
+                if candidate < self.distances.get(neighbour, math.inf):
+                    self.distances[neighbour] = candidate
+                    self.nextNode[neighbour] = current
+                    heapq.heappush(self.heap, (candidate, neighbour))
+
+            if current == node:
+                return True
+
+        return False
+
+
+    def reroute(self, origin) -> tuple:
+        """ Shortest route from any graph node to the destination of the session
+
+        Args:
+            origin: Graph node the rider is at.
+
+        Returns:
+            tuple: (list of graph nodes, meters), ([], inf) if the destination can not be reached.
+        """
+        self.stats["reroutes"] += 1
+        source = self.planner.nodeIndex[origin]
+        if not self.settle(source):
+            return ([], math.inf)
+
+        path = []
+        node = source
+        while node is not None:
+            path.append(self.planner.nodes[node])
+            node = self.nextNode[node]
+
+        return (path, self.distances[source])
+
+
+def adjacency_lists(nodeCount: int, edges) -> list:
+    """ Outgoing (neighbour, length) pairs of every node index
+
+    Args:
+        nodeCount (int): Number of nodes.
+        edges (iterable): (from index, to index, length) triples.
+
+    Returns:
+        list: One list of (neighbour index, length) per node.
+    """
+    lists = [[] for _ in range(nodeCount)]
+    for u, v, length in edges:
+        lists[u].append((v, length))
+
+    return lists
+
+
+def dijkstra(adjacency: list, sources: list) -> list:
+    """ Shortest distance from the nearest source to every node
+
+    Args:
+        adjacency (list): Output of adjacency_lists().
+        sources (list): Node indices to start from.
+
+    Returns:
+        list: Meters for every node index, inf for nodes that can not be reached.
+    """
+    distances = [math.inf] * len(adjacency)
+    heap = []
+    for source in sources:
+        distances[source] = 0.0
+        heap.append((0.0, source))
+    heapq.heapify(heap)
+
+    while heap:
+        distance, node = heapq.heappop(heap)
+        if distance > distances[node]:
+            continue
+        for neighbour, length in adjacency[node]:
+            candidate = distance + length
+            if candidate < distances[neighbour]:
+                distances[neighbour] = candidate
+                heapq.heappush(heap, (candidate, neighbour))
+
+    return distances
+
+
+def route_planner(graph) -> RoutePlanner:
+    """ The RoutePlanner of a graph, built on the first call and reused for as long as the graph exists
+
+    Args:
+        graph (networkx.MultiDiGraph): Road network graph.
+
+    Returns:
+        RoutePlanner: The planner of the graph.
+    """
+    planner = planners.get(graph)
+    if planner is None:
+        planner = RoutePlanner(graph)
+        planners[graph] = planner
+
+    return planner
+
+
+def benchmark(routes: int = 50):
+    """ Print the time of random routes on the offline cache/ network with networkx Dijkstra and with ALT A*
+
+    Args:
+        routes (int, optional): Number of random routes. Defaults to 50.
+    """
+    import networkx as nx
+    from OfflineRoadNetwork import build_offline_road_network
+
+    graph = build_offline_road_network((36.144635, -115.326555), 3200)
+    largest = graph.subgraph(max(nx.strongly_connected_components(graph), key=len)).copy()
+
+    start = time.perf_counter()
+    planner = RoutePlanner(largest)
+    preprocessingTime = time.perf_counter() - start
+
+    random = np.random.default_rng(42)
+    pairs = [tuple(random.choice(planner.nodes, 2)) for _ in range(routes)]
+
+    start = time.perf_counter()
+    for origin, destination in pairs:
+        nx.shortest_path_length(largest, origin, destination, weight="length")
+    networkxTime = (time.perf_counter() - start) / routes
+
+    start = time.perf_counter()
+    for origin, destination in pairs:
+        planner.route(origin, destination)
+    altTime = (time.perf_counter() - start) / routes
+
+    session = planner.session(pairs[0][1])
+    path, _ = session.reroute(pairs[0][0])
+    start = time.perf_counter()
+    for node in path[1:]:
+        session.reroute(node)
+    rerouteTime = (time.perf_counter() - start) / max(len(path) - 1, 1)
+
+    print(f"{planner}: preprocessing {preprocessingTime * 1000:.0f} ms, networkx Dijkstra {networkxTime * 1000:.1f} ms, ALT A* {altTime * 1000:.1f} ms per route, "
+          f"reroute along the route {rerouteTime * 1000:.2f} ms")
+
+
+def unit_test():
+    import tempfile
+    import networkx as nx
+
+    # 10x10 two way street grid with 100 m blocks, plus a one way shortcut
+    graph = nx.grid_2d_graph(10, 10).to_directed()
+    graph = nx.MultiDiGraph(graph)
+    nx.set_edge_attributes(graph, 100.0, "length")
+    graph.add_edge((0, 0), (2, 2), length=150.0)
+
+    planner = route_planner(graph)
+    assert route_planner(graph) is planner and len(planner.landmarks) == DEFAULT_LANDMARKS
+
+    for origin, destination in [((0, 0), (9, 9)), ((3, 7), (8, 1)), ((2, 2), (0, 0)), ((5, 5), (5, 5))]:
+        path, length = planner.route(origin, destination)
+        assert length == nx.shortest_path_length(graph, origin, destination, weight="length")
+        assert path[0] == origin and path[-1] == destination
+        assert sum(min(data["length"] for data in graph[u][v].values()) for u, v in zip(path[:-1], path[1:])) == length
+    assert planner.route((0, 0), (9, 9))[1] == 150 + 1400
+
+    # The landmark bound steers the search, so far fewer nodes are settled than by Dijkstra
+    planner.stats["settled"] = 0
+    planner.route((0, 5), (9, 5))
+    assert planner.stats["settled"] < 50
+
+    # Rerouting from a node on the route needs no more search, a missed turn only resumes it
+    session = planner.session((9, 9))
+    path, length = session.reroute((0, 9))
+    assert length == 900 and session.reroute(path[3]) == (path[3:], 600)
+    assert session.stats["resumed"] == 1
+    assert session.reroute((0, 0))[1] == 1550 and session.stats["resumed"] == 2
+
+    graph.add_node("island")
+    assert RoutePlanner(graph).route((0, 0), "island") == ([], math.inf)
+    assert RoutePlanner(graph).session("island").reroute((0, 0)) == ([], math.inf)
+
+    with tempfile.TemporaryDirectory() as folder:
+        path = os.path.join(folder, "landmarks.npz")
+        saved = RoutePlanner(graph, cachePath=path)
+        loaded = RoutePlanner(graph, cachePath=path)
+        assert (loaded.fromLandmark == saved.fromLandmark).all() and loaded.landmarks.tolist() == saved.landmarks.tolist()
+        graph.add_edge((9, 9), (0, 0), length=1.0)
+        assert not RoutePlanner(graph).load(path, DEFAULT_LANDMARKS)
+
+    print("All tests passed!")
+
+
+if __name__ == "__main__":
+    unit_test()
+    benchmark()
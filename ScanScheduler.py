@@ -0,0 +1,271 @@
+#!/usr/bin/env python
+
+# Continuous radar scanning at a rate that follows the rider's speed and the closest moving object
+# https://docs.python.org/3/library/asyncio-task.html#sleeping
+# https://en.wikipedia.org/wiki/Time_to_collision
+#
+# The scan rate is the highest of three needs: the floor rate, one scan per METERS_PER_SCAN ridden and
+# FRAMES_BEFORE_CONTACT scans before the closest moving object would reach the bike, capped at the
+# ceiling rate. Scans are scheduled from the start of the previous scan. When a scan takes longer than
+# the scan period the missed scans are dropped instead of queued, so the newest radar data is never more
+# than one scan plus one period old. The scan function runs on the event loop, so blocking work like
+# a serial read has to be awaited in a worker thread (see Radar.next_scan_async()) or the GUI freezes.
+# A scan that raises, like a serial port that failed to open, is printed and counted and scanning goes
+# on at the current rate.
+
+# Standard library imports not needing pip installs
+import asyncio
+from collections import deque
+import inspect
+import math
+import time
+
+DEFAULT_MIN_RATE_IN_HZ = 0.5
+DEFAULT_MAX_RATE_IN_HZ = 10.0
+
+# Bike travel between scans at cruising speed, 10 m/s gives 5 Hz
+METERS_PER_SCAN = 2.0
+
+# Scans wanted before the closest moving object reaches the bike
+FRAMES_BEFORE_CONTACT = 8
+
+# Scan start times used for the achieved rate
+RATE_WINDOW = 20
+
+IDLE = "idle"
+SPEED = "speed"
+CLOSING = "closing"
+CAPPED = "capped"
+
+
+class ScanScheduler:
+
+    def __init__(self, scanFunction, sceneFunction, minRateInHz: float = DEFAULT_MIN_RATE_IN_HZ, maxRateInHz: float = DEFAULT_MAX_RATE_IN_HZ, clock=time.monotonic):
+        """ Initialize the scheduler, call start() from inside the running event loop to begin scanning.
+
+        Args:
+            scanFunction (callable): Runs one scan, like Radar.next_scan(), may be a coroutine function.
+            sceneFunction (callable): Returns (speed in m/s, range in meters of the closest moving object or None) after a scan.
+            minRateInHz (float, optional): Rate when standing still with nothing approaching. Defaults to 0.5.
+            maxRateInHz (float, optional): Highest rate. Defaults to 10.
+            clock (callable, optional): Seconds counter, replaceable for tests. Defaults to time.monotonic.
+        """
+        if not 0 < minRateInHz <= maxRateInHz:
+            raise ValueError(f"Scan rates must satisfy 0 < {minRateInHz} <= {maxRateInHz}")
+
+        self.scanFunction = scanFunction
+        self.sceneFunction = sceneFunction
+        self.minRateInHz = minRateInHz
+        self.maxRateInHz = maxRateInHz
+        self.clock = clock
+
+        self.rateInHz = minRateInHz
+        self.decision = IDLE
+        self.nextScanTime = None
+        self.task = None
+
+        # Closest moving object of the previous scan as (time, range)
+        self.lastNearest = None
+        self.scanStarts = deque(maxlen=RATE_WINDOW)
+
+        self.stats = {"scans": 0, "skippedScans": 0, "failedScans": 0, "rateInHz": self.rateInHz, "achievedRateInHz": 0.0, "decision": self.decision, "lastScanSeconds": 0.0, "closingSpeed": 0.0}
+
+
+    def __str__(self):
+        return f"ScanScheduler(minRateInHz={self.minRateInHz}, maxRateInHz={self.maxRateInHz}, stats={self.stats})"
+
+
+    def start(self):
+        """ Start scanning in the background, for example with nicegui.app.on_startup(scanScheduler.start)
+        """
+        if self.task is None:
+            self.task = asyncio.create_task(self.run())
+
+
+    async def stop(self):
+        """ Stop scanning after the current scan.
+        """
+        if self.task is not None:
+            self.task.cancel()
+            await asyncio.gather(self.task, return_exceptions=True)
+            self.task = None
+
+
+    async def run(self):
+        """ Scan forever at the adaptive rate.
+        """
+        while True:
+            try:
+                delay = await self.tick()
+            except Exception as e:
+                print(f"Error in radar scan: {e!r}")
+                self.stats["failedScans"] += 1
+                delay = 1 / self.rateInHz
+            await asyncio.sleep(delay)
+
+
+    def target_rate(self, speedInMetersPerSecond: float, closingSpeed: float = 0.0, nearestRange: float = None) -> tuple:
+        """ Scan rate for the current speed and closest moving object
+
+        Args:
+            speedInMetersPerSecond (float): Speed of the rider.
+            closingSpeed (float, optional): Meters per second the closest moving object gets closer. Defaults to 0.
+            nearestRange (float, optional): Range of the closest moving object in meters. Defaults to None.
+
+        Returns:
+            tuple: (rate in Hz, decision) where decision is IDLE, SPEED, CLOSING or CAPPED.
+        """
+        rate, decision = self.minRateInHz, IDLE
+
+        speedRate = speedInMetersPerSecond / METERS_PER_SCAN
+        if speedRate > rate:
+            rate, decision = speedRate, SPEED
+
+        if closingSpeed > 0 and nearestRange is not None:
+            closingRate = FRAMES_BEFORE_CONTACT * closingSpeed / max(nearestRange, 1.0)
+            if closingRate > rate:
+                rate, decision = closingRate, CLOSING
+
+        if rate > self.maxRateInHz:
+            rate, decision = self.maxRateInHz, CAPPED
+
+        return (rate, decision)
+
+
+    def observe(self, speedInMetersPerSecond: float, nearestRange: float = None, now: float = None):
+        """ Update the scan rate from the scene after a scan
+
+        Args:
+            speedInMetersPerSecond (float): Speed of the rider.
+            nearestRange (float, optional): Range of the closest moving object in meters, None if there is none. Defaults to None.
+            now (float, optional): Clock time of the scan. Defaults to the clock.
+        """
+        now = self.clock() if now is None else now
+        closingSpeed = 0.0
+        if nearestRange is not None and self.lastNearest is not None and now > self.lastNearest[0]:
+            closingSpeed = (self.lastNearest[1] - nearestRange) / (now - self.lastNearest[0])
+        self.lastNearest = (now, nearestRange) if nearestRange is not None else None
+
+        self.rateInHz, self.decision = self.target_rate(speedInMetersPerSecond, closingSpeed, nearestRange)
+        self.stats["rateInHz"] = round(self.rateInHz, 3)
+        self.stats["decision"] = self.decision
+        self.stats["closingSpeed"] = round(closingSpeed, 3)
+
+
+    async def tick(self) -> float:
+        """ Run one scan and schedule the next one
+
+        Returns:
+            float: Seconds to wait before the next scan.
+        """
+        start = self.clock()
+        self.scanStarts.append(start)
+        result = self.scanFunction()
+        if inspect.isawaitable(result):
+            await result
+        end = self.clock()
+
+        self.observe(*self.sceneFunction(), now=start)
+        period = 1 / self.rateInHz
+        self.nextScanTime = start + period
+
+        # Drop the scans that should have started while this one ran instead of running them late
+        if end > self.nextScanTime:
+            self.stats["skippedScans"] += math.floor((end - start) / period)
+            self.nextScanTime = end
+
+        self.stats["scans"] += 1
+        self.stats["lastScanSeconds"] = round(end - start, 4)
+        if len(self.scanStarts) > 1:
+            self.stats["achievedRateInHz"] = round((len(self.scanStarts) - 1) / (self.scanStarts[-1] - self.scanStarts[0]), 3)
+
+        return max(self.nextScanTime - self.clock(), 0.0)
+
+
+def unit_test():
+    # A simulated clock, each scan takes scanSeconds and sleeping advances the clock
+    now = [0.0]
+    scanSeconds = [0.05]
+    scene = [(0.0, None)]
+
+    def scan():
+        now[0] += scanSeconds[0]
+
+    scheduler = ScanScheduler(scan, lambda: scene[0], clock=lambda: now[0])
+
+    async def ride(scans: int):
+        for _ in range(scans):
+            delay = await scheduler.tick()
+            now[0] += delay
+
+    # Standing still, then riding at 10 m/s
+    asyncio.run(ride(5))
+    assert scheduler.decision == IDLE and scheduler.stats["achievedRateInHz"] == DEFAULT_MIN_RATE_IN_HZ
+    scene[0] = (10.0, None)
+    asyncio.run(ride(25))
+    assert scheduler.decision == SPEED and scheduler.stats["achievedRateInHz"] == 5.0
+
+    # A car closing at 20 m/s from 25 meters raises the rate until it is capped
+    scene[0] = (10.0, 29.0)
+    asyncio.run(ride(1))
+    scene[0] = (10.0, 25.0)
+    asyncio.run(ride(1))
+    assert scheduler.decision == CLOSING and abs(scheduler.rateInHz - FRAMES_BEFORE_CONTACT * 20 / 25) < 1e-6
+    assert scheduler.target_rate(10.0, 15.0, 5.0) == (DEFAULT_MAX_RATE_IN_HZ, CAPPED)
+
+    # Scans slower than the period drop scans instead of falling behind
+    scene[0] = (10.0, None)
+    scanSeconds[0] = 0.45
+    skipped = scheduler.stats["skippedScans"]
+    asyncio.run(ride(20))
+    assert scheduler.stats["skippedScans"] - skipped == 2 * 20 and abs(scheduler.stats["achievedRateInHz"] - 1 / 0.45) < 1e-3
+    print(scheduler)
+
+    # The background task runs real scans until stopped
+    async def background():
+        scans = []
+        realScheduler = ScanScheduler(lambda: scans.append(time.monotonic()), lambda: (20.0, None))
+        realScheduler.start()
+        await asyncio.sleep(0.5)
+        await realScheduler.stop()
+        return len(scans)
+
+    assert 4 <= asyncio.run(background()) <= 7
+
+    # A scan that raises once, like a serial read error, does not stop the scans after it
+    async def failing_scan():
+        scans = []
+        def scan():
+            scans.append(time.monotonic())
+            if len(scans) == 2:
+                raise OSError("Serial port disconnected")
+        failingScheduler = ScanScheduler(scan, lambda: (20.0, None))
+        failingScheduler.start()
+        await asyncio.sleep(0.5)
+        running = not failingScheduler.task.done()
+        await failingScheduler.stop()
+        return (len(scans), running, failingScheduler.stats["failedScans"])
+
+    scans, running, failedScans = asyncio.run(failing_scan())
+    assert scans >= 4 and running and failedScans == 1
+
+    # A scan blocking for 0.3 s in a worker thread leaves the event loop free for the GUI
+    async def blocking_scans():
+        heartbeats = []
+        async def heartbeat():
+            while True:
+                heartbeats.append(time.monotonic())
+                await asyncio.sleep(0.02)
+        blockingScheduler = ScanScheduler(lambda: asyncio.to_thread(time.sleep, 0.3), lambda: (0.0, None))
+        heartbeatTask = asyncio.create_task(heartbeat())
+        await blockingScheduler.tick()
+        heartbeatTask.cancel()
+        return (blockingScheduler.stats["lastScanSeconds"], max(b - a for a, b in zip(heartbeats, heartbeats[1:])))
+
+    scanTime, longestStall = asyncio.run(blocking_scans())
+    assert scanTime >= 0.3 and longestStall < 0.1
+    print("All tests passed!")
+
+
+if __name__ == "__main__":
+    unit_test()
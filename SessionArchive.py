@@ -0,0 +1,572 @@
+#!/usr/bin/env python
+
+# Compressed archive of a ride's radar frames, risks and GPS track with random access by time
+# https://numpy.org/doc/stable/reference/generated/numpy.packbits.html
+# https://python-zstandard.readthedocs.io/en/latest/
+# https://python-lz4.readthedocs.io/en/stable/lz4.frame.html
+# https://docs.python.org/3/library/bisect.html
+#
+# A raw frame is 108,000 bool bytes, np.packbits() makes it 13,500 and the frames of a ride are mostly
+# empty and alike, so they compress well in groups. Frames are written in chunks of CHUNK_FRAMES: the
+# packed bits of all the chunk's frames compressed together, then the chunk's timestamps, GPS poses,
+# speeds and risks as compressed JSON. zstd is used when the zstandard package is installed, else lz4,
+# else zlib from the standard library, and every chunk records its codec. Closing the archive appends
+# an index with every chunk's offset, time range and metadata. Seeking bisects the chunk start times and
+# then the frame times of one decoded chunk, so it is O(log n) and decodes a single chunk. An archive
+# whose writer never closed (a crash or flat battery) is read by walking the chunk headers instead,
+# decoding each chunk once to rebuild the same index. Timestamps come from now(), the wall clock at the
+# start of the ride plus monotonic time, so a clock sync during the ride does not step them backwards.
+
+# Standard library imports not needing pip installs
+from bisect import bisect_right
+from dataclasses import dataclass, field
+from datetime import datetime
+import json
+import os
+import struct
+import time
+import zlib
+
+# 3rd party libraries
+import numpy as np                  # pip install numpy
+
+try:
+    import zstandard                # pip install zstandard
+except ImportError:
+    zstandard = None
+try:
+    import lz4.frame                # pip install lz4
+except ImportError:
+    lz4 = None
+
+SESSION_FOLDER = os.path.join(os.path.dirname(os.path.abspath(__file__)), "cache", "sessions")
+SESSION_SUFFIX = ".radar"
+
+FORMAT_VERSION = 1
+FILE_MAGIC = b"RADARARC"
+CHUNK_MAGIC = b"RCHK"
+INDEX_MAGIC = b"RADARIDX"
+
+# Magic, version, maxRadius
+FILE_HEADER = struct.Struct("<8sHI")
+# Magic, codec, frames, first and last timestamp, compressed bits and metadata bytes
+CHUNK_HEADER = struct.Struct("<4sHIddII")
+# Index offset, magic
+FILE_FOOTER = struct.Struct("<Q8s")
+
+# 64 frames is about 13 seconds at 5 Hz and 860 kB of packed bits before compression
+CHUNK_FRAMES = 64
+
+ZSTD = "zstd"
+LZ4 = "lz4"
+ZLIB = "zlib"
+CODEC_IDS = {ZLIB: 0, ZSTD: 1, LZ4: 2}
+CODEC_NAMES = {codecId: name for name, codecId in CODEC_IDS.items()}
+
+
+def available_codecs() -> list:
+    """ Codecs that can be used here, best first
+
+    Returns:
+        list: Some of ZSTD and LZ4, always ending with ZLIB.
+    """
+    return ([ZSTD] if zstandard is not None else []) + ([LZ4] if lz4 is not None else []) + [ZLIB]
+
+
+def compress(data: bytes, codec: str) -> bytes:
+    if codec == ZSTD and zstandard is not None:
+        return zstandard.ZstdCompressor(level=3).compress(data)
+    if codec == LZ4 and lz4 is not None:
+        return lz4.frame.compress(data)
+    if codec == ZLIB:
+        return zlib.compress(data, 6)
+    raise ValueError(f"Codec {codec} is not installed, available: {available_codecs()}")
+
+
+def decompress(data: bytes, codec: str) -> bytes:
+    if codec == ZSTD and zstandard is not None:
+        return zstandard.ZstdDecompressor().decompress(data)
+    if codec == LZ4 and lz4 is not None:
+        return lz4.frame.decompress(data)
+    if codec == ZLIB:
+        return zlib.decompress(data)
+    raise ValueError(f"Archive chunk uses codec {codec} which is not installed")
+
+
+def session_path(startTime: float = None) -> str:
+    """ Archive path of a ride in SESSION_FOLDER named after its start, like cache/sessions/ride-20261019-081500.radar
+    """
+    start = datetime.now() if startTime is None else datetime.fromtimestamp(startTime)
+    return os.path.join(SESSION_FOLDER, f"ride-{start:%Y%m%d-%H%M%S}{SESSION_SUFFIX}")
+
+
+@dataclass
+class ArchivedFrame:
+    """One radar frame of a ride with the rider's state when it was taken."""
+
+    timestamp: float
+    dataTimeSlice: np.ndarray = field(repr=False)
+
+    # (lat, lon, heading degrees) or None before the first GPS fix
+    pose: tuple = None
+    speedInMetersPerSecond: float = 0.0
+    displacementInMeters: float = 0.0
+
+    # One dict per stationary object, see risk_record()
+    risks: list = field(default_factory=list)
+
+
+def risk_record(stationaryObject) -> dict:
+    """ JSON ready record of a stationary object and its risk
+
+    Args:
+        stationaryObject (StationaryObject): The object, like an item of Radar.stationaryObjects.
+
+    Returns:
+        dict: Risk id, severity, direction, status and map tile with the object's polar points.
+    """
+    risk = stationaryObject.risk
+    return {"id": str(risk.id), "severity": risk.severity, "direction": risk.direction, "status": risk.status,
+            "mapTileId": risk.mapTitleId, "radius": [int(r) for r in stationaryObject.radius], "theta": [int(t) for t in stationaryObject.theta]}
+
+
+def chunk_index_entry(offset: int, codec: str, compressedBytes: int, packed: np.ndarray, metadata: dict, maxRadius: int) -> dict:
+    """ Index entry of a chunk, the same for the footer index and one rebuilt from the chunks of an archive that was not closed
+
+    Args:
+        offset (int): File offset of the chunk header.
+        codec (str): Codec of the chunk.
+        compressedBytes (int): Size of the chunk with its header.
+        packed (np.ndarray): (frames, packed bytes) np.packbits() frames of the chunk.
+        metadata (dict): Metadata of the chunk as SessionArchiveWriter.flush() writes it.
+        maxRadius (int): Number of radius bins of the frames.
+
+    Returns:
+        dict: Offset, frames, time range, codec, sizes, detection and risk counts and the (south, west, north, east) bounds of the poses.
+    """
+    timestamps = metadata["timestamps"]
+    poses = np.array([pose for pose in metadata["poses"] if pose is not None]).reshape(-1, 3)
+
+    return {"offset": offset, "frames": len(timestamps), "startTime": timestamps[0], "endTime": timestamps[-1], "codec": codec,
+            "compressedBytes": compressedBytes, "rawBytes": len(timestamps) * maxRadius * 360,
+            "detections": int(np.unpackbits(packed).sum()), "risks": sum(len(risks) for risks in metadata["risks"]),
+            "bounds": [*poses[:, :2].min(axis=0).tolist(), *poses[:, :2].max(axis=0).tolist()] if len(poses) else None}
+
+
+class SessionArchiveWriter:
+
+    def __init__(self, path: str, maxRadius: int = 300, chunkFrames: int = CHUNK_FRAMES, codec: str = None):
+        """ Create the archive file, frames are written a chunk at a time and close() writes the index.
+
+        Args:
+            path (str): Archive file, see session_path().
+            maxRadius (int, optional): Number of radius bins of the frames. Defaults to 300.
+            chunkFrames (int, optional): Frames per chunk. Defaults to 64.
+            codec (str, optional): ZSTD, LZ4 or ZLIB. Defaults to None (the best installed).
+        """
+        if chunkFrames < 1:
+            raise ValueError(f"Chunks need at least one frame, not {chunkFrames}")
+
+        self.path = path
+        self.maxRadius = maxRadius
+        self.chunkFrames = chunkFrames
+        self.codec = available_codecs()[0] if codec is None else codec
+        if self.codec not in available_codecs():
+            raise ValueError(f"Codec {self.codec} is not installed, available: {available_codecs()}")
+
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self.file = open(path, "wb")
+        self.file.write(FILE_HEADER.pack(FILE_MAGIC, FORMAT_VERSION, maxRadius))
+
+        self.pending = []
+        self.index = []
+        self.lastTimestamp = None
+
+        # Wall clock and monotonic clock at the start, see now()
+        self.startTime = time.time()
+        self.startMonotonic = time.monotonic()
+
+        self.stats = {"frames": 0, "chunks": 0, "rawBytes": 0, "compressedBytes": 0, "compressionRatio": 0.0, "clampedTimestamps": 0}
+
+
+    def __str__(self):
+        return f"SessionArchiveWriter(path={self.path}, codec={self.codec}, stats={self.stats})"
+
+
+    def __enter__(self):
+        return self
+
+
+    def __exit__(self, *exception):
+        self.close()
+
+
+    def now(self) -> float:
+        """ Timestamp for a frame taken now, seconds since the epoch that never step backwards when NTP or GPS sets the clock
+
+        Returns:
+            float: Wall clock time at the start of the archive plus the monotonic time since.
+        """
+        return self.startTime + time.monotonic() - self.startMonotonic
+
+
+    def append(self, timestamp: float, dataTimeSlice: np.ndarray, pose: tuple = None, speedInMetersPerSecond: float = 0.0, displacementInMeters: float = 0.0, risks: list = None):
+        """ Add a frame, a frame older than the previous one is stored at the time of the previous one
+
+        Args:
+            timestamp (float): Seconds since the epoch the frame was taken, like now().
+            dataTimeSlice (np.ndarray): Boolean (maxRadius, 360) time slice.
+            pose (tuple, optional): (lat, lon, heading degrees) of the rider. Defaults to None.
+            speedInMetersPerSecond (float, optional): Speed of the rider. Defaults to 0.
+            displacementInMeters (float, optional): Meters ridden since the previous frame. Defaults to 0.
+            risks (list, optional): risk_record() of every stationary object found. Defaults to None.
+        """
+        if self.file is None:
+            raise ValueError(f"Archive {self.path} is closed")
+        if dataTimeSlice.shape != (self.maxRadius, 360):
+            raise ValueError(f"Frame shape {dataTimeSlice.shape} does not match ({self.maxRadius}, 360)")
+        # Seeking needs times in order, refusing the frame would raise in the middle of a scan
+        if self.lastTimestamp is not None and timestamp < self.lastTimestamp:
+            timestamp = self.lastTimestamp
+            self.stats["clampedTimestamps"] += 1
+
+        self.lastTimestamp = timestamp
+        self.pending.append(ArchivedFrame(timestamp, np.packbits(dataTimeSlice), None if pose is None else tuple(pose), speedInMetersPerSecond, displacementInMeters, risks or []))
+        if len(self.pending) == self.chunkFrames:
+            self.flush()
+
+
+    def flush(self):
+        """ Write the pending frames as a chunk
+        """
+        if len(self.pending) == 0:
+            return
+
+        packed = np.stack([frame.dataTimeSlice for frame in self.pending])
+        metadata = {"timestamps": [frame.timestamp for frame in self.pending],
+                    "poses": [frame.pose for frame in self.pending],
+                    "speeds": [frame.speedInMetersPerSecond for frame in self.pending],
+                    "displacements": [frame.displacementInMeters for frame in self.pending],
+                    "risks": [frame.risks for frame in self.pending]}
+        bits = compress(packed.tobytes(), self.codec)
+        meta = compress(json.dumps(metadata, separators=(",", ":")).encode(), self.codec)
+
+        offset = self.file.tell()
+        startTime, endTime = self.pending[0].timestamp, self.pending[-1].timestamp
+        self.file.write(CHUNK_HEADER.pack(CHUNK_MAGIC, CODEC_IDS[self.codec], len(self.pending), startTime, endTime, len(bits), len(meta)))
+        self.file.write(bits)
+        self.file.write(meta)
+        self.file.flush()
+
+        self.index.append(chunk_index_entry(offset, self.codec, CHUNK_HEADER.size + len(bits) + len(meta), packed, metadata, self.maxRadius))
+
+        self.stats["frames"] += len(self.pending)
+        self.stats["chunks"] += 1
+        self.stats["rawBytes"] += self.index[-1]["rawBytes"]
+        self.stats["compressedBytes"] += self.index[-1]["compressedBytes"]
+        self.stats["compressionRatio"] = round(self.stats["rawBytes"] / self.stats["compressedBytes"], 1)
+        self.pending = []
+
+
+    def close(self):
+        """ Write the last chunk and the index
+        """
+        if self.file is None:
+            return
+
+        self.flush()
+        indexOffset = self.file.tell()
+        self.file.write(json.dumps(self.index, separators=(",", ":")).encode())
+        self.file.write(FILE_FOOTER.pack(indexOffset, INDEX_MAGIC))
+        self.file.close()
+        self.file = None
+
+
+class SessionArchive:
+
+    def __init__(self, path: str):
+        """ Open an archive for reading, the index is read from the end of the file or rebuilt from the chunks.
+
+        Args:
+            path (str): Archive file written by SessionArchiveWriter.
+        """
+        self.path = path
+        self.file = open(path, "rb")
+        magic, version, self.maxRadius = FILE_HEADER.unpack(self.file.read(FILE_HEADER.size))
+        if magic != FILE_MAGIC or version != FORMAT_VERSION:
+            raise ValueError(f"{path} is not a version {FORMAT_VERSION} radar session archive")
+
+        self.index = self.read_index()
+        self.startTimes = [chunk["startTime"] for chunk in self.index]
+
+        # Most recently decoded chunk as (chunk number, frame timestamps, metadata, frames)
+        self.decoded = None
+
+        self.stats = {"chunks": len(self.index), "frames": sum(chunk["frames"] for chunk in self.index), "decodedChunks": 0, "recovered": self.recovered}
+
+
+    def __str__(self):
+        return f"SessionArchive(path={self.path}, maxRadius={self.maxRadius}, stats={self.stats})"
+
+
+    def __len__(self):
+        return self.stats["frames"]
+
+
+    def __enter__(self):
+        return self
+
+
+    def __exit__(self, *exception):
+        self.close()
+
+
+    def close(self):
+        self.file.close()
+
+
+    def read_index(self) -> list:
+        """ Chunk index from the footer, or from walking the chunk headers of an archive that was not closed
+        """
+        fileSize = os.fstat(self.file.fileno()).st_size
+        self.recovered = False
+        if fileSize >= FILE_HEADER.size + FILE_FOOTER.size:
+            self.file.seek(fileSize - FILE_FOOTER.size)
+            indexOffset, magic = FILE_FOOTER.unpack(self.file.read(FILE_FOOTER.size))
+            if magic == INDEX_MAGIC:
+                self.file.seek(indexOffset)
+                return json.loads(self.file.read(fileSize - FILE_FOOTER.size - indexOffset))
+
+        # Keep every complete chunk, a chunk cut short by the crash is dropped
+        self.recovered = True
+        index = []
+        offset = FILE_HEADER.size
+        while offset + CHUNK_HEADER.size <= fileSize:
+            self.file.seek(offset)
+            magic, codecId, frames, startTime, endTime, bitsBytes, metaBytes = CHUNK_HEADER.unpack(self.file.read(CHUNK_HEADER.size))
+            size = CHUNK_HEADER.size + bitsBytes + metaBytes
+            if magic != CHUNK_MAGIC or offset + size > fileSize:
+                break
+            codec = CODEC_NAMES[codecId]
+            packed = np.frombuffer(decompress(self.file.read(bitsBytes), codec), dtype=np.uint8)
+            metadata = json.loads(decompress(self.file.read(metaBytes), codec))
+            index.append(chunk_index_entry(offset, codec, size, packed, metadata, self.maxRadius))
+            offset += size
+
+        return index
+
+
+    def read_chunk(self, chunkNumber: int, frames: bool = True) -> tuple:
+        """ Decode one chunk, the last one decoded is kept
+
+        Args:
+            chunkNumber (int): Position of the chunk in the index.
+            frames (bool, optional): Decode the frames too, not only the metadata. Defaults to True.
+
+        Returns:
+            tuple: (metadata dict, boolean (frames, maxRadius, 360) array or None).
+        """
+        if self.decoded is not None and self.decoded[0] == chunkNumber and (self.decoded[2] is not None or not frames):
+            return self.decoded[1:]
+
+        chunk = self.index[chunkNumber]
+        self.file.seek(chunk["offset"])
+        _, codecId, frameCount, _, _, bitsBytes, metaBytes = CHUNK_HEADER.unpack(self.file.read(CHUNK_HEADER.size))
+        codec = CODEC_NAMES[codecId]
+        bits = self.file.read(bitsBytes)
+        metadata = json.loads(decompress(self.file.read(metaBytes), codec))
+
+        dataTimeSlices = None
+        if frames:
+            cells = self.maxRadius * 360
+            packed = np.frombuffer(decompress(bits, codec), dtype=np.uint8).reshape(frameCount, -1)
+            dataTimeSlices = np.unpackbits(packed, axis=1, count=cells).view(bool).reshape(frameCount, self.maxRadius, 360)
+            self.decoded = (chunkNumber, metadata, dataTimeSlices)
+            self.stats["decodedChunks"] += 1
+
+        return (metadata, dataTimeSlices)
+
+
+    def seek(self, timestamp: float) -> tuple:
+        """ Position of the last frame taken at or before a time, the first frame for earlier times
+
+        Args:
+            timestamp (float): Seconds since the epoch.
+
+        Returns:
+            tuple: (chunk number, frame number within the chunk).
+        """
+        if len(self.index) == 0:
+            raise ValueError(f"Archive {self.path} has no frames")
+
+        chunkNumber = max(bisect_right(self.startTimes, timestamp) - 1, 0)
+        metadata, _ = self.read_chunk(chunkNumber, frames=False)
+        return (chunkNumber, max(bisect_right(metadata["timestamps"], timestamp) - 1, 0))
+
+
+    def frame(self, chunkNumber: int, frameNumber: int) -> ArchivedFrame:
+        metadata, dataTimeSlices = self.read_chunk(chunkNumber)
+        pose = metadata["poses"][frameNumber]
+        return ArchivedFrame(metadata["timestamps"][frameNumber], dataTimeSlices[frameNumber], None if pose is None else tuple(pose),
+                             metadata["speeds"][frameNumber], metadata["displacements"][frameNumber], metadata["risks"][frameNumber])
+
+
+    def frame_at(self, timestamp: float) -> ArchivedFrame:
+        """ The frame shown at a time of the ride, see seek()
+        """
+        return self.frame(*self.seek(timestamp))
+
+
+    def frames(self, startTime: float = None, endTime: float = None):
+        """ Stream the frames of a time range, one chunk is decoded at a time
+
+        Args:
+            startTime (float, optional): First timestamp, the frame shown at that time is included. Defaults to None (the start).
+            endTime (float, optional): Last timestamp included. Defaults to None (the end).
+
+        Yields:
+            ArchivedFrame: The frames in time order.
+        """
+        if len(self.index) == 0:
+            return
+
+        chunkNumber, frameNumber = (0, 0) if startTime is None else self.seek(startTime)
+        for chunkNumber in range(chunkNumber, len(self.index)):
+            for frameNumber in range(frameNumber, self.index[chunkNumber]["frames"]):
+                frame = self.frame(chunkNumber, frameNumber)
+                if endTime is not None and frame.timestamp > endTime:
+                    return
+                yield frame
+            frameNumber = 0
+
+
+    def track(self) -> list:
+        """ GPS track of the ride from the chunk metadata, without decoding any frame
+
+        Returns:
+            list: (timestamp, lat, lon, heading degrees) of every frame with a pose.
+        """
+        track = []
+        for chunkNumber in range(len(self.index)):
+            metadata, _ = self.read_chunk(chunkNumber, frames=False)
+            track.extend((timestamp, *pose) for timestamp, pose in zip(metadata["timestamps"], metadata["poses"]) if pose is not None)
+
+        return track
+
+
+def benchmark(path: str, frames: int = 300, codec: str = None) -> dict:
+    """ Archive a simulated stress ride and time writing, streaming and seeking
+
+    Args:
+        path (str): Archive file to write.
+        frames (int, optional): Frames to ride. Defaults to 300.
+        codec (str, optional): Codec to write with. Defaults to None (the best installed).
+
+    Returns:
+        dict: Compression ratios and throughputs.
+    """
+    import time
+    from RadarSimulator import RadarSimulator, load_scenario
+
+    simulator = RadarSimulator(load_scenario("stress", frames=frames))
+    rideFrames = [simulator.frame(index)[0] for index in range(frames)]
+    poses = [simulator.gps_fix(index) for index in range(frames)]
+
+    start = time.perf_counter()
+    with SessionArchiveWriter(path, simulator.maxRadius, codec=codec) as writer:
+        for index, dataTimeSlice in enumerate(rideFrames):
+            writer.append(index / simulator.frameRateInHz, dataTimeSlice, poses[index], simulator.speed)
+    writeSeconds = time.perf_counter() - start
+
+    with SessionArchive(path) as archive:
+        start = time.perf_counter()
+        decoded = sum(1 for _ in archive.frames())
+        decodeSeconds = time.perf_counter() - start
+
+        seekTimes = np.random.default_rng(0).uniform(0, frames / simulator.frameRateInHz, 50)
+        start = time.perf_counter()
+        for timestamp in seekTimes:
+            archive.frame_at(timestamp)
+        seekSeconds = time.perf_counter() - start
+
+    return {"codec": writer.codec, "frames": decoded, "fileBytes": os.path.getsize(path),
+            "ratioToBool": writer.stats["compressionRatio"], "ratioToPackbits": round(writer.stats["rawBytes"] / 8 / writer.stats["compressedBytes"], 1),
+            "writeFramesPerSecond": round(frames / writeSeconds), "decodeFramesPerSecond": round(decoded / decodeSeconds),
+            "millisecondsPerRandomSeek": round(seekSeconds / len(seekTimes) * 1000, 2)}
+
+
+def unit_test():
+    import tempfile
+    from RadarSimulator import RadarSimulator
+
+    simulator = RadarSimulator({"seed": 2, "maxRadius": 100, "frameRateInHz": 5, "noise": {"falseAlarmRate": 0.001, "detectionProbability": 0.9},
+                                "random": {"poles": 40, "parkedCars": 10, "vehicles": 4, "lengthInMeters": 300}})
+    rideFrames = [simulator.frame(index)[0] for index in range(23)]
+    risk = {"id": "r1", "severity": 1, "direction": None, "status": 2, "mapTileId": "0231", "radius": [10], "theta": [270]}
+
+    with tempfile.TemporaryDirectory() as folder:
+        path = os.path.join(folder, "ride.radar")
+        with SessionArchiveWriter(path, 100, chunkFrames=5) as writer:
+            for index, dataTimeSlice in enumerate(rideFrames):
+                writer.append(1000.0 + index * 0.2, dataTimeSlice, simulator.gps_fix(index) if index >= 2 else None, 8.0, 1.6, [risk] if index == 7 else [])
+            # A clock stepping back keeps the frame at the time of the previous one
+            writer.append(999.0, rideFrames[0])
+            assert abs(writer.now() - time.time()) < 1
+        assert writer.stats["chunks"] == 5 and writer.stats["compressionRatio"] > 8 and writer.stats["clampedTimestamps"] == 1
+        assert writer.index[-1]["frames"] == 4 and writer.index[-1]["endTime"] == 1000.0 + 22 * 0.2
+
+        with SessionArchive(path) as archive:
+            assert len(archive) == 24 and not archive.stats["recovered"] and archive.index[1]["risks"] == 1
+
+            # Seeking lands on the frame shown at that time, also between frames and chunks
+            assert archive.seek(1000.0) == (0, 0) and archive.seek(1001.1) == (1, 0) and archive.seek(1000.5) == (0, 2) and archive.seek(0) == (0, 0)
+            frame = archive.frame_at(1001.45)
+            assert frame.timestamp == 1000.0 + 7 * 0.2 and (frame.dataTimeSlice == rideFrames[7]).all() and frame.risks == [risk]
+            assert frame.pose == simulator.gps_fix(7) and archive.frame_at(1000.1).pose is None
+
+            # Streaming a time range decodes each chunk once
+            decodedChunks = archive.stats["decodedChunks"]
+            streamed = list(archive.frames(1000.4, 1002.0))
+            assert [round(frame.timestamp, 1) for frame in streamed] == [round(1000.4 + 0.2 * index, 1) for index in range(9)]
+            assert all((frame.dataTimeSlice == rideFrames[index + 2]).all() for index, frame in enumerate(streamed))
+            assert archive.stats["decodedChunks"] - decodedChunks <= 3
+            assert len(archive.track()) == 21 and archive.track()[0][1:] == simulator.gps_fix(2)
+
+        # A ride cut off mid chunk keeps its complete chunks
+        with open(path, "rb") as file:
+            data = file.read()
+        cutPath = os.path.join(folder, "cut.radar")
+        with open(cutPath, "wb") as file:
+            file.write(data[:writer.index[3]["offset"] + 10])
+        with SessionArchive(cutPath) as archive:
+            assert archive.stats["recovered"] and len(archive) == 15 and (archive.frame_at(1002.8).dataTimeSlice == rideFrames[14]).all()
+
+            # The rebuilt index has every key of the footer index
+            assert archive.index == writer.index[:3]
+
+        # Radar records the frames it receives and replays an archived ride through its pipeline
+        from Radar import Radar
+        radar = Radar(100, mode="TESTING")
+        recordedPath = os.path.join(folder, "recorded.radar")
+        with SessionArchiveWriter(recordedPath, 100) as radar.sessionRecorder:
+            for index in range(3):
+                simulator.write_frame(radar, index)
+                radar.next_frame()
+        with SessionArchive(recordedPath) as archive:
+            # Recorded before clutter suppression, so it holds every bin Radar kept
+            recorded = archive.frame(0, 2)
+            assert len(archive) == 3 and recorded.pose == radar.pose and (recorded.dataTimeSlice | ~radar.dataTimeSliceCurrent).all()
+
+        radar = Radar(100, mode="TESTING")
+        with SessionArchive(path) as archive:
+            replayed = [frame.timestamp for frame in radar.replay(archive, 1001.0, 1001.6)]
+            assert len(replayed) == 4 and (radar.dataTimeSlicePast == rideFrames[7]).all() and radar.pose == simulator.gps_fix(8)
+
+        print(f"Codecs available: {available_codecs()}")
+        for codec in available_codecs():
+            print(benchmark(os.path.join(folder, f"stress-{codec}.radar"), codec=codec))
+    print("All tests passed!")
+
+
+if __name__ == "__main__":
+    unit_test()
@@ -12,26 +12,36 @@
 # Updated by Blaze Sanders, 2025
 # TODO: GITHUB LINK
 
-import math
 import os
-
-from nicegui import ui
+from io import BytesIO
 
 # 3rd party libraries
-from PIL import Image, ImageDraw    # pip install Pillow
-import ipinfo                       # pip install ipinfo https://github.com/ipinfo/python
-from dotenv import load_dotenv
-import requests
-from io import BytesIO
+# NiceGUI, Pillow, ipinfo, dotenv, requests and the tile server classes are imported where they are
+# first used, so importing the tile math of this file does not start the GUI stack, see StartupBenchmark.py
+
+# Internal libraries
+from TileMath import TILE_SIZE, GPS_DECIMAL_ROUNDING, num_of_tiles, sec, get_tile_XY, get_tile_pixel_XY, convert_tile_XY_to_LatLon, lat_edges, lon_edges, tile_edges, convert_mercatorY_to_latitude
+from QuadKey import tileXY_to_quadkey
 
 IN = 1
 OUT = -1
-TILE_SIZE = 256
-GPS_DECIMAL_ROUNDING = 6
 STARTING_ZOOM_LEVEL = 16
 
 mapCenter = (36.149727, -115.334172)
 currentZoomLevel = 8
+tileCache = None
+tileFetcher = None
+tilePrefetcher = None
+mapViewport = None
+tileCompositor = None
+detectionLayer = None
+routeLayer = None
+
+# (lat, lon) points of the route being ridden, empty when riding without one
+plannedRoute = []
+
+# (lat, lon) of the rider from the last radar scan with a GPS pose
+riderPosition = None
 
 
 def unit_test():
@@ -48,148 +58,6 @@ def unit_test():
         print("<img src='%s'><br>" % tile_URL(zoomLevel, x, y, "osm"))
 
 
-def num_of_tiles(zoomLevel: int) -> int:
-    """ Calculate the number of tiles at a given zoom level.
-        https://wiki.openstreetmap.org/wiki/Zoom_levels
-
-    Args:
-        zoomLevel (int): The zoom level between 0 - 19 using the OpenStreet Map (OSM) 'standard' style
-
-    Returns:
-        int: The number of tiles at the given zoom level.
-    """
-    return pow(2, zoomLevel)
-
-
-def sec(x: float) -> float:
-    """ Calculate the secant of an angle
-
-    Args:
-        x (float): The angle in radians.
-
-    Returns:
-        float: The secant of the angle.
-    """
-    return 1 / math.cos(x)
-
-
-def get_tile_XY(zoomLevel: int, lat: float, lon: float) -> tuple:
-    """ Calculate the tile coordinates for a given latitude, longitude, and zoom level.
-
-    Args:
-        lat (float): The latitude in degrees
-        lon (float): The longitude in degrees
-        zoomLevel (int): The zoom level between 0 - 19 for using the OpenStreet Map (OSM) 'standard' style
-
-    Returns:
-        tuple: The tile coordinates (x, y), where (0,0) represents the top-left corner of the map.
-    """
-    n = num_of_tiles(zoomLevel)
-    xOffset = (lon + 180) / 360
-    yOffset = (1 - math.log(math.tan(math.radians(lat)) + sec(math.radians(lat))) / math.pi) / 2
-    x = int(xOffset*n)
-    y = int(yOffset*n)
-
-    return (x, y)
-
-
-def convert_tile_XY_to_LatLon(zoomLevel: int, x: int, y: int) -> tuple:
-    """ Convert a tile X & Y  values to the latitude and longitude of the upper left corner of the tile Bounding Box (Bbox)
-        https://quad.osm.lol/
-
-    Args:
-        zoomLevel (int): The zoom level.
-        x (int): The x-coordinate of the tile.
-        y (int): The y-coordinate of the tile.
-
-    Returns:
-        tuple: The latitude and longitude.
-    """
-    if x < 0 or y < 0:
-        raise ValueError("Both X and yY must be greater than 0")
-
-    n = num_of_tiles(zoomLevel)
-    #TODO: Add centerX and centerY calculations
-    #centerX = (x + 0.5) / n
-    #centerY = (y + 0.5) / n
-    # lon = -180.0 + 360.0 * ((x + 0.5) / n)
-
-    upperLeftY = y / n
-    upperLeftX = x / n
-    lat = convert_mercatorY_to_latitude(math.pi * (1 - 2 * upperLeftY))
-    lon =  -180.0 + 360.0 * upperLeftX
-
-    return (round(lat, GPS_DECIMAL_ROUNDING), round(lon, GPS_DECIMAL_ROUNDING))
-
-
-def lat_edges(zoomLevel: int, y: int) -> tuple:
-    """ Calculate the latitude edges of a tile at a given zoom level.
-
-    Args:
-        y (int): The y-coordinate of the tile.
-        zoomLevel (int): The zoom level.
-
-    Returns:
-        tuple: The latitude edges (lat1, lat2), where lat1 is the southern edge and lat2 is the northern edge.
-    """
-    n = num_of_tiles(zoomLevel)
-    unit = 1 / n
-    relY1 = y * unit
-    relY2 = relY1 + unit
-    lat1 = convert_mercatorY_to_latitude(math.pi * (1 - 2 * relY1))
-    lat2 = convert_mercatorY_to_latitude(math.pi * (1 - 2 * relY2))
-
-    return (lat1, lat2)
-
-
-def lon_edges(zoomLevel: int, x: int) -> tuple:
-    """ Calculate the longitude edges of a tile at a given zoom level.
-
-    Args:
-        x (int): The x-coordinate of the tile.
-        zoomLevel (int): The zoom level.
-
-    Returns:
-        tuple: The longitude edges (lon1, lon2), where lon1 is the western edge and lon2 is the eastern edge.
-    """
-    n = num_of_tiles(zoomLevel)
-    unit = 360 / n
-    lon1 = -180 + x * unit
-    lon2 = lon1 + unit
-
-    return (lon1, lon2)
-
-
-def tile_edges(zoomLevel: int, x:int , y:int) -> tuple:
-    """ Calculate the edges of a tile at a given zoom level.
-
-    Args:
-        x (int): The x-coordinate of the tile.
-        y (int): The y-coordinate of the tile.
-        zoomLevel (int): The zoom level.
-
-    Returns:
-        tuple: The edges of the tile (lat2, lon1, lat1, lon2), where lat2 is the southern edge, lon1 is the western edge, lat1 is the northern edge, and lon2 is the eastern edge.
-    """
-    lat1, lat2 = lat_edges(zoomLevel, y)
-    lon1, lon2 = lon_edges(zoomLevel, x)
-
-    return (lat2, lon1, lat1, lon2)
-
-
-def convert_mercatorY_to_latitude(mercatorY: float) -> float:
-    """ Convert a Mercator Y coordinate to a latitude.
-        https://en.wikipedia.org/wiki/Web_Mercator_projection
-
-    Args:
-        mercatorY (float): The Mercator Y coordinate.
-
-    Returns:
-        float: The latitude.
-    """
-    return math.degrees(math.atan(math.sinh(mercatorY)))
-
-
 def tile_pixel_size() -> int:
     """ Tiles are 256 × 256 pixel PNG files
     """
@@ -217,29 +85,6 @@ def tile_URL(zoomLevel, x, y, layer) -> str:
     return "%s%d/%d/%d.%s" % (tile_layer_base_url(layer), zoomLevel, x, y, tile_layer_ext(layer))
 
 
-def tileXY_to_quadkey(zoomLevel: int, x: int, y: int) -> str:
-    """ Convert tile (x, y, zoom) to a Bing-style QuadKey string
-        Top-left → 0
-        Top-right → 1
-        Bottom-left → 2
-        Bottom-right → 3
-    """
-    quadkey = ""
-    for i in range(zoomLevel):
-        level = zoomLevel - i - 1
-        divisor = 2 ** level
-        digit = 0
-
-        # Determine which quadrant (0–3) this tile is in at this zoom level using floor division operator
-        if x // divisor % 2 == 1:
-            digit += 1
-        if y // divisor % 2 == 1:
-            digit += 2
-
-        quadkey += str(digit)
-
-    return quadkey
-
 def find_surrounding_tiles(lat: float, lon: float, zoomLevel: int) -> list:
     """ Determine the 8 tiles surrounding a central tile
 
@@ -281,15 +126,8 @@ def update_gui(mapCenter: tuple, anyButtonClicked: bool = False):
     zoomLabel.text = f"Zoom Level: {currentZoomLevelText}"
 
     if anyButtonClicked:
-        mapGrid.clear()
-        tileX, tileY = get_tile_XY(10, mapCenter[0], mapCenter[1])
-        with mapGrid:
-            for dy in [-1, 0, 1]:
-                for dx in [-1, 0, 1]:
-                    x = tileX + dx
-                    y = tileY + dy
-                    imgURL= tile_URL(currentZoomLevel, x, y, "osm")                   #print(imgURL)
-                    ui.image(imgURL).classes('w-64 h-64')  # adjust size as needed
+        # Only the tiles whose IDs changed get a new image source
+        mapViewport.show(mapCenter[0], mapCenter[1], currentZoomLevel)
 
 #def zoom_tiles():
 #    x, y = get_tile_XY(zoomLevel, lat, lon)
@@ -320,6 +158,84 @@ def zoom_out(zoomLevel: int) -> int:
     """
     return (zoomLevel - 1) if zoomLevel > 0 else zoomLevel
 
+def show_radar_detections(radar, riskOnly: bool = False):
+    """ Draw the radar detections of the current scan on the map tiles.
+
+    Args:
+        radar (Radar): Radar with a known rider pose, see Radar.set_pose()
+        riskOnly (bool, optional): Only draw the stationary objects. Defaults to False.
+    """
+    lat, lon, _, _, _, _ = radar.georeferenced_detections("STATIONARY OBJECTS" if riskOnly else "CURRENT")
+
+    # Only the tiles whose dots moved are loaded again, not the whole view on every scan
+    shownTiles = [tile for tile in mapViewport.shownTiles if tile is not None]
+    before = [detectionLayer.tile_signature(*tile) for tile in shownTiles]
+    detectionLayer.set_points(lat, lon)
+    changedTiles = [tile for tile, signature in zip(shownTiles, before) if detectionLayer.tile_signature(*tile) != signature]
+    if changedTiles:
+        mapViewport.refresh(changedTiles)
+
+
+def on_radar_scan(radar):
+    """ Update the map after every radar scan, once the rider has a GPS pose, called by the app that owns the radar
+
+    Args:
+        radar (Radar): The radar that just scanned, see Radar.next_frame()
+    """
+    global riderPosition
+
+    if radar.pose is None:
+        return
+
+    lat, lon, headingDegrees = radar.pose
+    riderPosition = (lat, lon)
+    if detectionLayer is not None:
+        show_radar_detections(radar)
+
+    # Warm the tile store along the planned route, or straight ahead when riding without one
+    speed = radar.speedSensor.speedInMetersPerSecond
+    if tilePrefetcher:
+        if plannedRoute:
+            tilePrefetcher.prefetch_route(plannedRoute, lat, lon, speed, currentZoomLevel)
+        elif speed > 0:
+            tilePrefetcher.prefetch_heading(lat, lon, headingDegrees, speed, currentZoomLevel)
+
+
+def plan_route_points(origin: tuple, destination: tuple) -> list:
+    """ Plan a bike route over the road network, slow (it may download the network) so run it in a worker thread
+
+    Args:
+        origin (tuple): (lat, lon) to start from.
+        destination (tuple): (lat, lon) to ride to.
+
+    Returns:
+        list: (lat, lon) points of the route, empty if the destination can not be reached.
+    """
+    from BikeAutoPilot import build_road_network, plan_route
+    from GeoMath import haversine_distance
+
+    # A network centered between both ends that reaches a kilometer past each of them
+    center = ((origin[0] + destination[0]) / 2, (origin[1] + destination[1]) / 2)
+    graph = build_road_network(center, int(haversine_distance(*origin, *destination) / 2) + 1000)
+    nodes, _ = plan_route(graph, origin, destination)
+
+    return [(graph.nodes[node]["y"], graph.nodes[node]["x"]) for node in nodes]
+
+
+def set_planned_route(route: list):
+    """ Draw the route to ride on the map, radar scans then prefetch the tiles along it
+
+    Args:
+        route (list): (lat, lon) points of the route, empty to ride without one.
+    """
+    global plannedRoute
+
+    plannedRoute = list(route)
+    if routeLayer is not None:
+        routeLayer.set_lines([plannedRoute] if plannedRoute else [])
+        mapViewport.refresh()
+
+
 def on_zoom_button_click(direction):
     """ Handle both in and out zoom button click event and update the GUI.
 
@@ -335,12 +251,33 @@ def on_zoom_button_click(direction):
 
     update_gui(mapCenter, True)
 
+    # Warm the tile store with the tiles of the next zoom click in either direction
+    if tilePrefetcher:
+        tilePrefetcher.prefetch_zoom(mapCenter[0], mapCenter[1], currentZoomLevel)
+
+def on_pan_button_click(dx: int, dy: int):
+    """ Handle the pan button click events by moving the map center by whole tiles and update the GUI.
+
+    Args:
+        dx (int): Tiles to move right, negative to move left.
+        dy (int): Tiles to move down, negative to move up.
+    """
+    global mapCenter
+
+    mapViewport.pan(dx, dy)
+    mapCenter = convert_tile_XY_to_LatLon(*mapViewport.centerTile, TILE_SIZE // 2, TILE_SIZE // 2)
+    update_gui(mapCenter)
+
 def get_server_location():
     """ Get the server location using IPinfo API
 
     Returns:
         tuple: Latitude and Longitude of the server location
     """
+    import ipinfo                       # pip install ipinfo https://github.com/ipinfo/python
+    import requests                     # pip install requests
+    from dotenv import load_dotenv
+
     load_dotenv()
     ipLocationAccessToken = os.getenv("IP_LOCATION_ACCESS_TOKEN")
     handler = ipinfo.getHandler(ipLocationAccessToken)
@@ -354,29 +291,67 @@ def get_server_location():
 
     return (lat, lon)
 
-def draw_line_on_map_tile(zoomLevel: int, x: int, y: int, lineStart: tuple, lineEnd: tuple, color: str = 'blue', width: int = 5):
-    base = Image.open(BytesIO(requests.get(tile_URL(zoomLevel, x, y, "osm")).content))
+def draw_line_on_map_tile(zoomLevel: int, x: int, y: int, lineStart: tuple, lineEnd: tuple, color: str = 'blue', width: int = 5) -> bytes:
+    """ Draw one line on a map tile, use TileCompositor layers for overlays that change over time
+
+    Args:
+        zoomLevel (int): The zoom level.
+        x (int): The x-coordinate of the tile.
+        y (int): The y-coordinate of the tile.
+        lineStart (tuple): (x, y) pixel where the line starts.
+        lineEnd (tuple): (x, y) pixel where the line ends.
+        color (str, optional): Line color. Defaults to 'blue'.
+        width (int, optional): Line width in pixels. Defaults to 5.
+
+    Returns:
+        bytes: PNG image of the tile with the line, kept in memory so it can be served directly to NiceGUI
+    """
+    from PIL import Image, ImageDraw    # pip install Pillow
+    from TileCompositor import encode_image
+
+    base = Image.open(BytesIO(tileCache.get_tile(zoomLevel, x, y, "osm"))).convert("RGBA")
     draw = ImageDraw.Draw(base)
     draw.line((lineStart[0], lineStart[1], lineEnd[0], lineEnd[1]), fill=color, width=width)
-    base.save('overlayed.png')
 
-    return filename
+    return encode_image(base, "png")
 
 
 if __name__ in {"__main__", "__mp_main__"}:
+    from nicegui import app, run, ui    # pip install nicegui
+    from TileCache import TileCache
+    from TileFetcher import TileFetcher, add_tile_route
+    from TilePrefetcher import TilePrefetcher
+    from MapViewport import MapViewport
+    from TileCompositor import TileCompositor, PolylineLayer, PointLayer, add_composite_route, composite_tile_URL
+
     #unit_test()
 
+    # Serve map tiles from the local tile store instead of pointing the browser at tile.openstreetmap.org
+    tileCache = TileCache(tile_URL)
+    tileFetcher = TileFetcher(tileCache)
+    add_tile_route(tileFetcher)
+    tilePrefetcher = TilePrefetcher(tileFetcher)
+    app.on_startup(tilePrefetcher.start)
+
+    # Routes, risks and radar detections are drawn on the tiles server-side, one cached layer each
+    tileCompositor = TileCompositor(tileCache)
+    routeLayer = tileCompositor.add_layer(PolylineLayer("route", "blue", 5))
+    riskLayer = tileCompositor.add_layer(PointLayer("risks", "orange", 6))
+    detectionLayer = tileCompositor.add_layer(PointLayer("detections", "red", 4))
+    add_composite_route(tileCompositor)
+
     mapCenter = get_server_location()
-    tileX, tileY = get_tile_XY(currentZoomLevel, mapCenter[0], mapCenter[1])
 
-    # Create a 3×3 grid of tiles centered on tileX, tileY and gaps removed for seamless tiling
-    with ui.grid(columns=3).classes('gap-0') as mapGrid:
-        for dy in [-1, 0, 1]:
-            for dx in [-1, 0, 1]:
-                x = tileX + dx
-                y = tileY + dy
-                imgURL= tile_URL(currentZoomLevel, x, y, "osm")                   #print(imgURL)
-                ui.image(imgURL).classes('w-64 h-64')  # adjust size as needed
+    # Create a 3×3 grid of tiles centered on mapCenter and gaps removed for seamless tiling
+    mapViewport = MapViewport(3, 3, "osm", "png", composite_tile_URL)
+    mapViewport.build()
+    mapViewport.show(mapCenter[0], mapCenter[1], currentZoomLevel)
+
+    with ui.row().classes('justify-center w-full'):
+        ui.button(icon='west', on_click=lambda e:on_pan_button_click(-1, 0))
+        ui.button(icon='north', on_click=lambda e:on_pan_button_click(0, -1))
+        ui.button(icon='south', on_click=lambda e:on_pan_button_click(0, 1))
+        ui.button(icon='east', on_click=lambda e:on_pan_button_click(1, 0))
 
     with ui.row().classes('justify-center w-full'):
         ui.button("ZOOM IN", on_click=lambda e:on_zoom_button_click(IN)).classes('w-1/3')
@@ -389,5 +364,16 @@ if __name__ in {"__main__", "__mp_main__"}:
                  validation={'Input too long': lambda value: len(value) <= 9})
         ui.button('Recenter Map On My Location', on_click=lambda e: get_server_location())
 
+    async def on_plan_route_click():
+        destination = tuple(float(value) for value in destinationInput.value.split(","))
+        route = await run.io_bound(plan_route_points, riderPosition or mapCenter, destination)
+        set_planned_route(route)
+        ui.notify(f"Route with {len(route)} points planned" if route else "No route to that destination")
+
+    with ui.row().classes('justify-center w-full'):
+        destinationInput = ui.input(label='Destination', placeholder='Latitude, Longitude')
+        ui.button('PLAN ROUTE', on_click=on_plan_route_click)
+        ui.button('CLEAR ROUTE', on_click=lambda e: set_planned_route([]))
+
     update_gui(mapCenter)
     ui.run(title='Slippy Map Test', native=True, dark=True, window_size=(tile_pixel_size()*3.1, tile_pixel_size()*4))
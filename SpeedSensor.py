@@ -0,0 +1,307 @@
+#!/usr/bin/env python
+
+# Rider speed, distance and GPS pose from a GPS receiver and/or wheel-speed sensor over serial
+# https://gpsd.gitlab.io/gpsd/NMEA.html#_rmc_recommended_minimum_navigation_information
+# https://en.wikipedia.org/wiki/NMEA_0183#Message_structure
+# https://pyserial.readthedocs.io/en/latest/url_handlers.html#loop
+#
+# Both sensors send NMEA 0183 sentences: $GPRMC from the GPS for position, heading and speed, and the
+# proprietary $PWHL,<pulses>,<milliseconds>*CS from the wheel sensor with its running pulse count.
+# An odometer integrates whichever is available, the wheel when it reports (it works under bridges and
+# is not smoothed by the GPS filter) and otherwise GPS speed over the RMC time stamps. Radar.py stamps
+# every frame with the odometer change since its previous frame, which is the ego-motion distance
+# find_stationary_points() needs. A GPS without a wheel sensor sends about one fix per second while
+# the radar scans 5-10 times, so between fixes the odometer is extrapolated with the last speed over
+# the monotonic time since the fix, and the next fix corrects the estimate. In TESTING mode the serial port is a loop:// stand-in and
+# simulate() writes the sentences a rider at a given speed would produce.
+
+# Standard library imports not needing pip installs
+from dataclasses import dataclass
+from functools import reduce
+import operator
+import time
+
+DEFAULT_PORT = '/dev/ttyUSB1'
+DEFAULT_BAUD_RATE = 9600
+
+# 700x28c road tire
+DEFAULT_WHEEL_CIRCUMFERENCE_IN_METERS = 2.136
+DEFAULT_PULSES_PER_REVOLUTION = 1
+
+METERS_PER_SECOND_PER_KNOT = 1852 / 3600
+SECONDS_PER_DAY = 24 * 60 * 60
+
+
+@dataclass
+class PoseSample:
+    """The latest GPS fix of the rider."""
+
+    lat: float
+    lon: float
+    headingDegrees: float
+    speedInMetersPerSecond: float
+
+
+def nmea_checksum(body: str) -> str:
+    """ Two hex digit XOR checksum of the characters between '$' and '*'
+
+    Args:
+        body (str): Sentence without '$' and '*CS'
+
+    Returns:
+        str: The checksum, like "6A".
+    """
+    return f"{reduce(operator.xor, body.encode(), 0):02X}"
+
+
+def nmea_sentence(body: str) -> bytes:
+    return f"${body}*{nmea_checksum(body)}\r\n".encode()
+
+
+def parse_nmea_coordinate(value: str, hemisphere: str) -> float:
+    """ Convert a NMEA (d)ddmm.mmmm coordinate to signed decimal degrees
+
+    Args:
+        value (str): Degrees and decimal minutes, like "3608.9836"
+        hemisphere (str): "N", "S", "E" or "W"
+
+    Returns:
+        float: The coordinate in degrees, negative south and west.
+    """
+    dot = value.index(".")
+    degrees = int(value[:dot - 2]) + float(value[dot - 2:]) / 60
+
+    return -degrees if hemisphere in ("S", "W") else degrees
+
+
+def format_nmea_coordinate(degrees: float, isLatitude: bool) -> tuple:
+    hemisphere = ("N" if degrees >= 0 else "S") if isLatitude else ("E" if degrees >= 0 else "W")
+    degrees = abs(degrees)
+    wholeDegrees = int(degrees)
+    minutes = (degrees - wholeDegrees) * 60
+
+    return (f"{wholeDegrees:0{2 if isLatitude else 3}d}{minutes:07.4f}", hemisphere)
+
+
+class SpeedSensor:
+
+    def __init__(self, port: str = DEFAULT_PORT, mode: str = 'TESTING', wheelCircumferenceInMeters: float = DEFAULT_WHEEL_CIRCUMFERENCE_IN_METERS, pulsesPerRevolution: int = DEFAULT_PULSES_PER_REVOLUTION, clock=time.monotonic):
+        """ Open the serial connection of the GPS and wheel-speed sensor.
+
+        Args:
+            port (str, optional): Serial port of the sensors. Defaults to '/dev/ttyUSB1'.
+            mode (str, optional): Operating mode ('TESTING' or 'PRODUCTION'). Defaults to 'TESTING'.
+            wheelCircumferenceInMeters (float, optional): Distance ridden per wheel revolution. Defaults to 2.136.
+            pulsesPerRevolution (int, optional): Wheel sensor pulses per revolution. Defaults to 1.
+            clock (callable, optional): Seconds counter for extrapolating between GPS fixes, replaceable for tests. Defaults to time.monotonic.
+        """
+        import serial                       # pip install pyserial
+
+        self.mode = mode
+        self.clock = clock
+        self.metersPerPulse = wheelCircumferenceInMeters / pulsesPerRevolution
+
+        if mode == "TESTING":
+            self.serialConnection = serial.serial_for_url('loop://', timeout=0)
+        else:
+            try:
+                self.serialConnection = serial.Serial(port, DEFAULT_BAUD_RATE, timeout=0)
+            except serial.serialutil.SerialException as e:
+                print(f"Error initializing speed sensor serial connection: {e}")
+                self.serialConnection = None
+
+        self.buffer = b""
+        self.pose = None
+        self.speedInMetersPerSecond = 0.0
+        self.odometerInMeters = 0.0
+        self.frameOdometerInMeters = 0.0
+
+        # Previous wheel (pulses, milliseconds) and RMC seconds of day, None until the first sentence
+        self.lastWheel = None
+        self.lastFixSeconds = None
+
+        # Clock time the last GPS fix was applied, the start of the extrapolation without a wheel sensor
+        self.lastFixClock = None
+
+        # Simulated sensor state for simulate()
+        self.simulatedPulses = 0.0
+        self.simulatedMilliseconds = 0
+        self.simulatedSeconds = 0.0
+
+        self.stats = {"sentences": 0, "badSentences": 0, "frames": 0}
+
+
+    def __str__(self):
+        return f"SpeedSensor(mode={self.mode}, speed={self.speedInMetersPerSecond:.2f} m/s, odometer={self.odometerInMeters:.1f} m, pose={self.pose}, stats={self.stats})"
+
+
+    def poll(self):
+        """ Read and apply every complete sentence waiting on the serial port without blocking
+        """
+        if self.serialConnection is None:
+            return
+
+        waiting = self.serialConnection.in_waiting
+        if waiting:
+            self.buffer += self.serialConnection.read(waiting)
+
+        *lines, self.buffer = self.buffer.split(b"\n")
+        for line in lines:
+            self.parse(line.decode("ascii", errors="replace").strip())
+
+
+    def parse(self, sentence: str):
+        """ Apply one NMEA sentence, ignoring sentences with a bad checksum and unknown sentence types
+
+        Args:
+            sentence (str): Sentence like "$PWHL,120,60000*CS"
+        """
+        if not sentence.startswith("$") or "*" not in sentence:
+            return
+        body, checksum = sentence[1:].rsplit("*", 1)
+        if checksum.upper() != nmea_checksum(body):
+            self.stats["badSentences"] += 1
+            return
+
+        fields = body.split(",")
+        try:
+            if fields[0] == "PWHL":
+                self.apply_wheel(int(fields[1]), int(fields[2]))
+            elif fields[0].endswith("RMC") and fields[2] == "A":
+                self.apply_fix(fields)
+            else:
+                return
+        except (ValueError, IndexError):
+            self.stats["badSentences"] += 1
+            return
+        self.stats["sentences"] += 1
+
+
+    def apply_wheel(self, pulses: int, milliseconds: int):
+        if self.lastWheel is not None:
+            lastPulses, lastMilliseconds = self.lastWheel
+            distance = (pulses - lastPulses) * self.metersPerPulse
+            self.odometerInMeters += distance
+            if milliseconds > lastMilliseconds:
+                self.speedInMetersPerSecond = distance * 1000 / (milliseconds - lastMilliseconds)
+        self.lastWheel = (pulses, milliseconds)
+
+
+    def apply_fix(self, fields: list):
+        lat = parse_nmea_coordinate(fields[3], fields[4])
+        lon = parse_nmea_coordinate(fields[5], fields[6])
+        speed = float(fields[7] or 0) * METERS_PER_SECOND_PER_KNOT
+        heading = float(fields[8]) if fields[8] else (self.pose.headingDegrees if self.pose is not None else 0.0)
+        self.pose = PoseSample(lat, lon, heading, speed)
+
+        time = fields[1]
+        seconds = int(time[0:2]) * 3600 + int(time[2:4]) * 60 + float(time[4:])
+        if self.lastWheel is None:
+            if self.lastFixSeconds is not None:
+                self.odometerInMeters += speed * ((seconds - self.lastFixSeconds) % SECONDS_PER_DAY)
+            self.speedInMetersPerSecond = speed
+        self.lastFixSeconds = seconds
+        self.lastFixClock = self.clock()
+
+
+    def stamp_frame(self) -> float:
+        """ Meters ridden since the previous call, read once per radar frame
+
+        Returns:
+            float: Displacement since the previous frame in meters.
+        """
+        self.poll()
+        odometer = self.odometerInMeters
+        if self.lastWheel is None and self.lastFixClock is not None:
+            odometer += self.speedInMetersPerSecond * max(self.clock() - self.lastFixClock, 0.0)
+
+        # A fix behind the extrapolation does not move the rider backwards, the next frames make up for it
+        displacement = max(odometer - self.frameOdometerInMeters, 0.0)
+        self.frameOdometerInMeters = max(odometer, self.frameOdometerInMeters)
+        self.stats["frames"] += 1
+
+        return displacement
+
+
+    def simulate(self, speedInMetersPerSecond: float, seconds: float, lat: float = None, lon: float = None, headingDegrees: float = 0.0, wheel: bool = True):
+        """ Write the sentences a rider at a constant speed sends during some seconds to the loop:// stand-in
+
+        Args:
+            speedInMetersPerSecond (float): Speed of the simulated rider.
+            seconds (float): Time ridden.
+            lat (float, optional): Latitude for a $GPRMC fix at the end, None for no fix. Defaults to None.
+            lon (float, optional): Longitude for the fix. Defaults to None.
+            headingDegrees (float, optional): Heading for the fix. Defaults to 0.
+            wheel (bool, optional): Send the $PWHL wheel sentences. Defaults to True.
+        """
+        if self.mode != "TESTING":
+            raise ValueError("Only a TESTING speed sensor can be simulated")
+
+        if wheel:
+            if self.simulatedMilliseconds == 0:
+                self.serialConnection.write(nmea_sentence("PWHL,0,0"))
+            self.simulatedPulses += speedInMetersPerSecond * seconds / self.metersPerPulse
+            self.simulatedMilliseconds += int(round(seconds * 1000))
+            self.serialConnection.write(nmea_sentence(f"PWHL,{int(round(self.simulatedPulses))},{self.simulatedMilliseconds}"))
+
+        if lat is not None:
+            self.simulatedSeconds = (self.simulatedSeconds + seconds) % SECONDS_PER_DAY
+            hours, rest = divmod(self.simulatedSeconds, 3600)
+            minutes, secs = divmod(rest, 60)
+            latText, latHemisphere = format_nmea_coordinate(lat, True)
+            lonText, lonHemisphere = format_nmea_coordinate(lon, False)
+            knots = speedInMetersPerSecond / METERS_PER_SECOND_PER_KNOT
+            self.serialConnection.write(nmea_sentence(f"GPRMC,{int(hours):02d}{int(minutes):02d}{secs:05.2f},A,{latText},{latHemisphere},{lonText},{lonHemisphere},{knots:.2f},{headingDegrees:.1f},191026,,,A"))
+
+
+def unit_test():
+    # The classic RMC example sentence, 22.4 knots heading 84.4 degrees
+    example = SpeedSensor()
+    example.parse("$GPRMC,123519,A,4807.038,N,01131.000,E,022.4,084.4,230394,003.1,W*6A")
+    assert example.stats["sentences"] == 1 and abs(example.pose.lat - 48.1173) < 1e-9 and abs(example.pose.lon - 11.516666) < 1e-6
+    assert example.pose.headingDegrees == 84.4 and abs(example.speedInMetersPerSecond - 11.5236) < 1e-4
+    assert abs(parse_nmea_coordinate("3608.9836", "N") - 36.149727) < 1e-6
+    assert abs(parse_nmea_coordinate("11520.0503", "W") + 115.334172) < 1e-6
+    assert parse_nmea_coordinate(*format_nmea_coordinate(-115.334172, False)) == round(-115.334172 * 600000) / 600000
+
+    # GPS only: odometer from RMC speed over RMC time, the first fix only sets the start
+    now = [0.0]
+    gps = SpeedSensor(clock=lambda: now[0])
+    for _ in range(3):
+        gps.simulate(10, 0.5, 36.149727, -115.334172, 45, wheel=False)
+    assert abs(gps.stamp_frame() - 10) < 0.01 and gps.stamp_frame() == 0.0
+    assert abs(gps.speedInMetersPerSecond - 10) < 0.01 and gps.pose.headingDegrees == 45.0
+    assert abs(gps.pose.lat - 36.149727) < 1e-6 and abs(gps.pose.lon + 115.334172) < 1e-6
+
+    # A 1 Hz GPS and a 5 Hz radar: every frame gets its share of the ride, not one frame in five
+    gps = SpeedSensor(clock=lambda: now[0])
+    gps.simulate(10, 0.0, 36.149727, -115.334172, wheel=False)
+    gps.stamp_frame()
+    displacements = []
+    for frame in range(1, 16):
+        now[0] += 0.2
+        if frame % 5 == 0:
+            gps.simulate(10 if frame < 10 else 5, 1.0, 36.149727, -115.334172, wheel=False)
+        displacements.append(gps.stamp_frame())
+    assert all(abs(displacement - 2) < 0.01 for displacement in displacements[:9])
+
+    # Slowing to 5 m/s: the extrapolation ran 3 meters ahead, the frames after the fix hold still until the odometer catches up
+    assert max(displacements[9:13]) < 1e-9 and abs(displacements[-1] - 1) < 0.01 and abs(sum(displacements) - 20) < 0.01
+
+    # The wheel takes over the odometer from the GPS
+    both = SpeedSensor()
+    both.simulate(8, 0.5, 36.149727, -115.334172)
+    both.stamp_frame()
+    both.simulate(8, 0.5, 36.149727, -115.334172)
+    displacement = both.stamp_frame()
+    assert abs(displacement - 4) < both.metersPerPulse and abs(both.speedInMetersPerSecond - displacement * 2) < 1e-9
+
+    # Bad checksums and half received sentences are not applied
+    both.serialConnection.write(b"$PWHL,999,99999*00\r\n$PWHL,1")
+    assert both.stamp_frame() == 0.0 and both.stats["badSentences"] == 1 and both.buffer == b"$PWHL,1"
+    print(both)
+    print("All tests passed!")
+
+
+if __name__ == "__main__":
+    unit_test()
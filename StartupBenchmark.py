@@ -0,0 +1,127 @@
+#!/usr/bin/env python
+
+# Import time budget for the entry points that have to start fast on the bike's SBC
+# https://docs.python.org/3/using/cmdline.html#cmdoption-X
+# https://docs.python.org/3/whatsnew/3.7.html#python-importtime
+#
+# Every module is imported in a fresh interpreter with "python -X importtime", which prints the self
+# and cumulative microseconds of every import on stderr. The best of a few runs is compared with the
+# module's budget, and the GUI and messaging packages that the processing core must not pull in are
+# looked for in the import list. Running this file exits with status 1 when a budget is exceeded or a
+# deferred package is imported again, so it can gate a commit or CI job.
+
+# Standard library imports not needing pip installs
+import os
+import subprocess
+import sys
+
+REPOSITORY_FOLDER = os.path.dirname(os.path.abspath(__file__))
+
+# Cold import budgets in milliseconds, about 3x what a laptop measures to leave room for a slow SBC
+IMPORT_BUDGETS_IN_MS = {
+    "Radar": 250,
+    "SlippyMap": 250,
+    "Risk": 200,
+    "StationaryObject": 40,
+}
+
+# Packages only the GUI or risk publishing needs, they must stay lazy imports
+DEFERRED_PACKAGES = ["nicegui", "plotly", "serial", "dotenv", "zmq", "PIL", "ipinfo", "requests", "httpx"]
+
+DEFAULT_RUNS = 5
+
+
+def parse_import_times(stderr: str) -> list:
+    """ Parse the output of python -X importtime
+
+    Args:
+        stderr (str): Standard error of the interpreter
+
+    Returns:
+        list: (module, self microseconds, cumulative microseconds, nesting depth) per import, in the printed order.
+    """
+    imports = []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        selfTime, cumulativeTime, name = line[len("import time:"):].split("|")
+        depth = (len(name) - len(name.lstrip()) - 1) // 2
+        imports.append((name.strip(), int(selfTime), int(cumulativeTime), depth))
+
+    return imports
+
+
+def import_times(module: str) -> list:
+    """ Import a module in a fresh interpreter and return its parsed import times, see parse_import_times()
+    """
+    result = subprocess.run([sys.executable, "-X", "importtime", "-c", f"import {module}"], cwd=REPOSITORY_FOLDER, capture_output=True, text=True)
+    if result.returncode != 0:
+        raise ValueError(f"Importing {module} failed: {result.stderr.strip().splitlines()[-1]}")
+
+    return parse_import_times(result.stderr)
+
+
+def measure(module: str, runs: int = DEFAULT_RUNS) -> tuple:
+    """ Best cumulative import time of a module over a few runs
+
+    Args:
+        module (str): Module name, like "Radar"
+        runs (int, optional): Fresh interpreters to try. Defaults to 5.
+
+    Returns:
+        tuple: (milliseconds, imports of the fastest run).
+    """
+    best = None
+    for _ in range(runs):
+        imports = import_times(module)
+        total = next(cumulative for name, _, cumulative, depth in imports if name == module and depth == 0)
+        if best is None or total < best[0]:
+            best = (total, imports)
+
+    return (best[0] / 1000, best[1])
+
+
+def run_benchmark(budgets: dict = IMPORT_BUDGETS_IN_MS, runs: int = DEFAULT_RUNS, heaviest: int = 5) -> bool:
+    """ Measure every budgeted module and print the result with its heaviest imports
+
+    Args:
+        budgets (dict, optional): Module name to budget in milliseconds. Defaults to IMPORT_BUDGETS_IN_MS.
+        runs (int, optional): Fresh interpreters per module. Defaults to 5.
+        heaviest (int, optional): Imports with the most self time to print per module. Defaults to 5.
+
+    Returns:
+        bool: True when every module is within budget and imports none of DEFERRED_PACKAGES.
+    """
+    passed = True
+    for module, budget in budgets.items():
+        milliseconds, imports = measure(module, runs)
+        deferred = sorted({name.split(".")[0] for name, _, _, _ in imports} & set(DEFERRED_PACKAGES))
+        ok = milliseconds <= budget and len(deferred) == 0
+        passed = passed and ok
+
+        print(f"{'PASS' if ok else 'FAIL'} {module}: {milliseconds:.1f} ms of {budget} ms budget, {len(imports)} imports")
+        if deferred:
+            print(f"     imports deferred packages: {', '.join(deferred)}")
+        for name, selfTime, _, _ in sorted(imports, key=lambda item: -item[1])[:heaviest]:
+            print(f"     {selfTime / 1000:7.1f} ms  {name}")
+
+    return passed
+
+
+def unit_test():
+    sample = ("import time: self [us] | cumulative | imported package\n"
+              "import time:       150 |        150 |     _io\n"
+              "import time:      2000 |       2500 |   numpy\n"
+              "import time:       300 |       2800 | Radar\n")
+    assert parse_import_times(sample) == [("_io", 150, 150, 2), ("numpy", 2000, 2500, 1), ("Radar", 300, 2800, 0)]
+
+    # The dataclass no longer imports Risk.py (and with it TileMath and NumPy) just for a type
+    milliseconds, imports = measure("StationaryObject", runs=1)
+    names = {name for name, _, _, _ in imports}
+    assert milliseconds > 0 and "Risk" not in names and "numpy" not in names
+    print("All tests passed!")
+
+
+if __name__ == "__main__":
+    unit_test()
+    sys.exit(0 if run_benchmark() else 1)
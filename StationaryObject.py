@@ -2,8 +2,18 @@
 
 # Standard libraries
 from dataclasses import dataclass, field
-import math
-from Risk import Risk
+from typing import TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from Risk import Risk
+
+
+def new_risk() -> "Risk":
+    """Creates the risk of a new object, importing Risk.py only once an object is made."""
+    from Risk import Risk
+
+    return Risk()
+
 
 @dataclass
 class StationaryObject:
@@ -17,7 +27,7 @@ class StationaryObject:
 
     objectPolyline: list[list, list] = field(default_factory=list)
 
-    risk: Risk()
+    risk: "Risk" = field(default_factory=new_risk)
 
     def add_point(self, radius: int, theta: int):
         """Adds a point to the object's radius and theta lists."""
@@ -32,23 +42,11 @@ class StationaryObject:
     def __str__(self) -> str:
         """Returns a string representation of the object."""
 
-        position = []
-        for i, (r, thetaDegrees) in enumerate(zip(self.radius, self.theta)):
-            thetaRadians = math.radians(thetaDegrees)
-            x = r * math.cos(thetaRadians)
-            y = r * math.sin(thetaRadians)
-
-            # Rotate the object by 90 degrees counter-clockwise to match the radar plot in Radar.py file
-            xRotated = round(-y, 5)
-            yRotated = round(x, 5)
-
-            if xRotated == -0.0:
-                xRotated = 0.0
-
-            if yRotated == -0.0:
-                yRotated = 0.0
+        from PolarGeometry import polar_to_cartesian_array
 
-            position.append((xRotated, yRotated))
+        # One table lookup for all points, then rotate by 90 degrees counter-clockwise to match the radar plot in Radar.py file
+        x, y = polar_to_cartesian_array(self.radius, self.theta)
+        position = [(round(-yPoint, 5) + 0.0, round(xPoint, 5) + 0.0) for xPoint, yPoint in zip(x.tolist(), y.tolist())]
 
         return f"StationaryObject #{self.objectId} (X-Y Points: {position} & Polar Points: (Radius={self.radius} , Theta={self.theta})"
 
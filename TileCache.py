@@ -0,0 +1,409 @@
+#!/usr/bin/env python
+
+# Persistent map tile store so the bike does not download the same OpenStreetMap tile twice
+# https://operations.osmfoundation.org/policies/tiles/
+# https://developer.mozilla.org/en-US/docs/Web/HTTP/Conditional_requests
+#
+# Tiles live in one SQLite file keyed by (layer, zoom, x, y) in the spirit of MBTiles. The least
+# recently used tiles are deleted once the file grows past maxBytes, and tiles older than maxAge
+# are revalidated with If-None-Match / If-Modified-Since so an unchanged tile costs a 304 reply.
+# When the network is down the stale copy is served instead of nothing. Reading a tile does not write
+# to the file: the last access times are buffered in memory and written in one batch before evicting,
+# every ACCESS_FLUSH_INTERVAL_IN_SECONDS and on close().
+
+# Standard library imports not needing pip installs
+import os
+import sqlite3
+import threading
+import time
+
+# 3rd party libraries
+import requests                     # pip install requests
+
+DEFAULT_DATABASE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "cache", "tiles.sqlite")
+DEFAULT_MAX_BYTES = 200 * 1024 * 1024
+DEFAULT_MAX_AGE_IN_SECONDS = 7 * 24 * 60 * 60
+REQUEST_TIMEOUT_IN_SECONDS = 10
+ACCESS_FLUSH_INTERVAL_IN_SECONDS = 30
+USER_AGENT = "BikeRADAR/1.0 (+https://github.com/OpenSourceIronman/BikeRADAR)"
+
+MEDIA_TYPES = {"png": "image/png", "jpg": "image/jpeg", "webp": "image/webp"}
+
+
+class TileCache:
+
+    def __init__(self, tileURL, path: str = DEFAULT_DATABASE_PATH, maxBytes: int = DEFAULT_MAX_BYTES, maxAge: float = DEFAULT_MAX_AGE_IN_SECONDS):
+        """ Open (or create) the tile store.
+
+        Args:
+            tileURL (function): Builds the remote URL of a tile from (zoomLevel, x, y, layer), like SlippyMap.tile_URL()
+            path (str, optional): SQLite file to store tiles in. Defaults to cache/tiles.sqlite.
+            maxBytes (int, optional): Size of all tile images before least recently used tiles are evicted. Defaults to 200 MB.
+            maxAge (float, optional): Seconds before a stored tile is revalidated with the tile server. Defaults to 7 days.
+        """
+        self.tileURL = tileURL
+        self.path = path
+        self.maxBytes = maxBytes
+        self.maxAge = maxAge
+
+        # One keep-alive HTTP session so tiles do not each pay for a new TCP/TLS handshake
+        self.session = requests.Session()
+        self.session.headers["User-Agent"] = USER_AGENT
+
+        if path != ":memory:":
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+
+        # NiceGUI serves tiles from worker threads, so one connection is shared behind a lock
+        self.lock = threading.Lock()
+        self.database = sqlite3.connect(path, check_same_thread=False)
+        self.database.execute("PRAGMA journal_mode=WAL")
+        self.database.execute("""CREATE TABLE IF NOT EXISTS tiles (
+            layer TEXT NOT NULL,
+            zoom INTEGER NOT NULL,
+            x INTEGER NOT NULL,
+            y INTEGER NOT NULL,
+            data BLOB NOT NULL,
+            size INTEGER NOT NULL,
+            etag TEXT,
+            lastModified TEXT,
+            fetchedAt REAL NOT NULL,
+            lastAccess REAL NOT NULL,
+            PRIMARY KEY (layer, zoom, x, y))""")
+        self.database.execute("CREATE INDEX IF NOT EXISTS tilesByLastAccess ON tiles (lastAccess)")
+        self.database.commit()
+
+        self.totalBytes = self.database.execute("SELECT COALESCE(SUM(size), 0) FROM tiles").fetchone()[0]
+
+        # Last access time of tiles read since the last flush_access(), keyed by (layer, zoom, x, y)
+        self.pendingAccess = {}
+        self.lastAccessFlush = time.monotonic()
+
+        # Counters for checking how often the network was needed, changed with count() from any thread
+        self.stats = {"hits": 0, "misses": 0, "revalidated": 0, "updated": 0, "staleServed": 0, "evicted": 0, "accessFlushes": 0}
+
+
+    def __str__(self):
+        return f"TileCache(path={self.path}, totalBytes={self.totalBytes}, maxBytes={self.maxBytes}, stats={self.stats})"
+
+
+    def close(self):
+        """ Close the HTTP session and the SQLite database.
+        """
+        self.session.close()
+        with self.lock:
+            self.flush_access()
+            self.database.close()
+
+
+    def count(self, name: str):
+        """ Add one to a counter of self.stats, safe from the NiceGUI worker threads
+
+        Args:
+            name (str): Key of the counter.
+        """
+        with self.lock:
+            self.stats[name] += 1
+
+
+    def get_tile(self, zoomLevel: int, x: int, y: int, layer: str = "osm") -> bytes:
+        """ Get a tile image from the store, downloading or revalidating it when needed.
+
+        Args:
+            zoomLevel (int): The zoom level.
+            x (int): The x-coordinate of the tile.
+            y (int): The y-coordinate of the tile.
+            layer (str, optional): The tile layer, see SlippyMap.tile_layer_base_url(). Defaults to "osm".
+
+        Returns:
+            bytes: The encoded tile image, or None if it is not stored and the tile server can not be reached.
+        """
+        row = self.lookup(zoomLevel, x, y, layer)
+        if row is None:
+            self.count("misses")
+            return self.fetch(zoomLevel, x, y, layer)
+
+        data, etag, lastModified, fetchedAt = row
+        if self.is_fresh(fetchedAt):
+            self.count("hits")
+            return data
+
+        newData = self.fetch(zoomLevel, x, y, layer, etag, lastModified)
+        if newData is None:
+            self.count("staleServed")
+            return data
+
+        return newData
+
+
+    def is_fresh(self, fetchedAt: float) -> bool:
+        """ Check if a tile fetched at a time can be served without revalidating it.
+
+        Args:
+            fetchedAt (float): Time the tile was last downloaded or revalidated, from time.time()
+
+        Returns:
+            bool: True if the tile is younger than maxAge.
+        """
+        return time.time() - fetchedAt < self.maxAge
+
+
+    def lookup(self, zoomLevel: int, x: int, y: int, layer: str = "osm") -> tuple:
+        """ Read a stored tile without any network access and mark it as recently used.
+
+        Args:
+            zoomLevel (int): The zoom level.
+            x (int): The x-coordinate of the tile.
+            y (int): The y-coordinate of the tile.
+            layer (str, optional): The tile layer. Defaults to "osm".
+
+        Returns:
+            tuple: (data, etag, lastModified, fetchedAt) or None if the tile is not stored.
+        """
+        with self.lock:
+            row = self.database.execute(
+                "SELECT data, etag, lastModified, fetchedAt FROM tiles WHERE layer=? AND zoom=? AND x=? AND y=?",
+                (layer, zoomLevel, x, y)).fetchone()
+            if row is not None:
+                self.pendingAccess[(layer, zoomLevel, x, y)] = time.time()
+            if time.monotonic() - self.lastAccessFlush > ACCESS_FLUSH_INTERVAL_IN_SECONDS:
+                self.flush_access()
+                self.database.commit()
+
+        return row
+
+
+    def flush_access(self):
+        """ Write the buffered last access times in one batch, the caller must hold self.lock and commit
+        """
+        self.lastAccessFlush = time.monotonic()
+        if not self.pendingAccess:
+            return
+
+        self.database.executemany("UPDATE tiles SET lastAccess=? WHERE layer=? AND zoom=? AND x=? AND y=?",
+                                  [(lastAccess, *key) for key, lastAccess in self.pendingAccess.items()])
+        self.pendingAccess.clear()
+        self.stats["accessFlushes"] += 1
+
+
+    def fetch(self, zoomLevel: int, x: int, y: int, layer: str = "osm", etag: str = None, lastModified: str = None) -> bytes:
+        """ Download a tile, or revalidate the stored copy when etag or lastModified is given, and store the result.
+
+        Args:
+            zoomLevel (int): The zoom level.
+            x (int): The x-coordinate of the tile.
+            y (int): The y-coordinate of the tile.
+            layer (str, optional): The tile layer. Defaults to "osm".
+            etag (str, optional): ETag of the stored copy. Defaults to None.
+            lastModified (str, optional): Last-Modified of the stored copy. Defaults to None.
+
+        Returns:
+            bytes: The tile image, or None if the tile server could not be reached.
+        """
+        try:
+            response = self.session.get(self.tileURL(zoomLevel, x, y, layer), headers=conditional_headers(etag, lastModified), timeout=REQUEST_TIMEOUT_IN_SECONDS)
+        except requests.RequestException as e:
+            print(f"Error downloading tile {layer}/{zoomLevel}/{x}/{y}: {e}")
+            return None
+
+        return self.store_response(zoomLevel, x, y, layer, response.status_code, response.content, response.headers, bool(etag or lastModified))
+
+
+    def store_response(self, zoomLevel: int, x: int, y: int, layer: str, statusCode: int, content: bytes, headers, revalidating: bool = False) -> bytes:
+        """ Store the reply of the tile server to a download or conditional request, shared by fetch() and TileFetcher.
+
+        Args:
+            zoomLevel (int): The zoom level.
+            x (int): The x-coordinate of the tile.
+            y (int): The y-coordinate of the tile.
+            layer (str): The tile layer.
+            statusCode (int): HTTP status code of the reply.
+            content (bytes): Body of the reply.
+            headers (dict): Headers of the reply.
+            revalidating (bool, optional): True if the request was a conditional one. Defaults to False.
+
+        Returns:
+            bytes: The tile image, or None if the reply was an error.
+        """
+        if statusCode == 304:
+            with self.lock:
+                self.stats["revalidated"] += 1
+                self.database.execute("UPDATE tiles SET fetchedAt=? WHERE layer=? AND zoom=? AND x=? AND y=?",
+                                      (time.time(), layer, zoomLevel, x, y))
+                self.database.commit()
+            row = self.lookup(zoomLevel, x, y, layer)
+            return row[0] if row else None
+
+        if statusCode != 200:
+            print(f"Error downloading tile {layer}/{zoomLevel}/{x}/{y}: HTTP {statusCode}")
+            return None
+
+        if revalidating:
+            self.count("updated")
+
+        self.put_tile(zoomLevel, x, y, layer, content, headers.get("ETag"), headers.get("Last-Modified"))
+
+        return content
+
+
+    def put_tile(self, zoomLevel: int, x: int, y: int, layer: str, data: bytes, etag: str = None, lastModified: str = None):
+        """ Store a tile image and evict least recently used tiles if the store is over maxBytes.
+
+        Args:
+            zoomLevel (int): The zoom level.
+            x (int): The x-coordinate of the tile.
+            y (int): The y-coordinate of the tile.
+            layer (str): The tile layer.
+            data (bytes): The encoded tile image.
+            etag (str, optional): ETag header from the tile server. Defaults to None.
+            lastModified (str, optional): Last-Modified header from the tile server. Defaults to None.
+        """
+        now = time.time()
+        with self.lock:
+            oldSize = self.database.execute("SELECT size FROM tiles WHERE layer=? AND zoom=? AND x=? AND y=?",
+                                            (layer, zoomLevel, x, y)).fetchone()
+            self.database.execute("INSERT OR REPLACE INTO tiles VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                                  (layer, zoomLevel, x, y, data, len(data), etag, lastModified, now, now))
+            self.pendingAccess.pop((layer, zoomLevel, x, y), None)
+            self.totalBytes += len(data) - (oldSize[0] if oldSize else 0)
+            self.evict()
+            self.database.commit()
+
+
+    def evict(self):
+        """ Delete least recently used tiles until the store fits in maxBytes, the caller must hold self.lock
+        """
+        if self.totalBytes > self.maxBytes:
+            self.flush_access()
+
+        while self.totalBytes > self.maxBytes:
+            rows = self.database.execute("SELECT layer, zoom, x, y, size FROM tiles ORDER BY lastAccess LIMIT 64").fetchall()
+            if not rows:
+                self.totalBytes = 0
+                break
+
+            for layer, zoomLevel, x, y, size in rows:
+                if self.totalBytes <= self.maxBytes:
+                    break
+                self.database.execute("DELETE FROM tiles WHERE layer=? AND zoom=? AND x=? AND y=?", (layer, zoomLevel, x, y))
+                self.totalBytes -= size
+                self.stats["evicted"] += 1
+
+
+def conditional_headers(etag: str = None, lastModified: str = None) -> dict:
+    """ Build the HTTP headers that turn a tile download into a conditional request
+
+    Args:
+        etag (str, optional): ETag of the stored copy. Defaults to None.
+        lastModified (str, optional): Last-Modified of the stored copy. Defaults to None.
+
+    Returns:
+        dict: The request headers.
+    """
+    headers = {}
+    if etag:
+        headers["If-None-Match"] = etag
+    if lastModified:
+        headers["If-Modified-Since"] = lastModified
+
+    return headers
+
+
+def local_tile_URL(zoomLevel: int, x: int, y: int, layer: str = "osm", ext: str = "png") -> str:
+    """ URL of a tile served by TileFetcher.add_tile_route() from the local tile store
+
+    Args:
+        zoomLevel (int): The zoom level.
+        x (int): The x-coordinate of the tile.
+        y (int): The y-coordinate of the tile.
+        layer (str, optional): The tile layer. Defaults to "osm".
+        ext (str, optional): The image file extension. Defaults to "png".
+
+    Returns:
+        str: URL path of the tile on the NiceGUI server.
+    """
+    return f"/tiles/{layer}/{zoomLevel}/{x}/{y}.{ext}"
+
+
+def unit_test():
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+    import tempfile
+
+    requestLog = []
+
+    class StandInTileServer(BaseHTTPRequestHandler):
+        """ Local stand-in for tile.openstreetmap.org that supports ETag revalidation"""
+
+        def do_GET(self):
+            requestLog.append(self.path)
+            etag = f'"{self.path}"'
+            if self.headers.get("If-None-Match") == etag:
+                self.send_response(304)
+                self.end_headers()
+                return
+
+            body = self.path.encode() * 100
+            self.send_response(200)
+            self.send_header("Content-Type", "image/png")
+            self.send_header("Content-Length", str(len(body)))
+            self.send_header("ETag", etag)
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), StandInTileServer)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    port = server.server_address[1]
+    tileURL = lambda zoomLevel, x, y, layer: f"http://127.0.0.1:{port}/{layer}/{zoomLevel}/{x}/{y}.png"
+
+    with tempfile.TemporaryDirectory() as directory:
+        tileCache = TileCache(tileURL, os.path.join(directory, "tiles.sqlite"), maxBytes=5000)
+
+        tile = tileCache.get_tile(10, 184, 401)
+        assert tile == b"/osm/10/184/401.png" * 100 and len(requestLog) == 1
+        assert tileCache.get_tile(10, 184, 401) == tile and len(requestLog) == 1
+
+        # Stale tiles are revalidated with a conditional request instead of downloaded again
+        tileCache.maxAge = 0
+        assert tileCache.get_tile(10, 184, 401) == tile and len(requestLog) == 2
+        assert tileCache.stats["revalidated"] == 1
+        tileCache.maxAge = DEFAULT_MAX_AGE_IN_SECONDS
+
+        # Reads are only written to the file in a batch, when the least recently used tile is needed
+        tileCache.get_tile(10, 184, 402)
+        tileCache.get_tile(10, 184, 401)
+        assert len(tileCache.pendingAccess) == 1 and tileCache.stats["accessFlushes"] == 0
+
+        # Tiles are 1900 bytes so the third tile evicts the least recently used one
+        tileCache.get_tile(10, 184, 403)
+        assert tileCache.lookup(10, 184, 402) is None and tileCache.stats["accessFlushes"] == 1
+        assert tileCache.lookup(10, 184, 401) is not None and tileCache.totalBytes <= 5000
+
+        # Stored tiles are still served once the tile server goes away
+        server.shutdown()
+        server.server_close()
+        tileCache.maxAge = 0
+        assert tileCache.get_tile(10, 184, 401) == tile and tileCache.stats["staleServed"] == 1
+        assert tileCache.get_tile(10, 184, 404) is None
+
+        # Counters stay exact with NiceGUI worker threads reading at once
+        tileCache.maxAge = DEFAULT_MAX_AGE_IN_SECONDS
+        hits = tileCache.stats["hits"]
+        readers = [threading.Thread(target=lambda: [tileCache.get_tile(10, 184, 401) for _ in range(200)]) for _ in range(8)]
+        for reader in readers:
+            reader.start()
+        for reader in readers:
+            reader.join()
+        assert tileCache.stats["hits"] == hits + 8 * 200
+
+        tileCache.close()
+        reopened = TileCache(tileURL, os.path.join(directory, "tiles.sqlite"))
+        assert reopened.totalBytes == 2 * len(tile) and reopened.lookup(10, 184, 403) is not None
+        reopened.close()
+
+    print("All tests passed!")
+
+
+if __name__ == "__main__":
+    unit_test()
@@ -0,0 +1,450 @@
+#!/usr/bin/env python
+
+# Draws routes, risks and radar detections on top of map tiles without touching the disk
+# https://pillow.readthedocs.io/en/stable/reference/Image.html#PIL.Image.alpha_composite
+#
+# Every overlay is its own layer with a version number that goes up whenever its data changes.
+# Layers are rendered per tile into transparent RGBA images cached by (layer, version, tile), so a
+# new radar frame re-renders the detections layer only and reuses the cached route and risk layers.
+# Finished tiles are encoded to PNG or WebP bytes and cached by tile and the versions of all layers.
+# A layer's tile_signature() tells which tiles of the view a data change actually redraws, so the
+# browser only reloads those instead of all 9 tiles on every radar frame. Tiles are composited in
+# NiceGUI worker threads: the caches sit behind a lock like TileCache, and a layer keeps its version
+# and data in one tuple so a render always draws the data of the version it is cached under.
+
+# Standard library imports not needing pip installs
+from collections import OrderedDict
+from io import BytesIO
+import threading
+
+# 3rd party libraries
+import numpy as np                  # pip install numpy
+from PIL import Image, ImageDraw    # pip install Pillow
+
+# Internal libraries
+from TileMath import TILE_SIZE, get_tile_fraction_XY_array
+from TileCache import TileCache, MEDIA_TYPES
+
+DEFAULT_MAX_CACHED_LAYER_TILES = 512
+DEFAULT_MAX_CACHED_COMPOSITES = 128
+IMAGE_FORMATS = {"png": "PNG", "webp": "WEBP"}
+
+
+def to_tile_pixels(zoomLevel: int, x: int, y: int, lat, lon) -> tuple:
+    """ Convert GPS coordinates to pixel coordinates relative to the top-left corner of a tile, which may be outside of it
+
+    Args:
+        zoomLevel (int): The zoom level.
+        x (int): The x-coordinate of the tile.
+        y (int): The y-coordinate of the tile.
+        lat (numpy.ndarray): The latitudes in degrees
+        lon (numpy.ndarray): The longitudes in degrees
+
+    Returns:
+        tuple: Arrays of pixel coordinates (pixelX, pixelY).
+    """
+    fractionX, fractionY = get_tile_fraction_XY_array(zoomLevel, lat, lon)
+
+    return ((fractionX - x) * TILE_SIZE, (fractionY - y) * TILE_SIZE)
+
+
+def encode_image(image: Image.Image, ext: str = "png") -> bytes:
+    """ Encode an image in memory
+
+    Args:
+        image (PIL.Image.Image): The image to encode.
+        ext (str, optional): "png" or "webp". Defaults to "png".
+
+    Returns:
+        bytes: The encoded image.
+    """
+    buffer = BytesIO()
+    image.save(buffer, format=IMAGE_FORMATS[ext])
+
+    return buffer.getvalue()
+
+
+class OverlayLayer:
+    """ Base class of the overlay layers, subclasses store their data with set_data() and implement draw() """
+
+    def __init__(self, name: str, color: str = "blue", data=None):
+        self.name = name
+        self.color = color
+
+        # (version, data) replaced in one assignment, so a worker thread drawing the layer never sees half an update
+        self.snapshot = (0, data)
+
+
+    def __str__(self):
+        return f"{type(self).__name__}(name={self.name}, version={self.version})"
+
+
+    @property
+    def version(self) -> int:
+        return self.snapshot[0]
+
+
+    @property
+    def data(self):
+        return self.snapshot[1]
+
+
+    def set_data(self, data):
+        """ Replace the data of the layer, so every tile of it is rendered again.
+
+        Args:
+            data (object): The new data, as draw() of the subclass expects it.
+        """
+        self.snapshot = (self.snapshot[0] + 1, data)
+
+
+    def render(self, zoomLevel: int, x: int, y: int, data=None) -> Image.Image:
+        """ Render the layer for one tile.
+
+        Args:
+            zoomLevel (int): The zoom level.
+            x (int): The x-coordinate of the tile.
+            y (int): The y-coordinate of the tile.
+            data (object, optional): Data of a snapshot to draw. Defaults to the current data.
+
+        Returns:
+            PIL.Image.Image: Transparent RGBA tile image, or None if nothing of the layer is on this tile.
+        """
+        image = Image.new("RGBA", (TILE_SIZE, TILE_SIZE), (0, 0, 0, 0))
+        if not self.draw(ImageDraw.Draw(image), self.data if data is None else data, zoomLevel, x, y):
+            return None
+
+        return image
+
+
+    def draw(self, draw: ImageDraw.ImageDraw, data, zoomLevel: int, x: int, y: int) -> bool:
+        """ Draw the layer data onto a tile image, returning False if nothing was drawn.
+        """
+        raise NotImplementedError
+
+
+    def tile_signature(self, zoomLevel: int, x: int, y: int):
+        """ Value that only changes when the drawing of the layer on a tile changes, the version unless a subclass knows better.
+
+        Args:
+            zoomLevel (int): The zoom level.
+            x (int): The x-coordinate of the tile.
+            y (int): The y-coordinate of the tile.
+
+        Returns:
+            object: Comparable value.
+        """
+        return self.version
+
+
+class PolylineLayer(OverlayLayer):
+    """ Lines through GPS points, like a planned route or the GPS track of a ride """
+
+    def __init__(self, name: str, color: str = "blue", width: int = 5):
+        super().__init__(name, color, [])
+        self.width = width
+
+
+    def set_lines(self, lines: list):
+        """ Replace the lines of the layer.
+
+        Args:
+            lines (list): Lists of (lat, lon) points, one list per line.
+        """
+        self.set_data([np.asarray(line, dtype=np.float64).reshape(-1, 2) for line in lines])
+
+
+    def draw(self, draw: ImageDraw.ImageDraw, lines: list, zoomLevel: int, x: int, y: int) -> bool:
+        drawn = False
+        for line in lines:
+            # A single point is no line
+            if len(line) < 2:
+                continue
+
+            pixelX, pixelY = to_tile_pixels(zoomLevel, x, y, line[:, 0], line[:, 1])
+
+            # Skip lines whose bounding box does not reach this tile
+            margin = self.width
+            if pixelX.max() < -margin or pixelX.min() > TILE_SIZE + margin or pixelY.max() < -margin or pixelY.min() > TILE_SIZE + margin:
+                continue
+
+            draw.line(list(zip(pixelX.tolist(), pixelY.tolist())), fill=self.color, width=self.width, joint="curve")
+            drawn = True
+
+        return drawn
+
+
+class PointLayer(OverlayLayer):
+    """ Dots at GPS points, like risks or radar detections, each point can have its own color """
+
+    def __init__(self, name: str, color: str = "red", radius: int = 4):
+        super().__init__(name, color, (np.empty(0), np.empty(0), None))
+        self.radius = radius
+
+
+    def set_points(self, lat, lon, colors: list = None):
+        """ Replace the points of the layer.
+
+        Args:
+            lat (numpy.ndarray): The latitudes in degrees
+            lon (numpy.ndarray): The longitudes in degrees
+            colors (list, optional): One color per point, or None to use the layer color. Defaults to None.
+        """
+        self.set_data((np.asarray(lat, dtype=np.float64), np.asarray(lon, dtype=np.float64), colors))
+
+
+    def visible_points(self, points: tuple, zoomLevel: int, x: int, y: int) -> tuple:
+        """ Pixel coordinates of the points on a tile and their indices
+
+        Args:
+            points (tuple): (lat, lon, colors) data of the layer.
+            zoomLevel (int): The zoom level.
+            x (int): The x-coordinate of the tile.
+            y (int): The y-coordinate of the tile.
+
+        Returns:
+            tuple: (pixelX, pixelY, indices of the points that reach the tile)
+        """
+        lat, lon, _ = points
+        pixelX, pixelY = to_tile_pixels(zoomLevel, x, y, lat, lon)
+        visible = np.flatnonzero((pixelX >= -self.radius) & (pixelX <= TILE_SIZE + self.radius) &
+                                 (pixelY >= -self.radius) & (pixelY <= TILE_SIZE + self.radius))
+
+        return (pixelX, pixelY, visible)
+
+
+    def tile_signature(self, zoomLevel: int, x: int, y: int):
+        # Points within the same pixel draw the same dot
+        points = self.data
+        pixelX, pixelY, visible = self.visible_points(points, zoomLevel, x, y)
+        colors = [points[2][i] if points[2] is not None else self.color for i in visible]
+
+        return (np.round(pixelX[visible]).astype(np.int64).tobytes(), np.round(pixelY[visible]).astype(np.int64).tobytes(), tuple(colors))
+
+
+    def draw(self, draw: ImageDraw.ImageDraw, points: tuple, zoomLevel: int, x: int, y: int) -> bool:
+        pixelX, pixelY, visible = self.visible_points(points, zoomLevel, x, y)
+        colors = points[2]
+        for i in visible:
+            color = colors[i] if colors is not None else self.color
+            draw.ellipse((pixelX[i] - self.radius, pixelY[i] - self.radius, pixelX[i] + self.radius, pixelY[i] + self.radius), fill=color)
+
+        return len(visible) > 0
+
+
+class TileCompositor:
+
+    def __init__(self, tileCache: TileCache, maxCachedLayerTiles: int = DEFAULT_MAX_CACHED_LAYER_TILES, maxCachedComposites: int = DEFAULT_MAX_CACHED_COMPOSITES):
+        """ Initialize the compositor without any layers.
+
+        Args:
+            tileCache (TileCache): Tile store for the base map tiles.
+            maxCachedLayerTiles (int, optional): Rendered layer tiles kept in memory. Defaults to 512.
+            maxCachedComposites (int, optional): Encoded finished tiles kept in memory. Defaults to 128.
+        """
+        self.tileCache = tileCache
+        self.maxCachedLayerTiles = maxCachedLayerTiles
+        self.maxCachedComposites = maxCachedComposites
+
+        # Drawn bottom to top in the order they were added
+        self.layers = []
+
+        # Least recently used entries are first, NiceGUI composites tiles in worker threads so both are shared behind a lock
+        self.lock = threading.Lock()
+        self.layerTiles = OrderedDict()
+        self.composites = OrderedDict()
+
+        self.stats = {"layerRenders": 0, "composites": 0, "compositeHits": 0}
+
+
+    def __str__(self):
+        return f"TileCompositor(layers={[str(layer) for layer in self.layers]}, stats={self.stats})"
+
+
+    def add_layer(self, layer: OverlayLayer) -> OverlayLayer:
+        """ Add an overlay layer on top of the existing ones.
+
+        Args:
+            layer (OverlayLayer): The layer to add.
+
+        Returns:
+            OverlayLayer: The added layer, to keep a reference for updating its data.
+        """
+        self.layers.append(layer)
+
+        return layer
+
+
+    def layer_tile(self, layer: OverlayLayer, zoomLevel: int, x: int, y: int, snapshot: tuple = None) -> Image.Image:
+        """ Get one rendered layer tile, rendering it only if this version of the layer has not been rendered for the tile.
+
+        Args:
+            layer (OverlayLayer): The layer.
+            zoomLevel (int): The zoom level.
+            x (int): The x-coordinate of the tile.
+            y (int): The y-coordinate of the tile.
+            snapshot (tuple, optional): (version, data) of the layer to render. Defaults to the current snapshot.
+
+        Returns:
+            PIL.Image.Image: The RGBA layer tile, or None if the layer is empty on this tile.
+        """
+        version, data = layer.snapshot if snapshot is None else snapshot
+        key = (layer.name, version, zoomLevel, x, y)
+        with self.lock:
+            if key in self.layerTiles:
+                self.layerTiles.move_to_end(key)
+                return self.layerTiles[key]
+
+        image = layer.render(zoomLevel, x, y, data)
+        with self.lock:
+            self.stats["layerRenders"] += 1
+            self.layerTiles[key] = image
+            if len(self.layerTiles) > self.maxCachedLayerTiles:
+                self.layerTiles.popitem(last=False)
+
+        return image
+
+
+    def composite(self, zoomLevel: int, x: int, y: int, layer: str = "osm", ext: str = "png") -> bytes:
+        """ Get the map tile with every overlay layer drawn on it.
+
+        Args:
+            zoomLevel (int): The zoom level.
+            x (int): The x-coordinate of the tile.
+            y (int): The y-coordinate of the tile.
+            layer (str, optional): The base map tile layer. Defaults to "osm".
+            ext (str, optional): "png" or "webp". Defaults to "png".
+
+        Returns:
+            bytes: The encoded tile, or None if the base tile is not available.
+        """
+        # One snapshot per layer, so the cache key and the drawing agree while the layers change
+        snapshots = [(overlay, overlay.snapshot) for overlay in self.layers]
+        key = (layer, zoomLevel, x, y, ext, tuple((overlay.name, snapshot[0]) for overlay, snapshot in snapshots))
+        with self.lock:
+            if key in self.composites:
+                self.composites.move_to_end(key)
+                self.stats["compositeHits"] += 1
+                return self.composites[key]
+
+        baseData = self.tileCache.get_tile(zoomLevel, x, y, layer)
+        if baseData is None:
+            return None
+
+        image = Image.open(BytesIO(baseData)).convert("RGBA")
+        for overlay, snapshot in snapshots:
+            layerImage = self.layer_tile(overlay, zoomLevel, x, y, snapshot)
+            if layerImage is not None:
+                image.alpha_composite(layerImage)
+
+        data = encode_image(image, ext)
+        with self.lock:
+            self.stats["composites"] += 1
+            self.composites[key] = data
+            if len(self.composites) > self.maxCachedComposites:
+                self.composites.popitem(last=False)
+
+        return data
+
+
+def composite_tile_URL(zoomLevel: int, x: int, y: int, layer: str = "osm", ext: str = "png") -> str:
+    """ URL of a composited tile served by add_composite_route()
+
+    Args:
+        zoomLevel (int): The zoom level.
+        x (int): The x-coordinate of the tile.
+        y (int): The y-coordinate of the tile.
+        layer (str, optional): The base map tile layer. Defaults to "osm".
+        ext (str, optional): "png" or "webp". Defaults to "png".
+
+    Returns:
+        str: URL path of the tile on the NiceGUI server.
+    """
+    return f"/composite/{layer}/{zoomLevel}/{x}/{y}.{ext}"
+
+
+def add_composite_route(tileCompositor: TileCompositor):
+    """ Serve composited tiles from memory on the NiceGUI server at the URLs built by composite_tile_URL()
+
+    Args:
+        tileCompositor (TileCompositor): The compositor to serve tiles from.
+    """
+    from nicegui import app, run
+    from fastapi import Response
+
+    @app.get("/composite/{layer}/{zoomLevel}/{x}/{y}.{ext}")
+    async def composite_route(layer: str, zoomLevel: int, x: int, y: int, ext: str):
+        if ext not in IMAGE_FORMATS:
+            return Response(status_code=404)
+
+        data = await run.io_bound(tileCompositor.composite, zoomLevel, x, y, layer, ext)
+        if data is None:
+            return Response(status_code=404)
+
+        # Overlays change all the time, so the browser must ask again
+        return Response(content=data, media_type=MEDIA_TYPES[ext], headers={"Cache-Control": "no-cache"})
+
+
+def unit_test():
+    from TileMath import convert_tile_XY_to_LatLon
+
+    class StandInTileCache:
+        """ Serves a plain white PNG for every tile"""
+
+        def get_tile(self, zoomLevel, x, y, layer):
+            return encode_image(Image.new("RGB", (TILE_SIZE, TILE_SIZE), "white"))
+
+    compositor = TileCompositor(StandInTileCache())
+    route = compositor.add_layer(PolylineLayer("route", "blue", 5))
+    detections = compositor.add_layer(PointLayer("detections", "red", 4))
+
+    # A route across the middle of tile (16, 11772, 25701) and one detection in its center
+    west = convert_tile_XY_to_LatLon(16, 11772, 25701, 0, 128, None)
+    east = convert_tile_XY_to_LatLon(16, 11772, 25701, 256, 128, None)
+    center = convert_tile_XY_to_LatLon(16, 11772, 25701, 128, 128, None)
+    route.set_lines([[west, east]])
+    detections.set_points([center[0]], [center[1]])
+
+    image = Image.open(BytesIO(compositor.composite(16, 11772, 25701)))
+    assert image.getpixel((20, 128))[:3] == (0, 0, 255)
+    assert image.getpixel((128, 128))[:3] == (255, 0, 0)
+    assert image.getpixel((128, 20))[:3] == (255, 255, 255)
+    assert compositor.stats["layerRenders"] == 2
+
+    # The same request is served from memory, a new radar frame only re-renders the detections layer
+    compositor.composite(16, 11772, 25701)
+    assert compositor.stats["compositeHits"] == 1 and compositor.stats["composites"] == 1
+    detections.set_points([], [])
+    image = Image.open(BytesIO(compositor.composite(16, 11772, 25701, ext="webp")))
+    assert image.format == "WEBP" and compositor.stats["layerRenders"] == 3
+
+    # A detection moving inside one tile only changes the signature of that tile
+    detections.set_points([center[0]], [center[1]])
+    signatures = {tile: detections.tile_signature(*tile) for tile in [(16, 11772, 25701), (16, 11773, 25701)]}
+    moved = convert_tile_XY_to_LatLon(16, 11772, 25701, 100, 100, None)
+    detections.set_points([moved[0]], [moved[1]])
+    assert detections.tile_signature(16, 11772, 25701) != signatures[(16, 11772, 25701)]
+    assert detections.tile_signature(16, 11773, 25701) == signatures[(16, 11773, 25701)]
+
+    # Nothing is rendered for tiles the layers do not reach, a line of one point is skipped
+    assert compositor.layer_tile(route, 16, 11780, 25701) is None
+    route.set_lines([[west], []])
+    assert compositor.layer_tile(route, 16, 11772, 25701) is None
+
+    # Worker threads compositing while the detections change and the caches evict never fail
+    from concurrent.futures import ThreadPoolExecutor
+    compositor = TileCompositor(StandInTileCache(), maxCachedLayerTiles=4, maxCachedComposites=4)
+    route = compositor.add_layer(route)
+    detections = compositor.add_layer(detections)
+    tiles = [(16, 11772 + dx, 25701 + dy) for dx in (-1, 0, 1) for dy in (-1, 0, 1)]
+    with ThreadPoolExecutor(8) as pool:
+        requests = [pool.submit(compositor.composite, *tile) for tile in tiles * 20]
+        for i in range(200):
+            detections.set_points([center[0] + i * 1e-6], [center[1]])
+        assert all(request.result() is not None for request in requests)
+    assert len(compositor.layerTiles) <= 4 and len(compositor.composites) <= 4
+    print("All tests passed!")
+
+
+if __name__ == "__main__":
+    unit_test()
@@ -0,0 +1,300 @@
+#!/usr/bin/env python
+
+# Concurrent map tile downloads for TileCache.py
+# https://www.python-httpx.org/async/
+# https://operations.osmfoundation.org/policies/tiles/
+#
+# One pooled keep-alive httpx client is shared by every download, a semaphore bounds how many tiles
+# are requested at the same time, duplicate requests for a tile that is already downloading wait on
+# the same task, and failed downloads are retried with exponential backoff.
+
+# Standard library imports not needing pip installs
+import asyncio
+import random
+import time
+
+# 3rd party libraries
+import httpx                        # pip install httpx
+
+# Internal libraries
+from TileCache import TileCache, USER_AGENT, REQUEST_TIMEOUT_IN_SECONDS, MEDIA_TYPES, conditional_headers
+
+DEFAULT_MAX_CONCURRENCY = 4
+DEFAULT_RETRIES = 3
+DEFAULT_BACKOFF_IN_SECONDS = 0.25
+
+# Replies worth retrying, every other error reply is final
+RETRY_STATUS_CODES = {429, 500, 502, 503, 504}
+
+
+class TileFetcher:
+
+    def __init__(self, tileCache: TileCache, maxConcurrency: int = DEFAULT_MAX_CONCURRENCY, retries: int = DEFAULT_RETRIES, backoff: float = DEFAULT_BACKOFF_IN_SECONDS):
+        """ Initialize the fetcher, the HTTP client is created on first use inside the running event loop.
+
+        Args:
+            tileCache (TileCache): Tile store to read from and fill.
+            maxConcurrency (int, optional): Most tile downloads in progress at once. Defaults to 4.
+            retries (int, optional): Extra attempts after a failed download. Defaults to 3.
+            backoff (float, optional): Seconds to wait before the first retry, doubled on each retry. Defaults to 0.25.
+        """
+        self.tileCache = tileCache
+        self.maxConcurrency = maxConcurrency
+        self.retries = retries
+        self.backoff = backoff
+
+        self.client = None
+        self.semaphore = None
+
+        # (layer, zoomLevel, x, y) to the task downloading that tile
+        self.inFlight = {}
+
+        self.stats = {"downloads": 0, "coalesced": 0, "retries": 0, "failures": 0}
+
+
+    def __str__(self):
+        return f"TileFetcher(maxConcurrency={self.maxConcurrency}, inFlight={len(self.inFlight)}, stats={self.stats})"
+
+
+    def open(self):
+        """ Create the pooled HTTP client if it does not exist yet.
+        """
+        if self.client is None:
+            limits = httpx.Limits(max_connections=self.maxConcurrency, max_keepalive_connections=self.maxConcurrency)
+            self.client = httpx.AsyncClient(limits=limits, headers={"User-Agent": USER_AGENT}, timeout=REQUEST_TIMEOUT_IN_SECONDS)
+            self.semaphore = asyncio.Semaphore(self.maxConcurrency)
+
+
+    async def close(self):
+        """ Close the HTTP client and its pooled connections.
+        """
+        if self.client is not None:
+            await self.client.aclose()
+            self.client = None
+
+
+    async def get_tile(self, zoomLevel: int, x: int, y: int, layer: str = "osm") -> bytes:
+        """ Get a tile image from the tile store, downloading or revalidating it when needed.
+
+        Args:
+            zoomLevel (int): The zoom level.
+            x (int): The x-coordinate of the tile.
+            y (int): The y-coordinate of the tile.
+            layer (str, optional): The tile layer. Defaults to "osm".
+
+        Returns:
+            bytes: The encoded tile image, or None if it is not stored and the tile server can not be reached.
+        """
+        # SQLite reads and commits run in a worker thread so a grid of tiles does not block the event loop
+        row = await asyncio.to_thread(self.tileCache.lookup, zoomLevel, x, y, layer)
+        if row is not None and self.tileCache.is_fresh(row[3]):
+            self.tileCache.count("hits")
+            return row[0]
+
+        if row is None:
+            self.tileCache.count("misses")
+
+        key = (layer, zoomLevel, x, y)
+        task = self.inFlight.get(key)
+        if task is None:
+            etag, lastModified = (row[1], row[2]) if row else (None, None)
+            task = asyncio.ensure_future(self.download(zoomLevel, x, y, layer, etag, lastModified))
+            self.inFlight[key] = task
+            task.add_done_callback(lambda _: self.inFlight.pop(key, None))
+        else:
+            self.stats["coalesced"] += 1
+
+        # Shield the shared task so one cancelled caller does not cancel the download for the others
+        data = await asyncio.shield(task)
+        if data is None and row is not None:
+            self.tileCache.count("staleServed")
+            return row[0]
+
+        return data
+
+
+    async def get_tiles(self, tiles: list, layer: str = "osm") -> list:
+        """ Get many tiles at once, like the 3x3 grid from SlippyMap.find_surrounding_tiles()
+
+        Args:
+            tiles (list): (zoomLevel, x, y) tile IDs.
+            layer (str, optional): The tile layer. Defaults to "osm".
+
+        Returns:
+            list: The tile images in the same order as tiles, None for tiles that could not be downloaded.
+        """
+        return await asyncio.gather(*(self.get_tile(zoomLevel, x, y, layer) for zoomLevel, x, y in tiles))
+
+
+    async def download(self, zoomLevel: int, x: int, y: int, layer: str, etag: str = None, lastModified: str = None) -> bytes:
+        """ Download (or revalidate) one tile with retries and store the reply in the tile store.
+
+        Args:
+            zoomLevel (int): The zoom level.
+            x (int): The x-coordinate of the tile.
+            y (int): The y-coordinate of the tile.
+            layer (str): The tile layer.
+            etag (str, optional): ETag of the stored copy. Defaults to None.
+            lastModified (str, optional): Last-Modified of the stored copy. Defaults to None.
+
+        Returns:
+            bytes: The tile image, or None if every attempt failed.
+        """
+        self.open()
+        url = self.tileCache.tileURL(zoomLevel, x, y, layer)
+
+        for attempt in range(self.retries + 1):
+            if attempt > 0:
+                self.stats["retries"] += 1
+                await asyncio.sleep(self.backoff * 2 ** (attempt - 1) * random.uniform(0.5, 1.5))
+
+            try:
+                async with self.semaphore:
+                    self.stats["downloads"] += 1
+                    response = await self.client.get(url, headers=conditional_headers(etag, lastModified))
+            except httpx.HTTPError as e:
+                print(f"Error downloading tile {layer}/{zoomLevel}/{x}/{y} (attempt {attempt + 1}): {e}")
+                continue
+
+            if response.status_code in RETRY_STATUS_CODES:
+                continue
+
+            return await asyncio.to_thread(self.tileCache.store_response, zoomLevel, x, y, layer, response.status_code, response.content, response.headers, bool(etag or lastModified))
+
+        self.stats["failures"] += 1
+
+        return None
+
+
+def add_tile_route(tileFetcher: TileFetcher):
+    """ Serve tiles through a TileFetcher on the NiceGUI server at the URLs built by TileCache.local_tile_URL()
+
+    Args:
+        tileFetcher (TileFetcher): The fetcher to serve tiles from.
+    """
+    from nicegui import app
+    from fastapi import Response
+
+    @app.get("/tiles/{layer}/{zoomLevel}/{x}/{y}.{ext}")
+    async def tile_route(layer: str, zoomLevel: int, x: int, y: int, ext: str):
+        data = await tileFetcher.get_tile(zoomLevel, x, y, layer)
+        if data is None:
+            return Response(status_code=404)
+
+        return Response(content=data, media_type=MEDIA_TYPES.get(ext, "application/octet-stream"),
+                        headers={"Cache-Control": "max-age=86400"})
+
+
+def start_stand_in_tile_server(latencyInSeconds: float = 0.0, failuresPerTile: int = 0):
+    """ Start a local HTTP stand-in for tile.openstreetmap.org on a free port
+
+    Args:
+        latencyInSeconds (float, optional): Delay before every reply to mimic a mobile connection. Defaults to 0.
+        failuresPerTile (int, optional): Number of 503 replies for each tile before it succeeds. Defaults to 0.
+
+    Returns:
+        tuple: (server, tileURL function, list of requested paths)
+    """
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+    import threading
+
+    requestLog = []
+
+    class StandInTileServer(BaseHTTPRequestHandler):
+
+        # Keep-alive, so pooled clients can reuse connections
+        protocol_version = "HTTP/1.1"
+
+        def do_GET(self):
+            requestLog.append(self.path)
+            time.sleep(latencyInSeconds)
+
+            if requestLog.count(self.path) <= failuresPerTile:
+                self.send_response(503)
+                self.send_header("Content-Length", "0")
+                self.end_headers()
+                return
+
+            body = self.path.encode() * 100
+            self.send_response(200)
+            self.send_header("Content-Type", "image/png")
+            self.send_header("Content-Length", str(len(body)))
+            self.send_header("ETag", f'"{self.path}"')
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    # The default listen backlog of 5 drops some of 9 simultaneous connects, which then retry after a second
+    class StandInServer(ThreadingHTTPServer):
+        request_queue_size = 64
+
+    server = StandInServer(("127.0.0.1", 0), StandInTileServer)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    port = server.server_address[1]
+
+    return server, lambda zoomLevel, x, y, layer: f"http://127.0.0.1:{port}/{layer}/{zoomLevel}/{x}/{y}.png", requestLog
+
+
+def benchmark(latencyInSeconds: float = 0.1):
+    """ Print the time to download a full 3x3 tile grid serially with requests.get() and with TileFetcher
+
+    Args:
+        latencyInSeconds (float, optional): Delay of the stand-in tile server for each tile. Defaults to 0.1.
+    """
+    import requests
+
+    server, tileURL, _ = start_stand_in_tile_server(latencyInSeconds)
+    tiles = [(16, 11772 + dx, 25701 + dy) for dx in [-1, 0, 1] for dy in [-1, 0, 1]]
+
+    start = time.perf_counter()
+    for zoomLevel, x, y in tiles:
+        requests.get(tileURL(zoomLevel, x, y, "osm"))
+    serialTime = time.perf_counter() - start
+
+    async def fetch_grid():
+        fetcher = TileFetcher(TileCache(tileURL, ":memory:"), maxConcurrency=9)
+        start = time.perf_counter()
+        await fetcher.get_tiles(tiles)
+        elapsed = time.perf_counter() - start
+        await fetcher.close()
+        return elapsed
+
+    concurrentTime = asyncio.run(fetch_grid())
+    server.shutdown()
+
+    print(f"Time to full 3x3 grid with {latencyInSeconds * 1000:.0f} ms tile latency: serial requests.get {serialTime * 1000:.0f} ms, TileFetcher {concurrentTime * 1000:.0f} ms")
+
+
+def unit_test():
+    server, tileURL, requestLog = start_stand_in_tile_server(0.05, failuresPerTile=1)
+
+    async def run_tests():
+        tileCache = TileCache(tileURL, ":memory:")
+        fetcher = TileFetcher(tileCache, maxConcurrency=2, backoff=0.01)
+
+        # Five callers of the same tile share one download, which succeeds on its retry
+        tiles = await asyncio.gather(*(fetcher.get_tile(10, 184, 401) for _ in range(5)))
+        assert tiles == [b"/osm/10/184/401.png" * 100] * 5
+        assert requestLog.count("/osm/10/184/401.png") == 2
+        assert fetcher.stats["coalesced"] == 4 and fetcher.stats["retries"] == 1
+        assert fetcher.inFlight == {}
+
+        # A stored tile needs no download at all
+        assert await fetcher.get_tile(10, 184, 401) == tiles[0] and len(requestLog) == 2
+
+        grid = await fetcher.get_tiles([(10, 184, 402), (10, 184, 403)])
+        assert grid == [b"/osm/10/184/402.png" * 100, b"/osm/10/184/403.png" * 100]
+        assert tileCache.lookup(10, 184, 403) is not None
+
+        await fetcher.close()
+
+    asyncio.run(run_tests())
+    server.shutdown()
+    print("All tests passed!")
+
+
+if __name__ == "__main__":
+    unit_test()
+    benchmark()
@@ -0,0 +1,346 @@
+#!/usr/bin/env python
+
+# Single implementation of the slippy-map tile formulas shared by SlippyMap.py and Risk.py
+# https://wiki.openstreetmap.org/wiki/Slippy_map_tilenames
+# https://en.wikipedia.org/wiki/Web_Mercator_projection
+#
+# Every scalar function has an *_array twin that takes NumPy arrays (or scalars) of points and
+# performs the exact same sequence of floating point operations, so a GPS track or thousands of
+# risk locations can be converted without a Python loop. NumPy and the C math library can differ in
+# the last bit of sinh/atan, so results are identical once rounded to GPS_DECIMAL_ROUNDING.
+
+import math
+
+# 3rd party libraries
+import numpy as np                  # pip install numpy
+
+TILE_SIZE = 256
+GPS_DECIMAL_ROUNDING = 6
+
+
+def num_of_tiles(zoomLevel: int) -> int:
+    """ Calculate the number of tiles at a given zoom level.
+        https://wiki.openstreetmap.org/wiki/Zoom_levels
+
+    Args:
+        zoomLevel (int): The zoom level between 0 - 19 using the OpenStreet Map (OSM) 'standard' style
+
+    Returns:
+        int: The number of tiles at the given zoom level.
+    """
+    return pow(2, zoomLevel)
+
+
+def sec(x: float) -> float:
+    """ Calculate the secant of an angle
+
+    Args:
+        x (float): The angle in radians.
+
+    Returns:
+        float: The secant of the angle.
+    """
+    return 1 / math.cos(x)
+
+
+def convert_mercatorY_to_latitude(mercatorY: float) -> float:
+    """ Convert a Mercator Y coordinate to a latitude.
+        https://en.wikipedia.org/wiki/Web_Mercator_projection
+
+    Args:
+        mercatorY (float): The Mercator Y coordinate.
+
+    Returns:
+        float: The latitude.
+    """
+    return math.degrees(math.atan(math.sinh(mercatorY)))
+
+
+def get_tile_fraction_XY(zoomLevel: int, lat: float, lon: float) -> tuple:
+    """ Calculate the fractional tile coordinates for a given latitude, longitude, and zoom level.
+
+    Args:
+        zoomLevel (int): The zoom level between 0 - 19 for using the OpenStreet Map (OSM) 'standard' style
+        lat (float): The latitude in degrees
+        lon (float): The longitude in degrees
+
+    Returns:
+        tuple: The fractional tile coordinates (x, y), the integer part is the tile and the remainder is the position inside it.
+    """
+    n = num_of_tiles(zoomLevel)
+    xOffset = (lon + 180) / 360
+    yOffset = (1 - math.log(math.tan(math.radians(lat)) + sec(math.radians(lat))) / math.pi) / 2
+
+    return (xOffset*n, yOffset*n)
+
+
+def get_tile_XY(zoomLevel: int, lat: float, lon: float) -> tuple:
+    """ Calculate the tile coordinates for a given latitude, longitude, and zoom level.
+
+    Args:
+        zoomLevel (int): The zoom level between 0 - 19 for using the OpenStreet Map (OSM) 'standard' style
+        lat (float): The latitude in degrees
+        lon (float): The longitude in degrees
+
+    Returns:
+        tuple: The tile coordinates (x, y), where (0,0) represents the top-left corner of the map.
+    """
+    x, y = get_tile_fraction_XY(zoomLevel, lat, lon)
+
+    return (int(x), int(y))
+
+
+def get_tile_pixel_XY(zoomLevel: int, lat: float, lon: float) -> tuple:
+    """ Calculate the tile coordinates and the pixel inside that tile for a given latitude, longitude, and zoom level.
+
+    Args:
+        zoomLevel (int): The zoom level between 0 - 19 for using the OpenStreet Map (OSM) 'standard' style
+        lat (float): The latitude in degrees
+        lon (float): The longitude in degrees
+
+    Returns:
+        tuple: (x, y, pixelX, pixelY) where pixelX and pixelY are between 0 and TILE_SIZE - 1 from the top-left corner of the tile.
+    """
+    x, y = get_tile_fraction_XY(zoomLevel, lat, lon)
+
+    # TILE_SIZE is a power of two so the multiplication is exact and the tile part matches get_tile_XY()
+    globalPixelX = int(x * TILE_SIZE)
+    globalPixelY = int(y * TILE_SIZE)
+
+    return (globalPixelX // TILE_SIZE, globalPixelY // TILE_SIZE, globalPixelX % TILE_SIZE, globalPixelY % TILE_SIZE)
+
+
+def convert_tile_XY_to_LatLon(zoomLevel: int, x: int, y: int, pixelX: float = 0, pixelY: float = 0, decimals: int = GPS_DECIMAL_ROUNDING) -> tuple:
+    """ Convert a tile X & Y values (plus an optional pixel inside the tile) to latitude and longitude
+        With the default pixel (0, 0) this is the upper left corner of the tile Bounding Box (Bbox)
+        https://quad.osm.lol/
+
+    Args:
+        zoomLevel (int): The zoom level.
+        x (int): The x-coordinate of the tile.
+        y (int): The y-coordinate of the tile.
+        pixelX (float, optional): Pixels right of the left tile edge. Defaults to 0.
+        pixelY (float, optional): Pixels down from the top tile edge. Defaults to 0.
+        decimals (int, optional): Decimal places to round to, or None for no rounding. Defaults to GPS_DECIMAL_ROUNDING.
+
+    Returns:
+        tuple: The latitude and longitude.
+    """
+    if x < 0 or y < 0:
+        raise ValueError("Both X and Y must be greater than 0")
+
+    n = num_of_tiles(zoomLevel)
+    upperLeftY = (y + pixelY / TILE_SIZE) / n
+    upperLeftX = (x + pixelX / TILE_SIZE) / n
+    lat = convert_mercatorY_to_latitude(math.pi * (1 - 2 * upperLeftY))
+    lon =  -180.0 + 360.0 * upperLeftX
+
+    if decimals is None:
+        return (lat, lon)
+
+    return (round(lat, decimals), round(lon, decimals))
+
+
+def lat_edges(zoomLevel: int, y: int) -> tuple:
+    """ Calculate the latitude edges of a tile at a given zoom level.
+
+    Args:
+        zoomLevel (int): The zoom level.
+        y (int): The y-coordinate of the tile.
+
+    Returns:
+        tuple: The latitude edges (lat1, lat2), where lat1 is the northern edge and lat2 is the southern edge.
+    """
+    n = num_of_tiles(zoomLevel)
+    unit = 1 / n
+    relY1 = y * unit
+    relY2 = relY1 + unit
+    lat1 = convert_mercatorY_to_latitude(math.pi * (1 - 2 * relY1))
+    lat2 = convert_mercatorY_to_latitude(math.pi * (1 - 2 * relY2))
+
+    return (lat1, lat2)
+
+
+def lon_edges(zoomLevel: int, x: int) -> tuple:
+    """ Calculate the longitude edges of a tile at a given zoom level.
+
+    Args:
+        zoomLevel (int): The zoom level.
+        x (int): The x-coordinate of the tile.
+
+    Returns:
+        tuple: The longitude edges (lon1, lon2), where lon1 is the western edge and lon2 is the eastern edge.
+    """
+    n = num_of_tiles(zoomLevel)
+    unit = 360 / n
+    lon1 = -180 + x * unit
+    lon2 = lon1 + unit
+
+    return (lon1, lon2)
+
+
+def tile_edges(zoomLevel: int, x:int , y:int) -> tuple:
+    """ Calculate the edges of a tile at a given zoom level.
+
+    Args:
+        zoomLevel (int): The zoom level.
+        x (int): The x-coordinate of the tile.
+        y (int): The y-coordinate of the tile.
+
+    Returns:
+        tuple: The edges of the tile (lat2, lon1, lat1, lon2), where lat2 is the southern edge, lon1 is the western edge, lat1 is the northern edge, and lon2 is the eastern edge.
+    """
+    lat1, lat2 = lat_edges(zoomLevel, y)
+    lon1, lon2 = lon_edges(zoomLevel, x)
+
+    return (lat2, lon1, lat1, lon2)
+
+
+def convert_mercatorY_to_latitude_array(mercatorY):
+    """ Vectorized convert_mercatorY_to_latitude()
+
+    Args:
+        mercatorY (numpy.ndarray): The Mercator Y coordinates.
+
+    Returns:
+        numpy.ndarray: The latitudes.
+    """
+    return np.degrees(np.arctan(np.sinh(mercatorY)))
+
+
+def get_tile_fraction_XY_array(zoomLevel, lat, lon) -> tuple:
+    """ Vectorized get_tile_fraction_XY()
+
+    Args:
+        zoomLevel (int | numpy.ndarray): The zoom level, either one for all points or one per point
+        lat (numpy.ndarray): The latitudes in degrees
+        lon (numpy.ndarray): The longitudes in degrees
+
+    Returns:
+        tuple: Arrays of fractional tile coordinates (x, y).
+    """
+    n = np.power(2.0, zoomLevel)
+    latRad = np.radians(np.asarray(lat, dtype=np.float64))
+    xOffset = (np.asarray(lon, dtype=np.float64) + 180) / 360
+    yOffset = (1 - np.log(np.tan(latRad) + 1 / np.cos(latRad)) / np.pi) / 2
+
+    return (xOffset*n, yOffset*n)
+
+
+def get_tile_XY_array(zoomLevel, lat, lon) -> tuple:
+    """ Vectorized get_tile_XY()
+
+    Args:
+        zoomLevel (int | numpy.ndarray): The zoom level, either one for all points or one per point
+        lat (numpy.ndarray): The latitudes in degrees
+        lon (numpy.ndarray): The longitudes in degrees
+
+    Returns:
+        tuple: int64 arrays of tile coordinates (x, y).
+    """
+    x, y = get_tile_fraction_XY_array(zoomLevel, lat, lon)
+
+    return (np.trunc(x).astype(np.int64), np.trunc(y).astype(np.int64))
+
+
+def get_tile_pixel_XY_array(zoomLevel, lat, lon) -> tuple:
+    """ Vectorized get_tile_pixel_XY()
+
+    Args:
+        zoomLevel (int | numpy.ndarray): The zoom level, either one for all points or one per point
+        lat (numpy.ndarray): The latitudes in degrees
+        lon (numpy.ndarray): The longitudes in degrees
+
+    Returns:
+        tuple: int64 arrays (x, y, pixelX, pixelY).
+    """
+    x, y = get_tile_fraction_XY_array(zoomLevel, lat, lon)
+    globalPixelX = np.trunc(x * TILE_SIZE).astype(np.int64)
+    globalPixelY = np.trunc(y * TILE_SIZE).astype(np.int64)
+
+    return (globalPixelX // TILE_SIZE, globalPixelY // TILE_SIZE, globalPixelX % TILE_SIZE, globalPixelY % TILE_SIZE)
+
+
+def convert_tile_XY_to_LatLon_array(zoomLevel, x, y, pixelX=0, pixelY=0, decimals: int = GPS_DECIMAL_ROUNDING) -> tuple:
+    """ Vectorized convert_tile_XY_to_LatLon()
+
+    Args:
+        zoomLevel (int | numpy.ndarray): The zoom level, either one for all tiles or one per tile
+        x (numpy.ndarray): The x-coordinates of the tiles.
+        y (numpy.ndarray): The y-coordinates of the tiles.
+        pixelX (numpy.ndarray, optional): Pixels right of the left tile edges. Defaults to 0.
+        pixelY (numpy.ndarray, optional): Pixels down from the top tile edges. Defaults to 0.
+        decimals (int, optional): Decimal places to round to, or None for no rounding. Defaults to GPS_DECIMAL_ROUNDING.
+
+    Returns:
+        tuple: Arrays of latitudes and longitudes.
+    """
+    x = np.asarray(x)
+    y = np.asarray(y)
+    if np.any(x < 0) or np.any(y < 0):
+        raise ValueError("Both X and Y must be greater than 0")
+
+    n = np.power(2.0, zoomLevel)
+    upperLeftY = (y + np.asarray(pixelY, dtype=np.float64) / TILE_SIZE) / n
+    upperLeftX = (x + np.asarray(pixelX, dtype=np.float64) / TILE_SIZE) / n
+    lat = convert_mercatorY_to_latitude_array(np.pi * (1 - 2 * upperLeftY))
+    lon = -180.0 + 360.0 * upperLeftX
+
+    if decimals is None:
+        return (lat, lon)
+
+    return (np.round(lat, decimals), np.round(lon, decimals))
+
+
+def tile_edges_array(zoomLevel, x, y) -> tuple:
+    """ Vectorized tile_edges()
+
+    Args:
+        zoomLevel (int | numpy.ndarray): The zoom level, either one for all tiles or one per tile
+        x (numpy.ndarray): The x-coordinates of the tiles.
+        y (numpy.ndarray): The y-coordinates of the tiles.
+
+    Returns:
+        tuple: Arrays of tile edges (south, west, north, east) in the same order as tile_edges().
+    """
+    n = np.power(2.0, zoomLevel)
+    unit = 1 / n
+    relY1 = np.asarray(y) * unit
+    relY2 = relY1 + unit
+    north = convert_mercatorY_to_latitude_array(np.pi * (1 - 2 * relY1))
+    south = convert_mercatorY_to_latitude_array(np.pi * (1 - 2 * relY2))
+
+    lonUnit = 360 / n
+    west = -180 + np.asarray(x) * lonUnit
+    east = west + lonUnit
+
+    return (south, west, north, east)
+
+
+def unit_test():
+    assert convert_tile_XY_to_LatLon(4, 7, 5) == (55.776573, -22.500000)
+    assert convert_tile_XY_to_LatLon(10, 184, 401) == (36.315125, -115.312500)
+    assert get_tile_XY(10, 36.159334, -115.152807) == (184, 401)
+    assert get_tile_pixel_XY(10, 36.159334, -115.152807)[:2] == (184, 401)
+
+    rng = np.random.default_rng(42)
+    lat = np.round(rng.uniform(-85.0, 85.0, 2000), GPS_DECIMAL_ROUNDING)
+    lon = np.round(rng.uniform(-180.0, 179.999999, 2000), GPS_DECIMAL_ROUNDING)
+    for zoomLevel in range(0, 20):
+        x, y, pixelX, pixelY = get_tile_pixel_XY_array(zoomLevel, lat, lon)
+        xTile, yTile = get_tile_XY_array(zoomLevel, lat, lon)
+        assert np.array_equal(x, xTile) and np.array_equal(y, yTile)
+
+        south, west, north, east = tile_edges_array(zoomLevel, x, y)
+        latArray, lonArray = convert_tile_XY_to_LatLon_array(zoomLevel, x, y, pixelX, pixelY)
+        for i in range(0, len(lat), 97):
+            assert get_tile_pixel_XY(zoomLevel, lat[i], lon[i]) == (x[i], y[i], pixelX[i], pixelY[i])
+            edges = np.round((south[i], west[i], north[i], east[i]), GPS_DECIMAL_ROUNDING)
+            assert tuple(round(edge, GPS_DECIMAL_ROUNDING) for edge in tile_edges(zoomLevel, int(x[i]), int(y[i]))) == tuple(edges)
+            assert convert_tile_XY_to_LatLon(zoomLevel, int(x[i]), int(y[i]), int(pixelX[i]), int(pixelY[i])) == (latArray[i], lonArray[i])
+
+    print("All tests passed!")
+
+
+if __name__ == "__main__":
+    unit_test()
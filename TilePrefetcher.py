@@ -0,0 +1,352 @@
+#!/usr/bin/env python
+
+# Warms the tile store with the tiles the rider will need next
+# https://en.wikipedia.org/wiki/Dead_reckoning
+# https://www.movable-type.co.uk/scripts/latlong.html
+#
+# From the current position, heading and speed (or a planned route) the path over the next
+# horizonInSeconds is sampled every half tile, and the 3x3 view around each sample is queued at the
+# current zoom level and its neighbours. A priority queue downloads the tiles needed soonest first,
+# with tiles at other zoom levels pushed back by ZOOM_CHANGE_PENALTY_IN_SECONDS. Entries hold the
+# clock time the tile is needed, so tiles queued on different GPS fixes compare fairly, and tiles the
+# rider passed more than MAX_LATENESS_IN_SECONDS ago are dropped instead of downloaded.
+
+# Standard library imports not needing pip installs
+import asyncio
+import math
+import time
+
+# Internal libraries
+from TileMath import get_tile_XY
+from GeoMath import haversine_distance, initial_bearing, destination_point
+from TileFetcher import TileFetcher
+
+EARTH_CIRCUMFERENCE_IN_METERS = 40075016.686
+DEFAULT_HORIZON_IN_SECONDS = 60
+DEFAULT_WORKERS = 2
+ZOOM_CHANGE_PENALTY_IN_SECONDS = 30
+MAX_ZOOM_LEVEL = 19
+
+# A tile still queued this long after it was needed is no longer worth downloading
+MAX_LATENESS_IN_SECONDS = 5
+
+# Tiles already queued are remembered to stop every GPS fix queueing them again, until this many
+MAX_REMEMBERED_TILES = 4096
+
+
+class TilePrefetcher:
+
+    def __init__(self, tileFetcher: TileFetcher, horizonInSeconds: float = DEFAULT_HORIZON_IN_SECONDS, zoomSpread: int = 1, workers: int = DEFAULT_WORKERS, clock=time.monotonic):
+        """ Initialize the prefetcher, call start() from inside the running event loop to begin downloading.
+
+        Args:
+            tileFetcher (TileFetcher): Downloads tiles into the tile store.
+            horizonInSeconds (float, optional): How far ahead in time to prefetch. Defaults to 60.
+            zoomSpread (int, optional): Zoom levels above and below the current one to prefetch. Defaults to 1.
+            workers (int, optional): Number of tiles downloaded at once by the prefetcher. Defaults to 2.
+            clock (callable, optional): Seconds counter for the deadlines, replaceable for tests. Defaults to time.monotonic.
+        """
+        self.tileFetcher = tileFetcher
+        self.horizonInSeconds = horizonInSeconds
+        self.zoomSpread = zoomSpread
+        self.workers = workers
+        self.clock = clock
+
+        # Entries are (deadline, order, (layer, zoomLevel, x, y)) with the clock time the tile is needed, order keeps equal deadlines first in first out
+        self.queue = asyncio.PriorityQueue()
+        self.order = 0
+        self.rememberedTiles = set()
+        self.workerTasks = []
+
+        self.stats = {"queued": 0, "fetched": 0, "failed": 0, "expired": 0}
+
+
+    def __str__(self):
+        return f"TilePrefetcher(horizonInSeconds={self.horizonInSeconds}, queueSize={self.queue.qsize()}, stats={self.stats})"
+
+
+    def start(self):
+        """ Start the background download workers, for example with nicegui.app.on_startup(tilePrefetcher.start)
+        """
+        if not self.workerTasks:
+            self.workerTasks = [asyncio.create_task(self.worker()) for _ in range(self.workers)]
+
+
+    async def stop(self):
+        """ Cancel the background download workers.
+        """
+        for task in self.workerTasks:
+            task.cancel()
+        await asyncio.gather(*self.workerTasks, return_exceptions=True)
+        self.workerTasks = []
+
+
+    async def worker(self):
+        """ Download queued tiles forever, soonest needed first.
+        """
+        while True:
+            deadline, _, (layer, zoomLevel, x, y) = await self.queue.get()
+            try:
+                # The rider is past this tile, forget it so it can be queued again if the route comes back here
+                if self.clock() > deadline + MAX_LATENESS_IN_SECONDS:
+                    self.stats["expired"] += 1
+                    self.rememberedTiles.discard((layer, zoomLevel, x, y))
+                    continue
+
+                data = await self.tileFetcher.get_tile(zoomLevel, x, y, layer)
+                self.stats["fetched" if data is not None else "failed"] += 1
+
+                # Forget a failed tile so the next GPS fix queues it again once the connection is back
+                if data is None:
+                    self.rememberedTiles.discard((layer, zoomLevel, x, y))
+            finally:
+                self.queue.task_done()
+
+
+    def prefetch_heading(self, lat: float, lon: float, headingDegrees: float, speedInMetersPerSecond: float, zoomLevel: int, layer: str = "osm") -> int:
+        """ Queue the tiles along a straight line from the current position.
+
+        Args:
+            lat (float): The latitude in degrees
+            lon (float): The longitude in degrees
+            headingDegrees (float): Direction of travel, clockwise from north.
+            speedInMetersPerSecond (float): Speed of the rider.
+            zoomLevel (int): The zoom level shown on the map.
+            layer (str, optional): The tile layer. Defaults to "osm".
+
+        Returns:
+            int: Number of tiles newly queued.
+        """
+        path = [(0.0, lat, lon)]
+        step = sample_spacing(lat, zoomLevel)
+        distance = speedInMetersPerSecond * self.horizonInSeconds
+        travelled = step
+        while travelled <= distance:
+            pointLat, pointLon = destination_point(lat, lon, headingDegrees, travelled)
+            path.append((travelled / speedInMetersPerSecond, pointLat, pointLon))
+            travelled += step
+
+        return self.queue_path(path, zoomLevel, layer)
+
+
+    def prefetch_route(self, route: list, lat: float, lon: float, speedInMetersPerSecond: float, zoomLevel: int, layer: str = "osm") -> int:
+        """ Queue the tiles along a planned route, like one from BikeAutoPilot, starting at the route point nearest to the rider.
+
+        Args:
+            route (list): (lat, lon) points of the route.
+            lat (float): The latitude of the rider in degrees
+            lon (float): The longitude of the rider in degrees
+            speedInMetersPerSecond (float): Speed of the rider.
+            zoomLevel (int): The zoom level shown on the map.
+            layer (str, optional): The tile layer. Defaults to "osm".
+
+        Returns:
+            int: Number of tiles newly queued.
+        """
+        if not route:
+            return 0
+
+        speed = max(speedInMetersPerSecond, 0.1)
+        distance = speed * self.horizonInSeconds
+        step = sample_spacing(lat, zoomLevel)
+        nearest = min(range(len(route)), key=lambda i: haversine_distance(lat, lon, *route[i]))
+
+        path = [(0.0, lat, lon)]
+        travelled = 0.0
+        previousLat, previousLon = lat, lon
+        for pointLat, pointLon in route[nearest:]:
+            legLength = haversine_distance(previousLat, previousLon, pointLat, pointLon)
+            bearing = initial_bearing(previousLat, previousLon, pointLat, pointLon)
+            along = step
+            while along < legLength and travelled + along <= distance:
+                sampleLat, sampleLon = destination_point(previousLat, previousLon, bearing, along)
+                path.append(((travelled + along) / speed, sampleLat, sampleLon))
+                along += step
+
+            travelled += legLength
+            if travelled > distance:
+                break
+            path.append((travelled / speed, pointLat, pointLon))
+            previousLat, previousLon = pointLat, pointLon
+
+        return self.queue_path(path, zoomLevel, layer)
+
+
+    def prefetch_zoom(self, lat: float, lon: float, zoomLevel: int, layer: str = "osm") -> int:
+        """ Queue the 3x3 views one zoom level out and in, so the next ZOOM IN or ZOOM OUT click is served locally.
+
+        Args:
+            lat (float): The latitude of the map center in degrees
+            lon (float): The longitude of the map center in degrees
+            zoomLevel (int): The zoom level shown on the map.
+            layer (str, optional): The tile layer. Defaults to "osm".
+
+        Returns:
+            int: Number of tiles newly queued.
+        """
+        queued = 0
+        for zoom in (zoomLevel - 1, zoomLevel + 1):
+            if 0 <= zoom <= MAX_ZOOM_LEVEL:
+                for tile in view_tiles(lat, lon, zoom):
+                    queued += self.queue_tile(tile, 0.0, layer)
+
+        return queued
+
+
+    def queue_path(self, path: list, zoomLevel: int, layer: str) -> int:
+        """ Queue the 3x3 view around every point of a sampled path at the current and adjacent zoom levels.
+
+        Args:
+            path (list): (secondsUntilThere, lat, lon) samples in travel order.
+            zoomLevel (int): The zoom level shown on the map.
+            layer (str): The tile layer.
+
+        Returns:
+            int: Number of tiles newly queued.
+        """
+        queued = 0
+        for secondsUntilThere, lat, lon in path:
+            for zoom in range(max(0, zoomLevel - self.zoomSpread), min(MAX_ZOOM_LEVEL, zoomLevel + self.zoomSpread) + 1):
+                priority = secondsUntilThere + abs(zoom - zoomLevel) * ZOOM_CHANGE_PENALTY_IN_SECONDS
+                for tile in view_tiles(lat, lon, zoom):
+                    queued += self.queue_tile(tile, priority, layer)
+
+        return queued
+
+
+    def queue_tile(self, tile: tuple, priority: float, layer: str) -> int:
+        """ Queue one tile unless it was queued before.
+
+        Args:
+            tile (tuple): (zoomLevel, x, y) tile ID.
+            priority (float): Seconds from now until the tile is needed, lower is downloaded first.
+            layer (str): The tile layer.
+
+        Returns:
+            int: 1 if the tile was queued, 0 otherwise.
+        """
+        key = (layer, *tile)
+        if key in self.rememberedTiles:
+            return 0
+
+        if len(self.rememberedTiles) >= MAX_REMEMBERED_TILES:
+            self.rememberedTiles.clear()
+
+        self.rememberedTiles.add(key)
+        self.order += 1
+        self.queue.put_nowait((self.clock() + priority, self.order, key))
+        self.stats["queued"] += 1
+
+        return 1
+
+
+def view_tiles(lat: float, lon: float, zoomLevel: int) -> list:
+    """ The 3x3 tiles shown by SlippyMap around a point, without tiles above or below the map
+
+    Args:
+        lat (float): The latitude in degrees
+        lon (float): The longitude in degrees
+        zoomLevel (int): The zoom level.
+
+    Returns:
+        list: (zoomLevel, x, y) tile IDs.
+    """
+    x, y = get_tile_XY(zoomLevel, lat, lon)
+    n = 1 << zoomLevel
+
+    tiles = []
+    for dx in [-1, 0, 1]:
+        for dy in [-1, 0, 1]:
+            tile = (zoomLevel, (x + dx) % n, y + dy)
+            if 0 <= tile[2] < n and tile not in tiles:
+                tiles.append(tile)
+
+    return tiles
+
+
+def sample_spacing(lat: float, zoomLevel: int) -> float:
+    """ Half the width of a tile in meters, so no tile along a path is skipped
+
+    Args:
+        lat (float): The latitude in degrees
+        zoomLevel (int): The zoom level.
+
+    Returns:
+        float: Distance between path samples in meters.
+    """
+    return EARTH_CIRCUMFERENCE_IN_METERS * math.cos(math.radians(lat)) / (1 << zoomLevel) / 2
+
+
+def unit_test():
+    from TileCache import TileCache
+    from TileFetcher import start_stand_in_tile_server
+
+    server, tileURL, requestLog = start_stand_in_tile_server()
+
+    async def run_tests():
+        now = [0.0]
+        prefetcher = TilePrefetcher(TileFetcher(TileCache(tileURL, ":memory:")), horizonInSeconds=60, zoomSpread=0, clock=lambda: now[0])
+
+        # 10 m/s east for 60 s at zoom 16 is 600 m, a bit more than one 495 m wide tile
+        queued = prefetcher.prefetch_heading(36.159334, -115.152807, 90, 10, 16)
+        entries = sorted(prefetcher.queue._queue)
+        x, y = get_tile_XY(16, 36.159334, -115.152807)
+        assert entries[0][0] == 0.0 and {key[2] for _, _, key in entries} == {x - 1, x, x + 1, x + 2}
+        assert {key[3] for _, _, key in entries} == {y - 1, y, y + 1} and queued == 12
+        assert min(priority for priority, _, key in entries if key[2] == x + 2) > 0
+
+        # Tiles are only queued once, whatever the next GPS fix
+        assert prefetcher.prefetch_heading(36.159334, -115.152807, 90, 10, 16) == 0
+
+        route = [(36.159334, -115.152807), (36.162, -115.152807), (36.165, -115.150)]
+        assert prefetcher.prefetch_route(route, 36.159334, -115.152807, 10, 16) > 0
+        # The whole 3x3 views one zoom level out and in
+        assert prefetcher.prefetch_zoom(36.159334, -115.152807, 16) == 9 + 9
+        assert {key[1] for _, _, key in prefetcher.queue._queue} == {15, 16, 17}
+
+        # Deadlines are clock times, so a tile queued later for sooner is downloaded first
+        now[0] = 50.0
+        prefetcher.queue_tile((16, x + 5, y), 1.0, "osm")
+        assert min(prefetcher.queue._queue)[2] != ("osm", 16, x + 5, y)
+        now[0] = 100.0
+        prefetcher.queue_tile((16, x + 6, y), 1.0, "osm")
+        assert min(prefetcher.queue._queue)[0] < 100.0
+
+        # At 100 s the rider passed every tile but the last one, those are dropped and forgotten
+        prefetcher.start()
+        await prefetcher.queue.join()
+        await prefetcher.stop()
+        assert prefetcher.stats["fetched"] == len(requestLog) == 1 and prefetcher.stats["expired"] == prefetcher.stats["queued"] - 1
+        assert prefetcher.rememberedTiles == {("osm", 16, x + 6, y)}
+        assert prefetcher.tileFetcher.tileCache.lookup(16, x + 6, y) is not None
+
+        # Tiles needed soon are all downloaded
+        assert prefetcher.prefetch_heading(36.159334, -115.152807, 90, 10, 16) == 12
+        prefetcher.start()
+        await prefetcher.queue.join()
+        await prefetcher.stop()
+        assert prefetcher.stats["fetched"] == len(requestLog) == 13
+        assert prefetcher.tileFetcher.tileCache.lookup(16, x + 2, y) is not None
+        await prefetcher.tileFetcher.close()
+
+        # A tile that failed to download is queued again by the next GPS fix
+        flakyPrefetcher = TilePrefetcher(TileFetcher(TileCache(flakyTileURL, ":memory:"), retries=0), zoomSpread=0, workers=1)
+        assert flakyPrefetcher.queue_path([(0.0, 36.159334, -115.152807)], 16, "osm") == 9
+        flakyPrefetcher.start()
+        await flakyPrefetcher.queue.join()
+        assert flakyPrefetcher.stats["failed"] == 9 and not flakyPrefetcher.rememberedTiles
+        assert flakyPrefetcher.queue_path([(0.0, 36.159334, -115.152807)], 16, "osm") == 9
+        await flakyPrefetcher.queue.join()
+        await flakyPrefetcher.stop()
+        assert flakyPrefetcher.stats["fetched"] == 9 and len(flakyPrefetcher.rememberedTiles) == 9
+        await flakyPrefetcher.tileFetcher.close()
+
+    flakyServer, flakyTileURL, _ = start_stand_in_tile_server(failuresPerTile=1)
+    asyncio.run(run_tests())
+    server.shutdown()
+    flakyServer.shutdown()
+    print("All tests passed!")
+
+
+if __name__ == "__main__":
+    unit_test()